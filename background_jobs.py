@@ -0,0 +1,104 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from perf_metrics import count
+
+# Long-running work (GitHub sync and saves) runs on one shared pool instead of
+# the Streamlit script thread, so a slow API never freezes a page. Jobs are
+# keyed: submitting a key that is already queued or running returns the
+# existing job, so two users pressing Sync share one. Jobs report progress and
+# poll cancelled(), which also turns true once the job's deadline passes; a
+# finished job stays visible for JOB_RETENTION_SECONDS so every session that
+# was waiting on it sees the result.
+JOB_WORKERS = 4
+JOB_TIMEOUT_SECONDS = 600.0
+JOB_RETENTION_SECONDS = 300.0
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="background-jobs")
+_jobs_lock = threading.Lock()
+_jobs = {}
+
+
+class Job:
+    def __init__(self, key: str, timeout: float):
+        self.key = key
+        self.status = "queued"
+        self.done = 0
+        self.total = 0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.finished = None
+        self.deadline = self.submitted + timeout
+        self._cancel = threading.Event()
+
+    def report(self, done: int, total: int, message: str | None = None):
+        self.done = done
+        self.total = total
+        if message is not None:
+            self.message = message
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set() or time.monotonic() > self.deadline
+
+    def active(self) -> bool:
+        return self.status in {"queued", "running"}
+
+    def fraction(self) -> float:
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+
+def _stopped_status(job: Job) -> str:
+    return "cancelled" if job._cancel.is_set() else "timed_out"
+
+
+def _run(job: Job, func, args):
+    if job.cancelled():
+        job.status = _stopped_status(job)
+    else:
+        job.status = "running"
+        try:
+            job.result = func(job, *args)
+            job.status = _stopped_status(job) if job.cancelled() else "done"
+        except Exception as exc:
+            job.error = f"{type(exc).__name__}: {exc}"
+            job.status = "failed"
+    job.finished = time.monotonic()
+    count(f"jobs.{job.status}")
+
+
+def _prune_locked(now: float):
+    for key in [key for key, job in _jobs.items() if job.finished is not None and now - job.finished > JOB_RETENTION_SECONDS]:
+        del _jobs[key]
+
+
+def submit_job(key: str, func, *args, timeout: float = JOB_TIMEOUT_SECONDS) -> Job:
+    # func(job, *args) runs on the pool; it should call job.report() as it
+    # goes and return early once job.cancelled() is true.
+    with _jobs_lock:
+        _prune_locked(time.monotonic())
+        job = _jobs.get(key)
+        if job is not None and job.active():
+            count("jobs.deduplicated")
+            return job
+        job = _jobs[key] = Job(key, timeout)
+    _executor.submit(_run, job, func, args)
+    return job
+
+
+def get_job(key: str) -> Job | None:
+    with _jobs_lock:
+        return _jobs.get(key)
+
+
+def cancel_job(key: str) -> bool:
+    job = get_job(key)
+    if job is None or not job.active():
+        return False
+    job.cancel()
+    return True
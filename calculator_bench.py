@@ -0,0 +1,356 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import calculator_engine
+import perf_metrics
+from calculator_engine import (
+    build_decision_tree_graph,
+    build_label_maps,
+    compute_scores,
+    evaluate_rules,
+    evaluate_score_recommendation,
+    load_calculators,
+    load_catalog,
+)
+
+# Micro-benchmarks for the engine behind tr_app, run against the shipped
+# calculators and deterministic synthetic ones. Each case reports the median
+# time per call over several rounds; results are compared with a JSON baseline
+# and any case slower than the baseline by more than the threshold fails the
+# run. Everything runs locally; nothing here touches the network.
+BENCH_BASELINE_FILE = "bench_baseline.json"
+BENCH_THRESHOLD = 0.25
+# Differences below this many seconds per call are treated as timer noise.
+BENCH_NOISE_FLOOR = 5e-6
+BENCH_ROUNDS = 7
+BENCH_ROUND_SECONDS = 0.05
+BENCH_SEED = 20240501
+# (rules, inputs) for the synthetic calculators.
+SYNTHETIC_SIZES = ((10, 5), (100, 50), (1000, 200))
+CATALOG_TREE_SIZE = 10_000
+VALUE_SETS = 64
+
+_FORMAT = 1
+
+
+def synthetic_calculator(rng: random.Random, n_rules: int, n_inputs: int, n_options: int = 4) -> dict:
+    # A schema-valid calculator with mixed AND/OR joins and not_equals
+    # conditions; the same seed always produces the same calculator.
+    inputs = [
+        {
+            "id": f"input_{i}",
+            "label": f"Input {i}",
+            "type": "select",
+            "options": [f"option {j}" for j in range(n_options)],
+        }
+        for i in range(n_inputs)
+    ]
+    rules = []
+    for ridx in range(n_rules):
+        conditions = []
+        for cidx in range(rng.randint(1, 6)):
+            cond = {"input_id": f"input_{rng.randrange(n_inputs)}", "value": f"option {rng.randrange(n_options)}"}
+            if rng.random() < 0.25:
+                cond["op"] = "not_equals"
+            if cidx:
+                cond["join_with_previous"] = rng.choice(("AND", "AND", "OR"))
+            conditions.append(cond)
+        rule = {
+            "name": f"Rule {ridx}",
+            "level": rng.choice(("success", "info", "warning", "error")),
+            "message": f"Recommendation {ridx}",
+            "conditions": conditions,
+        }
+        if rng.random() < 0.2:
+            rule["condition_operator"] = "OR"
+        rules.append(rule)
+    scoring_rules = []
+    for i in range(n_inputs):
+        favor, against = rng.sample(range(n_options), 2)
+        scoring_rules.append(
+            {
+                "input_id": f"input_{i}",
+                "favor_values": [f"option {favor}"],
+                "against_values": [f"option {against}"],
+                "weight": rng.choice((1, 1, 2, 3)),
+            }
+        )
+    recommendations = [
+        {
+            "min_score": min_score,
+            "level": "info",
+            "message": f"Score at least {min_score}",
+            "conditions": [
+                {"input_id": f"input_{rng.randrange(n_inputs)}", "value": f"option {rng.randrange(n_options)}"}
+                for _ in range(rng.randint(0, 2))
+            ],
+        }
+        for min_score in (-4, -2, 0, 2, 4, 8)
+    ]
+    return {
+        "name": f"Synthetic {n_rules} rules x {n_inputs} inputs",
+        "description": "Generated for benchmarking.",
+        "inputs": inputs,
+        "rules": rules,
+        "scoring_mode": "signed",
+        "scoring_rules": scoring_rules,
+        "scoring_recommendations": recommendations,
+        "fallback": {"level": "info", "message": "No rule matched."},
+    }
+
+
+def random_values(tool: dict, rng: random.Random) -> dict:
+    values = {}
+    for item in tool.get("inputs", []):
+        input_type = item.get("type", "select")
+        if input_type == "select":
+            values[item.get("id")] = rng.choice(item.get("options") or [""])
+        elif input_type == "number":
+            values[item.get("id")] = float(rng.randint(0, 100))
+        else:
+            values[item.get("id")] = ""
+    return values
+
+
+def write_catalog_tree(root: str, count: int, seed: int = BENCH_SEED):
+    # Spreads small synthetic calculators over category/subcategory folders.
+    rng = random.Random(seed)
+    for n in range(count):
+        folder = os.path.join(root, f"Category {n % 10}", f"Subcategory {n // 10 % 10}")
+        os.makedirs(folder, exist_ok=True)
+        tool = synthetic_calculator(rng, rng.randint(5, 40), rng.randint(3, 15))
+        tool["name"] = f"Calculator {n}"
+        with open(os.path.join(folder, f"calculator_{n}.json"), "w", encoding="utf-8") as f:
+            json.dump(tool, f)
+
+
+def measure(func, setup=None, rounds: int = BENCH_ROUNDS, round_seconds: float = BENCH_ROUND_SECONDS) -> dict:
+    # Calls func repeatedly in each round until round_seconds have passed and
+    # records the mean time per call; setup runs untimed before every call.
+    per_call = []
+    calls = 0
+    for _ in range(rounds):
+        spent = 0.0
+        round_calls = 0
+        while spent < round_seconds or not round_calls:
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            func()
+            spent += time.perf_counter() - started
+            round_calls += 1
+        per_call.append(spent / round_calls)
+        calls += round_calls
+    return {"median": statistics.median(per_call), "min": min(per_call), "calls": calls}
+
+
+def _clear_graph_templates():
+    with calculator_engine._GRAPH_TEMPLATES_LOCK:
+        calculator_engine._GRAPH_TEMPLATES.clear()
+
+
+def calculator_cases(label: str, tool: dict, seed: int = BENCH_SEED) -> list:
+    rng = random.Random(seed)
+    value_sets = [random_values(tool, rng) for _ in range(VALUE_SETS)]
+    next_values = itertools.cycle(value_sets).__next__
+    inputs = tool.get("inputs", [])
+    id_to_label = build_label_maps(inputs)
+    cases = [
+        (f"{label}/evaluate_rules", lambda: evaluate_rules(tool, next_values()), None),
+        (f"{label}/build_label_maps", lambda: build_label_maps(inputs), None),
+        (f"{label}/build_decision_tree_graph", lambda: build_decision_tree_graph(tool, id_to_label, next_values()), None),
+        (
+            f"{label}/build_decision_tree_graph/cold",
+            lambda: build_decision_tree_graph(tool, id_to_label, next_values()),
+            _clear_graph_templates,
+        ),
+        (
+            f"{label}/build_decision_tree_graph/collapsed",
+            lambda: build_decision_tree_graph(tool, id_to_label, next_values(), collapsed=True),
+            None,
+        ),
+    ]
+    if tool.get("scoring_rules"):
+        totals = itertools.cycle([(values, compute_scores(tool, values)[2]) for values in value_sets]).__next__
+
+        def recommend():
+            values, total = totals()
+            evaluate_score_recommendation(tool, values, total)
+
+        cases.append((f"{label}/compute_scores", lambda: compute_scores(tool, next_values()), None))
+        cases.append((f"{label}/evaluate_score_recommendation", recommend, None))
+    return cases
+
+
+def _reset_registry(root: str, drop_index: bool = False):
+    if drop_index:
+        try:
+            os.remove(os.path.join(root, calculator_engine.CATALOG_INDEX_NAME))
+        except OSError:
+            pass
+    calculator_engine.set_calculators_dir(root)
+
+
+def _use_root(root: str):
+    if calculator_engine.CALCULATORS_DIR != root:
+        calculator_engine.set_calculators_dir(root)
+
+
+def catalog_cases(label: str, root: str) -> list:
+    return [
+        (f"{label}/load_catalog/first_scan", load_catalog, lambda: _reset_registry(root, drop_index=True)),
+        (f"{label}/load_catalog/restart", load_catalog, lambda: _reset_registry(root)),
+        (f"{label}/load_catalog/warm", load_catalog, lambda: _use_root(root)),
+        # Full records beyond CALCULATOR_CACHE_SIZE are re-read on every call.
+        (f"{label}/load_calculators", load_calculators, lambda: _use_root(root)),
+    ]
+
+
+def run_cases(cases: list, pattern: str | None, rounds: int, round_seconds: float, report=None) -> dict:
+    results = {}
+    for name, func, setup in cases:
+        if pattern and pattern not in name:
+            continue
+        if setup is not None:
+            setup()
+        func()
+        results[name] = measure(func, setup, rounds, round_seconds)
+        if report is not None:
+            report(name, results[name])
+    return results
+
+
+def run_benchmarks(
+    shipped_root: str,
+    pattern: str | None = None,
+    rounds: int = BENCH_ROUNDS,
+    round_seconds: float = BENCH_ROUND_SECONDS,
+    catalog_size: int = CATALOG_TREE_SIZE,
+    report=None,
+) -> dict:
+    perf_enabled = perf_metrics.is_enabled()
+    perf_metrics.set_enabled(False)
+    results = {}
+    try:
+        results.update(run_cases(catalog_cases("shipped", shipped_root), pattern, rounds, round_seconds, report))
+        calculator_engine.set_calculators_dir(shipped_root)
+        for calc in load_calculators():
+            cases = calculator_cases(f"shipped/{calc['id']}", calc["data"])
+            results.update(run_cases(cases, pattern, rounds, round_seconds, report))
+        for n_rules, n_inputs in SYNTHETIC_SIZES:
+            tool = synthetic_calculator(random.Random(BENCH_SEED + n_rules), n_rules, n_inputs)
+            cases = calculator_cases(f"synthetic/{n_rules}x{n_inputs}", tool)
+            results.update(run_cases(cases, pattern, rounds, round_seconds, report))
+        label = f"catalog_{catalog_size}"
+        if catalog_size and (not pattern or any(pattern in name for name, _func, _setup in catalog_cases(label, ""))):
+            tree = tempfile.mkdtemp(prefix="calculator-bench-")
+            try:
+                write_catalog_tree(tree, catalog_size)
+                results.update(run_cases(catalog_cases(label, tree), pattern, rounds, round_seconds, report))
+            finally:
+                shutil.rmtree(tree, ignore_errors=True)
+    finally:
+        calculator_engine.set_calculators_dir(shipped_root)
+        perf_metrics.set_enabled(perf_enabled)
+    return results
+
+
+def environment() -> dict:
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(), "machine": platform.machine(), "system": platform.system()}
+
+
+def read_baseline(path: str) -> dict | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(baseline, dict) or baseline.get("format") != _FORMAT:
+        return None
+    return baseline
+
+
+def write_baseline(path: str, results: dict, previous: dict | None = None):
+    merged = dict((previous or {}).get("results", {}))
+    merged.update(results)
+    payload = {"format": _FORMAT, "environment": environment(), "results": dict(sorted(merged.items()))}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=1)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def compare(results: dict, baseline: dict, threshold: float = BENCH_THRESHOLD) -> list[dict]:
+    rows = []
+    recorded = baseline.get("results", {})
+    for name, result in results.items():
+        before = recorded.get(name)
+        row = {"name": name, "median": result["median"], "baseline": None, "change": None, "status": "new"}
+        if before:
+            row["baseline"] = before["median"]
+            row["change"] = result["median"] / before["median"] - 1 if before["median"] else 0.0
+            slower = result["median"] - before["median"]
+            row["status"] = "REGRESSED" if row["change"] > threshold and slower > BENCH_NOISE_FLOOR else "ok"
+        rows.append(row)
+    return rows
+
+
+def _format_seconds(value) -> str:
+    if value is None:
+        return "-"
+    if value >= 1:
+        return f"{value:.2f} s"
+    if value >= 1e-3:
+        return f"{value * 1e3:.2f} ms"
+    return f"{value * 1e6:.1f} us"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the calculator engine against a JSON baseline.")
+    parser.add_argument("--root", default=calculator_engine.CALCULATORS_DIR, help="Shipped calculators directory.")
+    parser.add_argument("--baseline", default=BENCH_BASELINE_FILE, help="Baseline JSON file.")
+    parser.add_argument("--threshold", type=float, default=BENCH_THRESHOLD, help="Allowed slowdown, e.g. 0.25 for 25%%.")
+    parser.add_argument("--update", action="store_true", help="Record these results as the new baseline.")
+    parser.add_argument("--filter", default=None, help="Only run cases whose name contains this text.")
+    parser.add_argument("--rounds", type=int, default=BENCH_ROUNDS)
+    parser.add_argument("--round-seconds", type=float, default=BENCH_ROUND_SECONDS)
+    parser.add_argument("--catalog-size", type=int, default=CATALOG_TREE_SIZE, help="Files in the synthetic catalog tree; 0 skips it.")
+    parser.add_argument("--output", default=None, help="Also write this run's results to a JSON file.")
+    args = parser.parse_args(argv)
+
+    def report(name, result):
+        print(f"{name:<72} {_format_seconds(result['median']):>10}", file=sys.stderr)
+
+    results = run_benchmarks(args.root, args.filter, args.rounds, args.round_seconds, args.catalog_size, report)
+    if args.output:
+        write_baseline(args.output, results)
+
+    baseline = read_baseline(args.baseline)
+    if baseline is None or args.update:
+        write_baseline(args.baseline, results, baseline)
+        print(f"Recorded {len(results)} results in {args.baseline}.")
+        return 0
+    if baseline.get("environment") != environment():
+        print(f"Baseline was recorded on {baseline.get('environment')}; timings may not be comparable.", file=sys.stderr)
+
+    rows = compare(results, baseline, args.threshold)
+    regressions = [row for row in rows if row["status"] == "REGRESSED"]
+    for row in rows:
+        change = "-" if row["change"] is None else f"{row['change']:+.0%}"
+        print(f"{row['name']:<72} {_format_seconds(row['median']):>10} {_format_seconds(row['baseline']):>10} {change:>6}  {row['status']}")
+    print(f"{len(rows)} cases, {len(regressions)} regressed beyond {args.threshold:.0%}.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
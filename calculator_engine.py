@@ -0,0 +1,1084 @@
+import gc
+import hashlib
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from perf_metrics import count, timed
+
+CALCULATORS_DIR = "calculators"
+
+# The registry is a two-tier catalog. Browsing needs only metadata (id, name,
+# category, subcategory, hash), which is persisted in CATALOG_INDEX_NAME so a
+# scan stats files instead of parsing them; full definitions are loaded on
+# selection into a bounded LRU. Files are re-read only when their mtime/size
+# change; upload, delete and sync invalidate the paths they touch and a
+# periodic rescan picks up out-of-band edits. While a file watcher feeds the
+# registry (catalog_watch) the rescan is only a rare safety net.
+REGISTRY_RESCAN_SECONDS = 30.0
+REGISTRY_WATCHED_RESCAN_SECONDS = 600.0
+# Lives in the calculators directory; no .json suffix so the scan skips it.
+CATALOG_INDEX_NAME = ".catalog_index"
+CALCULATOR_CACHE_SIZE = 32
+
+_REGISTRY_LOCK = threading.RLock()
+_REGISTRY = {
+    "entries": {},
+    "stamps": {},
+    "dirty_paths": set(),
+    "full_scan": True,
+    "scanned_at": 0.0,
+    "calculators": [],
+    "index": None,
+    "index_dirty": False,
+    "version": 0,
+    "watched": False,
+}
+_CALCULATORS = OrderedDict()
+# Calculators seeded from a warm-start snapshot (warm_start.py), by path: the
+# stamp and hash they were captured with, their catalog name and validity, and
+# load() for the parsed data. A file whose stamp or content still matches is
+# taken from the snapshot instead of being parsed.
+_SNAPSHOT_ENTRIES = {}
+
+
+class _CatalogLock:
+    # Readers-writer lock. A waiting writer holds off new readers, and readers
+    # already waiting when a writer finishes go before the next writer, so
+    # neither side starves. Reads and writes are reentrant per thread and the
+    # writing thread may also read; a reader may not start writing, since two
+    # readers upgrading at once would deadlock.
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._readers = 0
+        self._writer = None
+        self._waiting_readers = 0
+        self._waiting_writers = 0
+        self._readers_turn = False
+
+    @contextmanager
+    def reading(self):
+        depth = getattr(self._local, "reads", 0)
+        if depth or self._writer == threading.get_ident():
+            self._local.reads = depth + 1
+            try:
+                yield
+            finally:
+                self._local.reads = depth
+            return
+        with self._cond:
+            self._waiting_readers += 1
+            try:
+                while self._writer is not None or (self._waiting_writers and not self._readers_turn):
+                    self._cond.wait()
+            finally:
+                self._waiting_readers -= 1
+                if not self._waiting_readers:
+                    self._readers_turn = False
+            self._readers += 1
+        self._local.reads = 1
+        try:
+            yield
+        finally:
+            self._local.reads = 0
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            yield
+            return
+        if getattr(self._local, "reads", 0):
+            raise RuntimeError("Cannot modify the catalog while reading it.")
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers or self._readers_turn:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = None
+                self._readers_turn = self._waiting_readers > 0
+                self._cond.notify_all()
+
+
+# Registry reads (scans, refreshes, full loads) hold the catalog lock shared;
+# admin actions hold it exclusively while they change a calculator's JSON,
+# sidecar, outcome table and image together. Take it before _REGISTRY_LOCK.
+_CATALOG_LOCK = _CatalogLock()
+
+
+def catalog_reading():
+    return _CATALOG_LOCK.reading()
+
+
+def catalog_writing():
+    return _CATALOG_LOCK.writing()
+
+# Compiled rule indexes are cached per calculator dict; the registry hands out a
+# new dict whenever a file's content changes, so identity tracks the version.
+COMPILED_RULES_CACHE_SIZE = 256
+
+_COMPILED_RULES_LOCK = threading.Lock()
+_COMPILED_RULES = OrderedDict()
+
+# Decision-tree DOT is built once per calculator version; reruns only patch
+# the lines of nodes the current values highlight.
+DECISION_TREE_CACHE_SIZE = 64
+
+_GRAPH_TEMPLATES_LOCK = threading.Lock()
+_GRAPH_TEMPLATES = OrderedDict()
+
+
+# A compiled sidecar (<name>.compiled) holds the parsed calculator with interned
+# strings plus its compiled rule index, in marshal format. It is keyed by the
+# source's SHA-256 and stat, so a matching sidecar replaces reading, hashing and
+# parsing the JSON; anything stale or unreadable falls back to the JSON.
+_SIDECAR_MAGIC = b"CALCSID3"
+_SIDECAR_FORMAT = (marshal.version, sys.version_info[:2])
+
+
+def file_stamp(stat) -> tuple:
+    # An edit that keeps the size and restores the mtime still moves the
+    # ctime, which only the kernel sets.
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ctime_ns)
+
+
+def sidecar_path(json_path: str) -> str:
+    return os.path.splitext(json_path)[0] + ".compiled"
+
+
+def _intern_strings(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return [_intern_strings(item) for item in value]
+    if isinstance(value, dict):
+        return {sys.intern(key) if isinstance(key, str) else key: _intern_strings(item) for key, item in value.items()}
+    return value
+
+
+def write_calculator_sidecar(path: str, data: dict, raw: bytes):
+    stat = os.stat(path)
+    data = _intern_strings(data)
+    compiled = dict(_build_compiled_rules(data.get("rules") or []))
+    del compiled["rules"]
+    header = {
+        "format": _SIDECAR_FORMAT,
+        "hash": hashlib.sha256(raw).hexdigest(),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "ctime_ns": stat.st_ctime_ns,
+    }
+    payload = _SIDECAR_MAGIC + marshal.dumps((header, data, compiled))
+    dest = sidecar_path(path)
+    tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+    os.replace(tmp, dest)
+
+
+def discard_calculator_sidecar(path: str):
+    try:
+        os.remove(sidecar_path(path))
+    except OSError:
+        pass
+
+
+def _read_sidecar(path: str):
+    try:
+        with open(sidecar_path(path), "rb") as f:
+            payload = f.read()
+        if not payload.startswith(_SIDECAR_MAGIC):
+            return None
+        header, data, compiled = marshal.loads(memoryview(payload)[len(_SIDECAR_MAGIC) :])
+        if header.get("format") != _SIDECAR_FORMAT or not isinstance(data, dict):
+            return None
+    except (OSError, EOFError, ValueError, TypeError, AttributeError):
+        return None
+    compiled["rules"] = data.get("rules") or []
+    return header, data, compiled
+
+
+def _relative(path: str) -> str:
+    prefix = os.path.join(CALCULATORS_DIR, "")
+    return path[len(prefix) :] if path.startswith(prefix) else os.path.relpath(path, CALCULATORS_DIR)
+
+
+def _index_key(path: str) -> str:
+    return _relative(path).replace(os.sep, "/")
+
+
+def _catalog_entry(path: str, name: str | None, digest: str) -> dict:
+    rel_path = _relative(path)
+    parts = rel_path.split(os.sep)
+    return {
+        "id": rel_path,
+        "name": name or os.path.splitext(os.path.basename(path))[0],
+        "path": path,
+        "category": parts[0] if len(parts) > 1 else "Uncategorized",
+        "subcategory": parts[1] if len(parts) > 2 else "",
+        "hash": digest,
+    }
+
+
+def _calculator_record(path: str, data: dict, digest: str) -> dict:
+    record = _catalog_entry(path, data.get("name"), digest)
+    record["data"] = data
+    return record
+
+
+def _walk_calculator_paths() -> list[str]:
+    paths = []
+    if not os.path.isdir(CALCULATORS_DIR):
+        return paths
+    for root, _dirs, files in os.walk(CALCULATORS_DIR):
+        for filename in sorted(files):
+            if filename.endswith(".json"):
+                paths.append(os.path.join(root, filename))
+    return paths
+
+
+def catalog_index_path() -> str:
+    return os.path.join(CALCULATORS_DIR, CATALOG_INDEX_NAME)
+
+
+def _catalog_index() -> dict:
+    if _REGISTRY["index"] is None:
+        try:
+            with open(catalog_index_path(), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        _REGISTRY["index"] = index if isinstance(index, dict) else {}
+    return _REGISTRY["index"]
+
+
+def _save_catalog_index():
+    if not _REGISTRY["index_dirty"]:
+        return
+    _REGISTRY["index_dirty"] = False
+    dest = catalog_index_path()
+    tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_REGISTRY["index"], f, indent=1, sort_keys=True)
+        os.replace(tmp, dest)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def pack_calculator(data: dict) -> bytes:
+    # Parsed calculator and compiled rules in the sidecar's marshal layout,
+    # for unpack_calculator.
+    data = _intern_strings(data)
+    compiled = dict(_build_compiled_rules(data.get("rules") or []))
+    del compiled["rules"]
+    return marshal.dumps((data, compiled))
+
+
+def unpack_calculator(payload) -> dict | None:
+    try:
+        data, compiled = marshal.loads(payload)
+    except (EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    compiled["rules"] = data.get("rules") or []
+    _remember_compiled_rules(data, compiled)
+    return data
+
+
+def _snapshot_matches(path: str, stat, snapshot: dict) -> bool:
+    # Checkouts and copies change mtimes, so a stamp mismatch falls back to
+    # comparing content hashes; a match adopts the new stamp.
+    stamp = file_stamp(stat)
+    if snapshot["stamp"] == stamp:
+        return True
+    if snapshot["stamp"][1] == stat.st_size:
+        try:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            digest = None
+        if digest == snapshot["hash"]:
+            snapshot["stamp"] = stamp
+            return True
+    _SNAPSHOT_ENTRIES.pop(path, None)
+    return False
+
+
+def _read_calculator(path: str, stat):
+    # Returns (digest, data); data is None when the file is not a JSON object.
+    # A sidecar whose stat or hash matches the source stands in for the JSON.
+    snapshot = _SNAPSHOT_ENTRIES.get(path)
+    if snapshot is not None and snapshot["valid"] and snapshot["stamp"] == file_stamp(stat):
+        data = snapshot["load"]()
+        if data is not None:
+            count("calculator_snapshot.hit")
+            return snapshot["hash"], data
+    sidecar = _read_sidecar(path)
+    if sidecar and (sidecar[0]["mtime_ns"], sidecar[0]["size"], sidecar[0]["ctime_ns"]) == file_stamp(stat):
+        digest = sidecar[0]["hash"]
+    else:
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        if not sidecar or sidecar[0]["hash"] != digest:
+            try:
+                data = json.loads(raw.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                data = None
+            return digest, data if isinstance(data, dict) else None
+    _remember_compiled_rules(sidecar[1], sidecar[2])
+    return digest, sidecar[1]
+
+
+def _cache_calculator(record: dict):
+    _CALCULATORS[record["path"]] = record
+    _CALCULATORS.move_to_end(record["path"])
+    while len(_CALCULATORS) > CALCULATOR_CACHE_SIZE:
+        _CALCULATORS.popitem(last=False)
+
+
+def _set_registry_entry(path: str, stat, digest: str, name, valid: bool) -> bool:
+    # Records the file's stamp, catalog entry and index row; returns whether
+    # the browsable catalog changed.
+    _REGISTRY["stamps"][path] = (*file_stamp(stat), digest)
+    row = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "ctime_ns": stat.st_ctime_ns, "hash": digest, "name": name, "valid": valid}
+    index = _catalog_index()
+    rel_path = _index_key(path)
+    if index.get(rel_path) != row:
+        index[rel_path] = row
+        _REGISTRY["index_dirty"] = True
+    entries = _REGISTRY["entries"]
+    if not valid:
+        return entries.pop(path, None) is not None
+    entry = _catalog_entry(path, name, digest)
+    if entries.get(path) == entry:
+        return False
+    entries[path] = entry
+    return True
+
+
+def _forget_registry_path(path: str) -> bool:
+    _REGISTRY["stamps"].pop(path, None)
+    _CALCULATORS.pop(path, None)
+    rel_path = _index_key(path)
+    if _catalog_index().pop(rel_path, None) is not None:
+        _REGISTRY["index_dirty"] = True
+    return _REGISTRY["entries"].pop(path, None) is not None
+
+
+def _refresh_registry_path(path: str) -> bool:
+    # Stamps are kept for unparseable files too, so a broken JSON is read once
+    # per change rather than on every rescan.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return _forget_registry_path(path)
+    old_stamp = _REGISTRY["stamps"].get(path)
+    if old_stamp and old_stamp[:3] == file_stamp(stat):
+        return False
+    row = _catalog_index().get(_index_key(path))
+    if isinstance(row, dict) and (row.get("mtime_ns"), row.get("size"), row.get("ctime_ns")) == file_stamp(stat):
+        return _set_registry_entry(path, stat, row.get("hash"), row.get("name"), bool(row.get("valid")))
+    snapshot = _SNAPSHOT_ENTRIES.get(path)
+    if snapshot is not None and _snapshot_matches(path, stat, snapshot):
+        return _set_registry_entry(path, stat, snapshot["hash"], snapshot["name"], snapshot["valid"])
+    try:
+        digest, data = _read_calculator(path, stat)
+    except OSError:
+        return _forget_registry_path(path)
+    cached = _CALCULATORS.get(path)
+    if data is None or (cached and cached["hash"] != digest):
+        _CALCULATORS.pop(path, None)
+    if data is not None and not (cached and cached["hash"] == digest):
+        _cache_calculator(_calculator_record(path, data, digest))
+    name = data.get("name") if data is not None else None
+    return _set_registry_entry(path, stat, digest, name if isinstance(name, str) else None, data is not None)
+
+
+def _registry_sort_key(path: str):
+    rel_path = _relative(path)
+    return os.path.dirname(rel_path).split(os.sep), os.path.basename(rel_path)
+
+
+def _rebuild_registry_list():
+    entries = _REGISTRY["entries"]
+    _REGISTRY["calculators"] = [entries[path] for path in sorted(entries, key=_registry_sort_key)]
+    _REGISTRY["version"] += 1
+
+
+def invalidate_calculators(paths=None):
+    with _REGISTRY_LOCK:
+        if paths is None:
+            _REGISTRY["full_scan"] = True
+        else:
+            _REGISTRY["dirty_paths"].update(path for path in paths if path.endswith(".json"))
+
+
+def seed_registry(rows) -> int:
+    # Fills an empty registry from a warm-start snapshot so the first page
+    # needs no scan. rows are (path, mtime_ns, size, ctime_ns, digest, name,
+    # valid, load); the entries are trusted until the next scan revalidates
+    # them.
+    with _REGISTRY_LOCK:
+        if _REGISTRY["stamps"]:
+            return 0
+        seeded = 0
+        for path, mtime_ns, size, ctime_ns, digest, name, valid, load in rows:
+            _REGISTRY["stamps"][path] = (mtime_ns, size, ctime_ns, digest)
+            if valid:
+                _REGISTRY["entries"][path] = _catalog_entry(path, name, digest)
+            _SNAPSHOT_ENTRIES[path] = {"stamp": (mtime_ns, size, ctime_ns), "hash": digest, "name": name, "valid": valid, "load": load}
+            seeded += 1
+        _REGISTRY["full_scan"] = False
+        _REGISTRY["scanned_at"] = time.monotonic()
+        _rebuild_registry_list()
+        return seeded
+
+
+def set_catalog_watched(watched: bool):
+    # A watcher pushing every change through invalidate_calculators makes the
+    # periodic rescan redundant; losing it restores the normal interval.
+    with _REGISTRY_LOCK:
+        _REGISTRY["watched"] = bool(watched)
+
+
+@timed("catalog.load")
+def load_catalog() -> list[dict]:
+    # Metadata for every calculator: id, name, path, category, subcategory, hash.
+    with catalog_reading(), _REGISTRY_LOCK:
+        now = time.monotonic()
+        changed = False
+        rescan_seconds = REGISTRY_WATCHED_RESCAN_SECONDS if _REGISTRY["watched"] else REGISTRY_RESCAN_SECONDS
+        if _REGISTRY["full_scan"] or now - _REGISTRY["scanned_at"] > rescan_seconds:
+            found = _walk_calculator_paths()
+            # Parsed calculators are acyclic; pausing the cyclic collector while
+            # thousands of them are allocated roughly halves a cold scan.
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                for path in set(_REGISTRY["stamps"]) - set(found):
+                    changed = _refresh_registry_path(path) or changed
+                for path in found:
+                    changed = _refresh_registry_path(path) or changed
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+            index = _catalog_index()
+            known = {_index_key(path) for path in found}
+            for rel_path in [rel_path for rel_path in index if rel_path not in known]:
+                del index[rel_path]
+                _REGISTRY["index_dirty"] = True
+            _REGISTRY["full_scan"] = False
+            _REGISTRY["scanned_at"] = now
+            _REGISTRY["dirty_paths"].clear()
+        elif _REGISTRY["dirty_paths"]:
+            for path in _REGISTRY["dirty_paths"]:
+                changed = _refresh_registry_path(path) or changed
+            _REGISTRY["dirty_paths"].clear()
+        if changed:
+            _rebuild_registry_list()
+        _save_catalog_index()
+        return list(_REGISTRY["calculators"])
+
+
+def catalog_version() -> int:
+    # Bumped whenever load_catalog's result changes; lets derived indexes
+    # skip re-diffing an unchanged catalog.
+    load_catalog()
+    with _REGISTRY_LOCK:
+        return _REGISTRY["version"]
+
+
+def _full_record(path: str) -> dict | None:
+    cached = _CALCULATORS.get(path)
+    entry = _REGISTRY["entries"].get(path)
+    if entry is None:
+        return None
+    if cached and cached["hash"] == entry["hash"]:
+        _CALCULATORS.move_to_end(path)
+        count("calculator_cache.hit")
+        return cached
+    count("calculator_cache.miss")
+    try:
+        stat = os.stat(path)
+        digest, data = _read_calculator(path, stat)
+    except OSError:
+        data = None
+    if data is None:
+        if _forget_registry_path(path):
+            _rebuild_registry_list()
+        return None
+    if digest != entry["hash"]:
+        name = data.get("name")
+        if _set_registry_entry(path, stat, digest, name if isinstance(name, str) else None, True):
+            _rebuild_registry_list()
+    record = _calculator_record(path, data, digest)
+    _cache_calculator(record)
+    return record
+
+
+def load_calculators() -> list[dict]:
+    # Full records for every calculator. Prefer load_catalog for browsing and
+    # load_calculator for a single definition; this loads every file.
+    records = []
+    with catalog_reading():
+        for entry in load_catalog():
+            with _REGISTRY_LOCK:
+                record = _full_record(entry["path"])
+            if record is not None:
+                records.append(record)
+    return records
+
+
+def set_calculators_dir(path: str):
+    global CALCULATORS_DIR
+    with _REGISTRY_LOCK:
+        CALCULATORS_DIR = path
+        _REGISTRY["entries"].clear()
+        _REGISTRY["stamps"].clear()
+        _REGISTRY["dirty_paths"].clear()
+        _REGISTRY["calculators"] = []
+        _REGISTRY["version"] += 1
+        _REGISTRY["full_scan"] = True
+        _REGISTRY["index"] = None
+        _REGISTRY["index_dirty"] = False
+        _REGISTRY["watched"] = False
+        _CALCULATORS.clear()
+        _SNAPSHOT_ENTRIES.clear()
+
+
+@timed("calculator.load")
+def load_calculator(calc_id: str) -> dict | None:
+    # Resolves a single calculator without walking the tree; the catalog uses
+    # it on selection and headless callers score one calculator per process.
+    candidates = [calc_id] if calc_id.endswith(".json") else [calc_id, f"{calc_id}.json"]
+    with catalog_reading(), _REGISTRY_LOCK:
+        for candidate in candidates:
+            path = os.path.join(CALCULATORS_DIR, *candidate.replace("\\", "/").split("/"))
+            if os.path.relpath(path, CALCULATORS_DIR).startswith(os.pardir):
+                continue
+            _REGISTRY["dirty_paths"].discard(path)
+            if _refresh_registry_path(path):
+                _rebuild_registry_list()
+            record = _full_record(path)
+            if record is not None:
+                return record
+    return None
+
+
+def list_calculator_files(directory: str) -> list[str]:
+    load_catalog()
+    with _REGISTRY_LOCK:
+        return sorted(
+            os.path.basename(path)
+            for path in _REGISTRY["stamps"]
+            if os.path.dirname(path) == directory
+        )
+
+
+def calculator_paths() -> list[str]:
+    # Every calculator JSON on disk, including ones that fail to parse.
+    load_catalog()
+    with _REGISTRY_LOCK:
+        return sorted(_REGISTRY["stamps"], key=_registry_sort_key)
+
+
+def _normalise_join(value, default: str) -> str:
+    join = str(value).strip().upper()
+    return join if join in {"AND", "OR"} else default
+
+
+# Range operators compare a number input against thresholds; "between" takes
+# [low, high] and includes both ends. Non-numbers never satisfy a range.
+RANGE_OPS = ("lt", "lte", "gt", "gte", "between")
+
+
+def _is_real(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+
+def condition_op(cond) -> str:
+    return str(cond.get("op", "equals")).strip().lower()
+
+
+def range_bounds(op: str, expected):
+    # (low, low_inclusive, high, high_inclusive) with None for an open end, or
+    # None when the value does not fit the operator.
+    if op == "between":
+        if not isinstance(expected, (list, tuple)) or len(expected) != 2 or not all(_is_real(v) for v in expected):
+            return None
+        low, high = expected
+        return (low, True, high, True) if low <= high else None
+    if not _is_real(expected):
+        return None
+    if op == "lt":
+        return (None, False, expected, False)
+    if op == "lte":
+        return (None, False, expected, True)
+    if op == "gt":
+        return (expected, False, None, False)
+    if op == "gte":
+        return (expected, True, None, False)
+    return None
+
+
+def in_range(actual, bounds) -> bool:
+    if bounds is None or not _is_real(actual):
+        return False
+    low, low_inclusive, high, high_inclusive = bounds
+    if low is not None and (actual < low or (actual == low and not low_inclusive)):
+        return False
+    if high is not None and (actual > high or (actual == high and not high_inclusive)):
+        return False
+    return True
+
+
+def condition_holds(op: str, actual, expected) -> bool:
+    if op == "not_equals":
+        return actual != expected
+    if op in RANGE_OPS:
+        return in_range(actual, range_bounds(op, expected))
+    return actual == expected
+
+
+def range_points(bounds_list) -> list:
+    return sorted({bound for bounds in bounds_list for bound in (bounds[0], bounds[2]) if bound is not None})
+
+
+def range_samples(points) -> list:
+    # One value from each piece the points cut the number line into: below the
+    # first point, each point, each gap between points and above the last.
+    samples = [points[0] - 1] if points else []
+    for pidx, point in enumerate(points):
+        samples.append(point)
+        samples.append((point + points[pidx + 1]) / 2 if pidx + 1 < len(points) else point + 1)
+    return samples
+
+
+def range_region(points, actual):
+    # Index of actual's piece in range_samples(points), or None for a non-number.
+    if not _is_real(actual):
+        return None
+    pidx = bisect_left(points, actual)
+    return 2 * pidx + 1 if pidx < len(points) and points[pidx] == actual else 2 * pidx
+
+
+def _build_range_index(conditions) -> dict:
+    # Every range condition on an input is constant on each piece between its
+    # thresholds, so each piece keeps the slots it satisfies and matching a
+    # value is one binary search however many thresholds the rules use.
+    points = range_points(bounds for _ridx, _bit, bounds in conditions)
+    regions = [
+        [(ridx, bit) for ridx, bit, bounds in conditions if in_range(sample, bounds)] for sample in range_samples(points)
+    ]
+    return {"points": points, "regions": regions}
+
+
+def _build_compiled_rules(rules) -> dict:
+    # Each condition becomes one bit of its rule's mask. Hashable condition values
+    # are indexed by (input_id, value) so evaluation only visits the slots the
+    # current values can satisfy; AND runs are pre-grouped into bit masks, and
+    # range conditions go through a per-input interval index.
+    eq_index: dict = {}
+    ne_index: dict = {}
+    ne_slots: dict = {}
+    range_conditions: dict = {}
+    scan_slots = []
+    groups_by_rule = []
+    sizes = []
+    for ridx, rule in enumerate(rules):
+        conditions = rule.get("conditions") or []
+        default_join = _normalise_join(rule.get("condition_operator", "AND"), "AND")
+        groups = []
+        group = 0
+        for cidx, cond in enumerate(conditions):
+            bit = 1 << cidx
+            if cidx and _normalise_join(cond.get("join_with_previous", default_join), default_join) == "OR":
+                groups.append(group)
+                group = 0
+            group |= bit
+            input_id = cond.get("input_id")
+            expected = cond.get("value")
+            op = condition_op(cond)
+            if op in RANGE_OPS:
+                bounds = range_bounds(op, expected)
+                if bounds is not None:
+                    range_conditions.setdefault(input_id, []).append((ridx, bit, bounds))
+                continue
+            is_not_equals = op == "not_equals"
+            try:
+                hash(expected)
+            except TypeError:
+                scan_slots.append((ridx, bit, input_id, expected, is_not_equals))
+                continue
+            if is_not_equals:
+                ne_index.setdefault(input_id, {}).setdefault(expected, []).append((ridx, bit))
+                ne_slots.setdefault(input_id, []).append((ridx, bit))
+            else:
+                eq_index.setdefault(input_id, {}).setdefault(expected, []).append((ridx, bit))
+        if conditions:
+            groups.append(group)
+        groups_by_rule.append(groups)
+        sizes.append(len(conditions))
+    return {
+        "rules": rules,
+        "groups": groups_by_rule,
+        "sizes": sizes,
+        "inputs": list(dict.fromkeys([*eq_index, *ne_index])),
+        "eq": eq_index,
+        "ne": ne_index,
+        "ne_slots": ne_slots,
+        "ranges": {input_id: _build_range_index(conditions) for input_id, conditions in range_conditions.items()},
+        "scan": scan_slots,
+    }
+
+
+def _remember_compiled_rules(tool, compiled):
+    key = id(tool)
+    with _COMPILED_RULES_LOCK:
+        _COMPILED_RULES[key] = (tool, compiled["rules"], compiled)
+        _COMPILED_RULES.move_to_end(key)
+        while len(_COMPILED_RULES) > COMPILED_RULES_CACHE_SIZE:
+            _COMPILED_RULES.popitem(last=False)
+
+
+def compile_rules(tool) -> dict:
+    rules = tool.get("rules") or []
+    key = id(tool)
+    with _COMPILED_RULES_LOCK:
+        cached = _COMPILED_RULES.get(key)
+        if cached and cached[0] is tool and cached[1] is rules:
+            _COMPILED_RULES.move_to_end(key)
+            count("compiled_rules.hit")
+            return cached[2]
+    count("compiled_rules.miss")
+    compiled = _build_compiled_rules(rules)
+    _remember_compiled_rules(tool, compiled)
+    return compiled
+
+
+def match_rule_masks(compiled, values) -> dict:
+    masks: dict = {}
+    for input_id in compiled["inputs"]:
+        actual = values.get(input_id)
+        try:
+            eq_slots = compiled["eq"].get(input_id, {}).get(actual, ())
+            ne_excluded = compiled["ne"].get(input_id, {}).get(actual, ())
+        except TypeError:
+            eq_slots = ne_excluded = ()
+        for ridx, bit in eq_slots:
+            masks[ridx] = masks.get(ridx, 0) | bit
+        for ridx, bit in compiled["ne_slots"].get(input_id, ()):
+            masks[ridx] = masks.get(ridx, 0) | bit
+        for ridx, bit in ne_excluded:
+            masks[ridx] &= ~bit
+    for input_id, index in compiled["ranges"].items():
+        region = range_region(index["points"], values.get(input_id))
+        if region is not None:
+            for ridx, bit in index["regions"][region]:
+                masks[ridx] = masks.get(ridx, 0) | bit
+    for ridx, bit, input_id, expected, is_not_equals in compiled["scan"]:
+        if (values.get(input_id) != expected) if is_not_equals else (values.get(input_id) == expected):
+            masks[ridx] = masks.get(ridx, 0) | bit
+    return masks
+
+
+@timed("rules.evaluate")
+def evaluate_rules(tool, values):
+    compiled = compile_rules(tool)
+    masks = match_rule_masks(compiled, values)
+
+    best_match = None
+    best_count = 0
+    best_ratio = 0.0
+    best_total_conditions = 0
+
+    for ridx in sorted(masks):
+        mask = masks[ridx]
+        if not any(mask & group == group for group in compiled["groups"][ridx]):
+            continue
+        rule = compiled["rules"][ridx]
+        matched = mask.bit_count()
+        condition_count = compiled["sizes"][ridx]
+        ratio = matched / condition_count
+        if ratio == 1.0 and best_ratio == 1.0:
+            if condition_count > best_total_conditions:
+                best_match = rule
+                best_count = matched
+                best_ratio = ratio
+                best_total_conditions = condition_count
+                continue
+        if matched > best_count or (matched == best_count and ratio > best_ratio):
+            best_match = rule
+            best_count = matched
+            best_ratio = ratio
+            best_total_conditions = condition_count
+
+    if best_match:
+        return best_match
+    return None
+
+
+def _in_bands(value, bands) -> bool:
+    return any(in_range(value, range_bounds(condition_op(band), band.get("value"))) for band in bands or ())
+
+
+def score_value(rule, value) -> int:
+    # 1 when value counts for the scoring rule, -1 when it counts against, else
+    # 0. Numeric bands (favor_ranges / against_ranges) are {"op", "value"}
+    # objects using the range operators.
+    invert = rule.get("invert_favor", False)
+    if value in rule.get("favor_values", []) or _in_bands(value, rule.get("favor_ranges")):
+        return -1 if invert else 1
+    if value in rule.get("against_values", []) or _in_bands(value, rule.get("against_ranges")):
+        return 1 if invert else -1
+    return 0
+
+
+@timed("scores.compute")
+def compute_scores(tool, values):
+    plus = 0
+    minus = 0
+    scoring_mode = tool.get("scoring_mode", "signed")
+    for rule in tool.get("scoring_rules", []):
+        input_id = rule.get("input_id")
+        if not input_id:
+            continue
+        weight = rule.get("weight", 1) or 1
+        score = score_value(rule, values.get(input_id))
+
+        if score == 1:
+            plus += weight
+        elif score == -1 and scoring_mode == "signed":
+            minus += weight
+
+    total = plus - minus if scoring_mode == "signed" else plus
+    return plus, minus, total
+
+
+@timed("scores.recommend")
+def evaluate_score_recommendation(tool, values, total_score):
+    thresholds = tool.get("scoring_recommendations", [])
+    if not thresholds:
+        return None
+    best = None
+    for item in thresholds:
+        try:
+            min_score = int(item.get("min_score"))
+        except (TypeError, ValueError):
+            continue
+        if total_score >= min_score:
+            conditions = item.get("conditions", [])
+            matched = 0
+            for cond in conditions:
+                input_id = cond.get("input_id")
+                expected = cond.get("value")
+                if condition_holds(condition_op(cond), values.get(input_id), expected):
+                    matched += 1
+            if conditions and matched != len(conditions):
+                continue
+            ratio = matched / len(conditions) if conditions else 1.0
+            candidate = {
+                "min_score": min_score,
+                "level": item.get("level", "info"),
+                "message": item.get("message", ""),
+                "matched": matched,
+                "ratio": ratio,
+            }
+            if best is None:
+                best = candidate
+            else:
+                if min_score > best.get("min_score", -10**9):
+                    best = candidate
+                elif min_score == best.get("min_score", -10**9) and ratio > best.get("ratio", 0.0):
+                    best = candidate
+    return best
+
+
+def evaluate_calculator(tool, values) -> dict:
+    rule = evaluate_rules(tool, values)
+    result = {"rule": rule, "plus": None, "minus": None, "total": None, "score_recommendation": None}
+    if tool.get("scoring_rules"):
+        plus, minus, total = compute_scores(tool, values)
+        result.update(plus=plus, minus=minus, total=total)
+        result["score_recommendation"] = evaluate_score_recommendation(tool, values, total)
+    return result
+
+
+def build_label_maps(inputs):
+    id_to_label = {}
+    for item in inputs:
+        input_id = str(item.get("id", "")).strip()
+        label = str(item.get("label", "")).strip() or input_id
+        if input_id:
+            id_to_label[input_id] = label
+    return id_to_label
+
+
+_PLAIN_ATTRS = 'fillcolor="white"'
+_RULE_MATCH_ATTRS = 'fillcolor="lightyellow", color="goldenrod"'
+_COND_MATCH_ATTRS = 'fillcolor="palegreen", color="green"'
+_OUT_MATCH_ATTRS = 'fillcolor="lightblue", color="dodgerblue4"'
+_GRAPH_HEADER = [
+    "digraph DecisionTree {",
+    'rankdir=LR;',
+    'node [shape=box, style="rounded,filled", color="gray35", fillcolor="white"];',
+    'start [label="Start", shape=oval, fillcolor="white"];',
+]
+
+
+_OP_LABELS = {"not_equals": "!=", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+
+
+def _condition_label(cond, id_to_label) -> str:
+    input_label = id_to_label.get(cond.get("input_id", ""), cond.get("input_id", ""))
+    raw = cond.get("value", "")
+    op = condition_op(cond)
+    if op == "between" and isinstance(raw, (list, tuple)) and len(raw) == 2:
+        return f"{input_label} between {raw[0]} and {raw[1]}".replace('"', "'")
+    value = str(raw).strip()
+    return f"{input_label} {_OP_LABELS.get(op, '=')} {value}".replace('"', "'")
+
+
+def _rule_message_label(rule) -> str:
+    msg = str(rule.get("message", "")).strip() or "Recommendation"
+    return msg.replace('"', "'")
+
+
+def _slot(lines: list, prefix: str, suffix: str) -> tuple:
+    lines.append(f"{prefix}{_PLAIN_ATTRS}{suffix}")
+    return len(lines) - 1, prefix, suffix
+
+
+def _build_graph_template(rules, id_to_label) -> dict:
+    # Lines are rendered with every node unhighlighted; each highlightable node
+    # keeps (line index, prefix, suffix) so a rerun only rewrites matched lines.
+    lines = list(_GRAPH_HEADER)
+    rule_slots = []
+    for ridx, rule in enumerate(rules):
+        conditions = rule.get("conditions", [])
+        rule_node = f"rule_{ridx}"
+        rule_label = str(rule.get("name", "")).strip() or f"Rule {ridx + 1}"
+        rule_line = _slot(lines, f'{rule_node} [label="{rule_label}", ', "];")
+        lines.append(f"start -> {rule_node};")
+
+        prev_node = rule_node
+        cond_lines = []
+        for cidx, cond in enumerate(conditions):
+            cond_node = f"rule_{ridx}_cond_{cidx}"
+            cond_lines.append(_slot(lines, f'{cond_node} [label="{_condition_label(cond, id_to_label)}", ', "];"))
+            lines.append(f"{prev_node} -> {cond_node};")
+            prev_node = cond_node
+
+        out_node = f"rule_{ridx}_out"
+        out_line = _slot(lines, f'{out_node} [shape=note, label="{_rule_message_label(rule)}", ', "];")
+        lines.append(f"{prev_node} -> {out_node};")
+        rule_slots.append((rule_line, out_line, cond_lines, (1 << len(conditions)) - 1))
+    lines.append("}")
+    return {"lines": lines, "rules": rule_slots}
+
+
+def _build_collapsed_graph_template(rules, id_to_label) -> dict:
+    # Rules that open with the same conditions share one path through a trie
+    # keyed on (input, operator, value); each rule ends in its own outcome node.
+    lines = list(_GRAPH_HEADER)
+    children: dict = {}
+    node_ids: dict = {}
+    cond_nodes = []
+    rule_slots = []
+    for ridx, rule in enumerate(rules):
+        conditions = rule.get("conditions", [])
+        parent = "start"
+        for cidx, cond in enumerate(conditions):
+            label = _condition_label(cond, id_to_label)
+            key = (parent, str(cond.get("input_id", "")), label)
+            node = node_ids.get(key)
+            if node is None:
+                node = f"node_{len(node_ids)}"
+                node_ids[key] = node
+                line = _slot(lines, f'{node} [label="{label}", ', "];")
+                lines.append(f"{parent} -> {node};")
+                children[node] = line
+                cond_nodes.append((node, ridx, 1 << cidx))
+            parent = node
+        rule_label = (str(rule.get("name", "")).strip() or f"Rule {ridx + 1}").replace('"', "'")
+        out_node = f"rule_{ridx}_out"
+        out_line = _slot(lines, f'{out_node} [shape=note, label="{rule_label}\\n{_rule_message_label(rule)}", ', "];")
+        lines.append(f"{parent} -> {out_node};")
+        rule_slots.append((None, out_line, [], (1 << len(conditions)) - 1))
+    lines.append("}")
+    # A trie node stands for the same condition in every rule routed through it,
+    # so the slot of the first rule that created it decides its highlight.
+    node_slots = [(children[node], ridx, bit) for node, ridx, bit in cond_nodes]
+    return {"lines": lines, "rules": rule_slots, "nodes": node_slots}
+
+
+def _graph_template(tool, id_to_label, collapsed: bool) -> dict:
+    rules = tool.get("rules", [])
+    key = (id(tool), collapsed)
+    with _GRAPH_TEMPLATES_LOCK:
+        cached = _GRAPH_TEMPLATES.get(key)
+        if cached and cached[0] is tool and cached[1] is rules and cached[2] == id_to_label:
+            _GRAPH_TEMPLATES.move_to_end(key)
+            count("decision_tree_template.hit")
+            return cached[3]
+    count("decision_tree_template.miss")
+    builder = _build_collapsed_graph_template if collapsed else _build_graph_template
+    template = builder(rules, id_to_label)
+    with _GRAPH_TEMPLATES_LOCK:
+        _GRAPH_TEMPLATES[key] = (tool, rules, dict(id_to_label), template)
+        _GRAPH_TEMPLATES.move_to_end(key)
+        while len(_GRAPH_TEMPLATES) > DECISION_TREE_CACHE_SIZE:
+            _GRAPH_TEMPLATES.popitem(last=False)
+    return template
+
+
+@timed("decision_tree.build")
+def build_decision_tree_graph(tool, id_to_label, values=None, collapsed: bool = False):
+    values = values or {}
+    template = _graph_template(tool, id_to_label, collapsed)
+    masks = match_rule_masks(compile_rules(tool), values)
+    lines = list(template["lines"])
+
+    def highlight(slot, attrs):
+        line_index, prefix, suffix = slot
+        lines[line_index] = f"{prefix}{attrs}{suffix}"
+
+    for ridx, mask in masks.items():
+        rule_line, out_line, cond_lines, full_mask = template["rules"][ridx]
+        if full_mask and mask == full_mask:
+            if rule_line is not None:
+                highlight(rule_line, _RULE_MATCH_ATTRS)
+            highlight(out_line, _OUT_MATCH_ATTRS)
+        if values:
+            for cidx, cond_line in enumerate(cond_lines):
+                if mask & (1 << cidx):
+                    highlight(cond_line, _COND_MATCH_ATTRS)
+    if values:
+        for node_line, ridx, bit in template.get("nodes", ()):
+            if masks.get(ridx, 0) & bit:
+                highlight(node_line, _COND_MATCH_ATTRS)
+    return "\n".join(lines)
@@ -0,0 +1,131 @@
+import io
+import os
+import zipfile
+
+from calculator_engine import catalog_writing, invalidate_calculators, write_calculator_sidecar
+from calculator_schema import parse_calculator
+from github_sync import GITHUB_CALCULATORS_DIR, is_synced_path, write_file_atomic
+from image_variants import schedule_variants
+
+# Bulk import of calculators and their guideline images from a zip, a folder
+# or a set of uploaded files. Paths that start with a category (optionally
+# under calculators/) keep their place in the tree; anything else lands in the
+# chosen category and subcategory by file name. An import is all or nothing:
+# every calculator is validated first, then the batch is written under one
+# catalog lock with a single registry invalidation.
+IMPORT_MAX_FILES = 2000
+IMPORT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _skipped_name(rel_path: str) -> bool:
+    return any(part.startswith(".") or part == "__MACOSX" for part in rel_path.split("/"))
+
+
+def read_import_archive(data: bytes) -> list[tuple[str, bytes]]:
+    # Raises ValueError for a damaged zip or one over the import limits; the
+    # sizes are checked from the directory before anything is extracted.
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile as exc:
+        raise ValueError(f"not a zip file ({exc})") from exc
+    with archive:
+        members = [info for info in archive.infolist() if not info.is_dir() and not _skipped_name(info.filename)]
+        if len(members) > IMPORT_MAX_FILES:
+            raise ValueError(f"{len(members)} files; the limit is {IMPORT_MAX_FILES}")
+        if sum(info.file_size for info in members) > IMPORT_MAX_BYTES:
+            raise ValueError(f"more than {IMPORT_MAX_BYTES // 2**20} MB uncompressed")
+        try:
+            return [(info.filename, archive.read(info)) for info in members]
+        except (zipfile.BadZipFile, OSError, RuntimeError) as exc:
+            raise ValueError(f"could not extract ({exc})") from exc
+
+
+def read_import_folder(folder: str) -> list[tuple[str, bytes]]:
+    files = []
+    total = 0
+    for root, dirs, filenames in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for filename in sorted(filenames):
+            rel_path = os.path.relpath(os.path.join(root, filename), folder).replace(os.sep, "/")
+            if _skipped_name(rel_path):
+                continue
+            with open(os.path.join(root, filename), "rb") as f:
+                data = f.read()
+            total += len(data)
+            files.append((rel_path, data))
+            if len(files) > IMPORT_MAX_FILES or total > IMPORT_MAX_BYTES:
+                raise ValueError(f"more than {IMPORT_MAX_FILES} files or {IMPORT_MAX_BYTES // 2**20} MB")
+    return files
+
+
+def import_destination(rel_path: str, target_parts, categories) -> list[str] | None:
+    # Path parts under the calculators directory, or None for an unsafe path.
+    parts = [part for part in rel_path.replace("\\", "/").split("/") if part]
+    if not parts or any(part in {".", ".."} or ":" in part for part in parts):
+        return None
+    if parts[0] == GITHUB_CALCULATORS_DIR and len(parts) > 1:
+        parts = parts[1:]
+    if len(parts) > 1 and parts[0] in categories:
+        return parts
+    return [*target_parts, parts[-1]]
+
+
+def plan_import(files, dest_dir: str, target_parts, categories, overwrite: bool = False) -> dict:
+    # Returns {"calculators": [...], "images": [...], "skipped": [...],
+    # "errors": [...]}; each calculator or image is {"rel_path", "path",
+    # "data"} and calculators also carry "parsed". Nothing is written.
+    plan = {"calculators": [], "images": [], "skipped": [], "errors": []}
+    seen = {}
+    for rel_path, data in files:
+        if not is_synced_path(rel_path):
+            plan["skipped"].append(rel_path)
+            continue
+        parts = import_destination(rel_path, target_parts, categories)
+        if parts is None:
+            plan["errors"].append(f"{rel_path}: unsafe path")
+            continue
+        dest_rel = "/".join(parts)
+        if dest_rel in seen:
+            plan["errors"].append(f"{rel_path}: same destination as {seen[dest_rel]} ({dest_rel})")
+            continue
+        seen[dest_rel] = rel_path
+        path = os.path.join(dest_dir, *parts)
+        if os.path.exists(path) and not overwrite:
+            plan["errors"].append(f"{dest_rel}: already exists")
+            continue
+        item = {"rel_path": dest_rel, "path": path, "data": data}
+        if not rel_path.lower().endswith(".json"):
+            plan["images"].append(item)
+            continue
+        parsed, errors = parse_calculator(data)
+        if errors:
+            plan["errors"].extend(f"{dest_rel}: {message}" for message in errors)
+            continue
+        item["parsed"] = parsed
+        plan["calculators"].append(item)
+    return plan
+
+
+def write_import(plan: dict) -> list[str]:
+    # Writes a validated plan and returns the written paths. Calculators get
+    # their compiled sidecars in the same batch, and the registry is
+    # invalidated once for the whole import.
+    written = []
+    with catalog_writing():
+        for item in plan["calculators"] + plan["images"]:
+            write_file_atomic(item["path"], item["data"])
+            written.append(item["path"])
+        for item in plan["calculators"]:
+            try:
+                write_calculator_sidecar(item["path"], item["parsed"], item["data"])
+            except OSError:
+                pass
+        invalidate_calculators(written)
+    for item in plan["images"]:
+        schedule_variants(item["data"])
+    return written
+
+
+def import_repo_files(plan: dict) -> dict:
+    # Repository path -> bytes for pushing the import as one commit.
+    return {f"{GITHUB_CALCULATORS_DIR}/{item['rel_path']}": item["data"] for item in plan["calculators"] + plan["images"]}
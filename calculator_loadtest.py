@@ -0,0 +1,631 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import zipfile
+from urllib import error, request
+
+import github_sync
+from calculator_bench import synthetic_calculator
+from github_standin import start_standin_server
+
+# Load-tests tr_app with many concurrent sessions against a real
+# `streamlit run` server, which is the only way to exercise sessions truly in
+# parallel: AppTest swaps process-wide globals on every run. Each simulated
+# clinician is a websocket client speaking Streamlit's protocol. It rebuilds
+# the page from the deltas with Streamlit's testing element tree and sends the
+# widget states a browser would. Sessions switch sections, pick calculators,
+# change inputs, toggle the decision tree, search, and occasionally upload,
+# bulk-import or sync.
+#
+# The server runs in a scratch copy of the calculators with GITHUB_API_URL
+# pointing at the local stand-in, so sync, save and guideline-image fetches
+# happen over HTTP without touching the network. The websocket client needs
+# the development requirements: pip install -r requirements-dev.txt.
+LOADTEST_SESSIONS = 50
+LOADTEST_ACTIONS = 20
+LOADTEST_THINK_SECONDS = 0.2
+LOADTEST_RUN_TIMEOUT = 120.0
+LOADTEST_SERVER_START_SECONDS = 60.0
+LOADTEST_MEMORY_SAMPLE_SECONDS = 0.5
+LOADTEST_TOKEN = "loadtest-token"
+# Matches tr_app.GITHUB_JOB_POLL_SECONDS, the browser's timer for job progress.
+LOADTEST_JOB_POLL_SECONDS = 1.0
+ACTION_WEIGHTS = {
+    "switch_section": 3,
+    "pick_calculator": 4,
+    "change_input": 8,
+    "toggle_tree": 2,
+    "search": 1,
+    "upload": 0.3,
+    "bulk_import": 0.05,
+    "sync": 0.2,
+}
+LOADTEST_IMPORT_SIZE = 20
+UPLOAD_LABEL = "Upload calculator JSON"
+BULK_IMPORT_LABEL = "Bulk import (zip, or several JSON and guideline images)"
+SECTIONS = ("Cardiac", "Thoracic", "Transplant", "Uncategorized")
+SEARCH_TERMS = ("tricuspid", "aortic", "repair", "regurg", "tavi", "")
+
+_SCRATCH_IGNORE = shutil.ignore_patterns("*.compiled", "*.outcomes", ".catalog_index", ".search_index")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_rss(pid: int) -> int | None:
+    # Resident set size in bytes; only available where /proc is.
+    try:
+        with open(f"/proc/{pid}/statm", "r", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _find(widgets, label: str):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    return None
+
+
+def _by_key(widgets, key: str):
+    for widget in widgets:
+        if widget.key == key:
+            return widget
+    return None
+
+
+def _upload_file(base_url: str, upload_url: str, filename: str, data: bytes, mime_type: str):
+    boundary = uuid.uuid4().hex
+    body = b"".join(
+        [
+            f"--{boundary}\r\n".encode(),
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'.encode(),
+            f"Content-Type: {mime_type}\r\n\r\n".encode(),
+            data,
+            f"\r\n--{boundary}--\r\n".encode(),
+        ]
+    )
+    url = upload_url if upload_url.startswith("http") else f"{base_url}{upload_url}"
+    req = request.Request(url, data=body, method="PUT", headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with request.urlopen(req, timeout=LOADTEST_RUN_TIMEOUT) as response:
+        response.read()
+
+
+class LoadSession:
+    def __init__(self, number: int, base_url: str, seed: int, timeout: float = LOADTEST_RUN_TIMEOUT):
+        self.number = number
+        self.base_url = base_url
+        self.rng = random.Random(seed + number)
+        self.timeout = timeout
+        self.ws = None
+        self.session_id = None
+        self.tree = None
+        # Deltas of the current page by delta path. A fragment rerun only
+        # sends its own fragment, which replaces that fragment's deltas.
+        self.deltas = {}
+        self.widget_fragments = {}
+        # Checkbox values this client has set, by widget id. The server only
+        # sends defaults; like a browser, the client owns the current value.
+        self.checked = {}
+        self.samples = []
+        self.errors = []
+        self.uploads = 0
+
+    async def _receive(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        raw = await asyncio.wait_for(self.ws.recv(), self.timeout)
+        msg = ForwardMsg()
+        msg.ParseFromString(raw)
+        return msg, len(raw)
+
+    async def _rerun(self, action: str, widget=None, fragment_id: str = "", **value):
+        # Sends a rerun with one changed widget, or a timer rerun of one
+        # fragment, and waits for the script to finish, following any
+        # st.rerun() the app triggers on the way.
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        from streamlit.testing.v1.element_tree import parse_tree_from_messages
+
+        back = BackMsg()
+        back.rerun_script.query_string = ""
+        if fragment_id:
+            back.rerun_script.fragment_id = fragment_id
+            back.rerun_script.is_auto_rerun = True
+        if widget is not None:
+            # Widgets inside an st.fragment rerun just that fragment, as in the
+            # browser.
+            back.rerun_script.fragment_id = self.widget_fragments.get(widget.id, "")
+            state = back.rerun_script.widget_states.widgets.add()
+            state.id = widget.id
+            for field, field_value in value.items():
+                if field == "file_uploader_state_value":
+                    state.file_uploader_state_value.CopyFrom(field_value)
+                else:
+                    setattr(state, field, field_value)
+        started = time.perf_counter()
+        received = 0
+        fragment_run = False
+        try:
+            await self.ws.send(back.SerializeToString())
+            while True:
+                msg, size = await self._receive()
+                received += size
+                kind = msg.WhichOneof("type")
+                if kind == "new_session":
+                    self.session_id = msg.new_session.initialize.session_id
+                    fragments = set(msg.new_session.fragment_ids_this_run)
+                    fragment_run = bool(fragments)
+                    if fragments:
+                        self.deltas = {path: delta for path, delta in self.deltas.items() if delta.delta.fragment_id not in fragments}
+                    else:
+                        self.deltas = {}
+                elif kind == "delta":
+                    self.deltas[tuple(msg.metadata.delta_path)] = msg
+                    if msg.delta.WhichOneof("type") == "new_element":
+                        element = msg.delta.new_element
+                        widget_id = getattr(getattr(element, element.WhichOneof("type")), "id", None)
+                        if isinstance(widget_id, str):
+                            self.widget_fragments[widget_id] = msg.delta.fragment_id
+                elif kind == "script_finished" and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+        except Exception as exc:
+            self.errors.append(f"{action}: {type(exc).__name__}: {exc}")
+            return False
+        self.samples.append((action, time.perf_counter() - started, received, fragment_run))
+        self.tree = parse_tree_from_messages([self.deltas[path] for path in sorted(self.deltas)])
+        for exception in self.tree.exception:
+            self.errors.append(f"{action}: {exception.message}")
+        return True
+
+    def _progress_fragment(self):
+        for delta in self.deltas.values():
+            if delta.delta.WhichOneof("type") == "new_element" and delta.delta.new_element.WhichOneof("type") == "progress":
+                return delta.delta.fragment_id
+        return None
+
+    async def _follow_jobs(self):
+        # While a GitHub job's progress bar is shown, reruns its fragment on
+        # the browser's timer until the job finishes and the app reruns
+        # without it. job_wait is the time from the click to that point.
+        started = time.perf_counter()
+        polled = False
+        while (fragment_id := self._progress_fragment()) is not None:
+            if time.perf_counter() - started > self.timeout:
+                self.errors.append(f"job_wait: job still running after {self.timeout:.0f} s")
+                return
+            await asyncio.sleep(LOADTEST_JOB_POLL_SECONDS)
+            if not await self._rerun("job_poll", fragment_id=fragment_id):
+                return
+            polled = True
+        if polled:
+            self.samples.append(("job_wait", time.perf_counter() - started, 0, False))
+
+    def _missing(self, action: str):
+        shown = [element.value for element in (*self.tree.info, *self.tree.error)]
+        self.errors.append(f"{action}: expected widget not on the page; page shows {shown or 'nothing'}")
+
+    def _selected_id(self):
+        chooser = _find(self.tree.main.selectbox, "Choose a calculator")
+        toggle = next((box for box in self.tree.main.checkbox if (box.key or "").startswith("show_decision_tree_")), None)
+        if chooser is None or toggle is None:
+            return None
+        return toggle.key[len("show_decision_tree_") :]
+
+    async def start(self):
+        import websockets
+
+        host = self.base_url.split("://", 1)[1]
+        self.ws = await websockets.connect(f"ws://{host}/_stcore/stream", subprotocols=["streamlit"], max_size=None)
+        await self._rerun("first_load")
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def switch_section(self):
+        section = _find(self.tree.main.selectbox, "Section")
+        if section is None:
+            # A search query hides the section picker; clear it instead.
+            search = _by_key(self.tree.main.text_input, "calculator_search")
+            if search is None:
+                return self._missing("switch_section")
+            return await self._rerun("switch_section", search, string_value="")
+        await self._rerun("switch_section", section, string_value=self.rng.choice(SECTIONS))
+
+    async def pick_calculator(self):
+        chooser = _find(self.tree.main.selectbox, "Choose a calculator")
+        if chooser is None or not chooser.options:
+            return await self.switch_section()
+        await self._rerun("pick_calculator", chooser, string_value=self.rng.choice(chooser.options))
+
+    async def change_input(self):
+        selected = self._selected_id()
+        if not selected:
+            return await self.pick_calculator()
+        prefix = f"{selected}_"
+        candidates = [
+            widget
+            for widgets in (self.tree.main.selectbox, self.tree.main.number_input, self.tree.main.text_input)
+            for widget in widgets
+            if (widget.key or "").startswith(prefix)
+        ]
+        if not candidates:
+            return await self.pick_calculator()
+        widget = self.rng.choice(candidates)
+        if widget.type == "selectbox":
+            await self._rerun("change_input", widget, string_value=self.rng.choice(widget.options))
+        elif widget.type == "number_input":
+            await self._rerun("change_input", widget, double_value=float(self.rng.randint(0, 100)))
+        else:
+            await self._rerun("change_input", widget, string_value=self.rng.choice(("", "yes", "no")))
+
+    async def toggle_tree(self):
+        selected = self._selected_id()
+        if not selected:
+            return await self.pick_calculator()
+        toggle = _by_key(self.tree.main.checkbox, f"show_decision_tree_{selected}")
+        value = not self.checked.get(toggle.id, toggle.proto.default)
+        self.checked[toggle.id] = value
+        await self._rerun("toggle_tree", toggle, bool_value=value)
+
+    async def search(self):
+        search = _by_key(self.tree.main.text_input, "calculator_search")
+        if search is None:
+            return self._missing("search")
+        await self._rerun("search", search, string_value=self.rng.choice(SEARCH_TERMS))
+
+    async def _choose_save_to_github(self, action: str) -> bool:
+        # Sets "Also save to GitHub" at random; False if the page lacks it.
+        save = _find(self.tree.sidebar.checkbox, "Also save to GitHub")
+        if save is None:
+            return False
+        save_to_github = self.rng.random() < 0.5
+        if self.checked.get(save.id, save.proto.default) != save_to_github:
+            self.checked[save.id] = save_to_github
+            return await self._rerun(action, save, bool_value=save_to_github)
+        return True
+
+    async def _transfer(self, action: str, filename: str, data: bytes, content_type: str):
+        # Asks the server for an upload URL and PUTs the file, as the browser
+        # does; returns the uploader state for the follow-up rerun.
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.Common_pb2 import FileUploaderState
+
+        back = BackMsg()
+        back.file_urls_request.request_id = f"{self.number}-{self.uploads}"
+        back.file_urls_request.session_id = self.session_id
+        back.file_urls_request.file_names.append(filename)
+        started = time.perf_counter()
+        try:
+            await self.ws.send(back.SerializeToString())
+            while True:
+                msg, _size = await self._receive()
+                if msg.WhichOneof("type") == "file_urls_response":
+                    break
+            urls = msg.file_urls_response.file_urls[0]
+            await asyncio.to_thread(_upload_file, self.base_url, urls.upload_url, filename, data, content_type)
+        except Exception as exc:
+            self.errors.append(f"{action}: {type(exc).__name__}: {exc}")
+            return None
+        self.samples.append(("upload_transfer", time.perf_counter() - started, len(data), False))
+        state = FileUploaderState()
+        info = state.uploaded_file_info.add()
+        info.file_id = urls.file_id
+        info.name = filename
+        info.size = len(data)
+        info.file_urls.CopyFrom(urls)
+        return state
+
+    async def _clear_uploader(self, label: str):
+        from streamlit.proto.Common_pb2 import FileUploaderState
+
+        uploader = _find(self.tree.sidebar.file_uploader, label)
+        if uploader is not None and await self._rerun("clear_upload", uploader, file_uploader_state_value=FileUploaderState()):
+            await self._follow_jobs()
+
+    async def upload(self):
+        # Uploads one calculator, then clears the uploader.
+        if _find(self.tree.sidebar.file_uploader, UPLOAD_LABEL) is None:
+            return self._missing("upload")
+        if not await self._choose_save_to_github("upload_options"):
+            return
+        self.uploads += 1
+        tool = synthetic_calculator(self.rng, self.rng.randint(5, 30), self.rng.randint(3, 10))
+        tool["name"] = f"Load test {self.number}.{self.uploads}"
+        filename = f"loadtest_{self.number}_{self.uploads}.json"
+        state = await self._transfer("upload", filename, json.dumps(tool).encode("utf-8"), "application/json")
+        if state is not None and await self._rerun("upload", _find(self.tree.sidebar.file_uploader, UPLOAD_LABEL), file_uploader_state_value=state):
+            await self._clear_uploader(UPLOAD_LABEL)
+
+    async def bulk_import(self):
+        # Uploads a zip of LOADTEST_IMPORT_SIZE calculators, presses Import,
+        # then clears the uploader.
+        if _find(self.tree.sidebar.file_uploader, BULK_IMPORT_LABEL) is None:
+            return self._missing("bulk_import")
+        if not await self._choose_save_to_github("import_options"):
+            return
+        self.uploads += 1
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as bundle:
+            for index in range(LOADTEST_IMPORT_SIZE):
+                tool = synthetic_calculator(self.rng, self.rng.randint(5, 30), self.rng.randint(3, 10))
+                tool["name"] = f"Load test import {self.number}.{self.uploads}.{index}"
+                bundle.writestr(f"calculators/Transplant/import_{self.number}_{self.uploads}_{index}.json", json.dumps(tool))
+        filename = f"loadtest_{self.number}_{self.uploads}.zip"
+        state = await self._transfer("bulk_import", filename, archive.getvalue(), "application/zip")
+        if state is None or not await self._rerun("bulk_upload", _find(self.tree.sidebar.file_uploader, BULK_IMPORT_LABEL), file_uploader_state_value=state):
+            return
+        button = next((button for button in self.tree.sidebar.button if button.label.startswith("Import ")), None)
+        if button is None:
+            return self._missing("bulk_import")
+        if await self._rerun("bulk_import", button, trigger_value=True):
+            await self._clear_uploader(BULK_IMPORT_LABEL)
+
+    async def sync(self):
+        button = _find(self.tree.sidebar.button, "Sync from GitHub")
+        if button is None:
+            return self._missing("sync")
+        if await self._rerun("sync", button, trigger_value=True):
+            await self._follow_jobs()
+
+    async def play(self, actions: int, think_seconds: float, delay: float = 0.0):
+        names = list(ACTION_WEIGHTS)
+        weights = [ACTION_WEIGHTS[name] for name in names]
+        await asyncio.sleep(delay)
+        try:
+            await self.start()
+        except Exception as exc:
+            self.errors.append(f"connect: {type(exc).__name__}: {exc}")
+            return self
+        if self.tree is None:
+            return self
+        for _ in range(actions):
+            if think_seconds:
+                await asyncio.sleep(self.rng.uniform(0, think_seconds))
+            await getattr(self, self.rng.choices(names, weights)[0])()
+            if self.tree is None:
+                break
+        return self
+
+
+def prepare_workspace(source: str, workdir: str) -> tuple[str, str]:
+    # The app gets its own copy of the calculators; the stand-in serves another
+    # copy laid out like the repository, so uploads saved to "GitHub" come back
+    # on the next sync.
+    local = os.path.join(workdir, "app")
+    remote = os.path.join(workdir, "remote")
+    shutil.copytree(source, os.path.join(local, "calculators"), ignore=_SCRATCH_IGNORE)
+    shutil.copytree(source, os.path.join(remote, github_sync.GITHUB_CALCULATORS_DIR), ignore=_SCRATCH_IGNORE)
+    return local, remote
+
+
+def start_app_server(app_dir: str, api_url: str, port: int, log_path: str):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tr_app.py")
+    env = dict(os.environ, GITHUB_API_URL=api_url, GITHUB_TOKEN=LOADTEST_TOKEN)
+    command = [
+        sys.executable, "-m", "streamlit", "run", script,
+        "--server.headless", "true",
+        "--server.address", "127.0.0.1",
+        "--server.port", str(port),
+        "--server.fileWatcherType", "none",
+        "--server.enableXsrfProtection", "false",
+        "--server.disconnectedSessionTTL", "0",
+        "--browser.gatherUsageStats", "false",
+    ]  # fmt: skip
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(command, cwd=app_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + LOADTEST_SERVER_START_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Streamlit exited with status {process.returncode}; see {log_path}")
+        try:
+            with request.urlopen(f"{base_url}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process, base_url
+        except (error.URLError, OSError):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Streamlit did not start within {LOADTEST_SERVER_START_SECONDS:.0f} s; see {log_path}")
+
+
+def _quantile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarise(samples: list) -> dict:
+    by_action = {}
+    for sample in samples:
+        by_action.setdefault(sample[0], []).append(sample)
+    by_action["all reruns"] = [sample for sample in samples if sample[0] not in {"upload_transfer", "job_wait"}]
+    rows = {}
+    for action, group in by_action.items():
+        if not group:
+            continue
+        ordered = sorted(elapsed for _action, elapsed, _size, _fragment in group)
+        rows[action] = {
+            "count": len(ordered),
+            "mean": statistics.fmean(ordered),
+            "p50": _quantile(ordered, 0.5),
+            "p95": _quantile(ordered, 0.95),
+            "p99": _quantile(ordered, 0.99),
+            "max": ordered[-1],
+            "mean_bytes": statistics.fmean(size for _action, _elapsed, size, _fragment in group),
+            "fragment_share": sum(fragment for _action, _elapsed, _size, fragment in group) / len(group),
+        }
+    return rows
+
+
+async def _drive(base_url, pid, sessions, actions, think_seconds, ramp_seconds, seed, timeout) -> dict:
+    # One untimed session warms imports and caches so the baseline memory
+    # reading reflects a server that has already served a page.
+    warmup = await LoadSession(-1, base_url, seed, timeout).play(2, 0.0)
+    await warmup.close()
+    await asyncio.sleep(1.0)
+    rss_before = process_rss(pid)
+    rss_samples = []
+
+    async def sample_memory():
+        while True:
+            rss_samples.append(process_rss(pid))
+            await asyncio.sleep(LOADTEST_MEMORY_SAMPLE_SECONDS)
+
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    finished = await asyncio.gather(
+        *(
+            LoadSession(number, base_url, seed, timeout).play(actions, think_seconds, ramp_seconds * number / sessions)
+            for number in range(sessions)
+        )
+    )
+    wall = time.perf_counter() - started
+    rss_with_sessions = process_rss(pid)
+    sampler.cancel()
+    for session in finished:
+        await session.close()
+    # disconnectedSessionTTL is 0, so closed sessions are dropped promptly.
+    await asyncio.sleep(2.0)
+    rss_after = process_rss(pid)
+
+    samples = [sample for session in finished for sample in session.samples]
+    memory = {"rss_before": rss_before, "rss_peak": None, "rss_with_sessions": rss_with_sessions, "rss_after_close": rss_after}
+    if rss_before is not None and rss_with_sessions is not None:
+        memory["rss_peak"] = max([value for value in rss_samples if value is not None] + [rss_with_sessions])
+        memory["per_session"] = (rss_with_sessions - rss_before) / sessions
+        memory["retained_per_session"] = (rss_after - rss_before) / sessions
+    return {
+        "sessions": sessions,
+        "actions_per_session": actions,
+        "wall_seconds": wall,
+        "reruns_per_second": len(samples) / wall if wall else 0.0,
+        "latency": summarise(samples),
+        "memory": memory,
+        "uploads": sum(session.uploads for session in finished),
+        "errors": [f"session {session.number}: {message}" for session in finished for message in session.errors],
+    }
+
+
+def run_load_test(
+    source: str,
+    sessions: int = LOADTEST_SESSIONS,
+    actions: int = LOADTEST_ACTIONS,
+    think_seconds: float = LOADTEST_THINK_SECONDS,
+    ramp_seconds: float = 0.0,
+    seed: int = 0,
+    standin_latency: float = 0.0,
+    timeout: float = LOADTEST_RUN_TIMEOUT,
+    keep_workdir: bool = False,
+) -> dict:
+    workdir = tempfile.mkdtemp(prefix="calculator-loadtest-")
+    standin = process = None
+    try:
+        local, remote = prepare_workspace(os.path.abspath(source), workdir)
+        standin, api_url = start_standin_server(remote, latency=standin_latency)
+        process, base_url = start_app_server(local, api_url, _free_port(), os.path.join(workdir, "streamlit.log"))
+        report = asyncio.run(_drive(base_url, process.pid, sessions, actions, think_seconds, ramp_seconds, seed, timeout))
+        report["standin_requests"] = dict(standin.state.requests_by_route)
+        report["workdir"] = workdir if keep_workdir else None
+        return report
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if standin is not None:
+            standin.shutdown()
+            standin.server_close()
+        if not keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _megabytes(value) -> str:
+    return "n/a" if value is None else f"{value / 2**20:.1f} MB"
+
+
+def print_report(report: dict, out=sys.stdout):
+    print(
+        f"{report['sessions']} sessions x {report['actions_per_session']} actions in {report['wall_seconds']:.1f} s "
+        f"({report['reruns_per_second']:.1f} reruns/s)",
+        file=out,
+    )
+    print(
+        f"{'action':<16} {'count':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} "
+        f"{'KB/run':>8} {'fragment':>8}",
+        file=out,
+    )
+    for action, row in report["latency"].items():
+        print(
+            f"{action:<16} {row['count']:>6} {row['mean'] * 1000:>9.1f} {row['p50'] * 1000:>9.1f} "
+            f"{row['p95'] * 1000:>9.1f} {row['p99'] * 1000:>9.1f} {row['max'] * 1000:>9.1f} "
+            f"{row['mean_bytes'] / 1024:>8.1f} {row['fragment_share']:>8.0%}",
+            file=out,
+        )
+    memory = report["memory"]
+    line = (
+        f"Server RSS {_megabytes(memory['rss_before'])} before, {_megabytes(memory['rss_peak'])} peak, "
+        f"{_megabytes(memory['rss_with_sessions'])} with sessions open, {_megabytes(memory['rss_after_close'])} after close"
+    )
+    if "per_session" in memory:
+        line += f"; {memory['per_session'] / 2**10:.0f} KB per session, {memory['retained_per_session'] / 2**10:.0f} KB retained"
+    print(line, file=out)
+    routes = ", ".join(f"{route} {count}" for route, count in sorted(report["standin_requests"].items())) or "none"
+    print(f"{report['uploads']} uploads; GitHub stand-in requests: {routes}", file=out)
+    if report.get("workdir"):
+        print(f"Workspace kept at {report['workdir']}", file=out)
+    print(f"{len(report['errors'])} errors", file=out)
+    for message in report["errors"][:20]:
+        print(f"  {message}", file=out)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit app with concurrent sessions.")
+    parser.add_argument("--root", default="calculators", help="Calculators to copy into the scratch workspace.")
+    parser.add_argument("--sessions", type=int, default=LOADTEST_SESSIONS)
+    parser.add_argument("--actions", type=int, default=LOADTEST_ACTIONS, help="Interactions per session.")
+    parser.add_argument("--think", type=float, default=LOADTEST_THINK_SECONDS, help="Maximum pause between interactions.")
+    parser.add_argument("--ramp", type=float, default=0.0, help="Seconds over which sessions connect.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--standin-latency", type=float, default=0.0, help="Seconds the GitHub stand-in waits per response.")
+    parser.add_argument("--timeout", type=float, default=LOADTEST_RUN_TIMEOUT, help="Seconds allowed per rerun.")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the scratch workspace and server log.")
+    parser.add_argument("--json", default=None, help="Also write the report to this file.")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(
+        args.root,
+        args.sessions,
+        args.actions,
+        args.think,
+        args.ramp,
+        args.seed,
+        args.standin_latency,
+        args.timeout,
+        args.keep_workdir,
+    )
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
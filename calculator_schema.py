@@ -0,0 +1,236 @@
+import json
+import numbers
+
+from calculator_engine import RANGE_OPS, discard_calculator_sidecar, range_bounds, write_calculator_sidecar
+
+# Structural checks for calculator JSON. Errors are reported as
+# "<location>: <problem>" with locations like rules[2].conditions[0].value, so
+# an upload or sync can point at the exact field that is wrong.
+INPUT_TYPES = ("select", "number", "text")
+CONDITION_OPS = ("equals", "not_equals", *RANGE_OPS)
+JOIN_OPERATORS = ("AND", "OR")
+MESSAGE_LEVELS = ("success", "info", "warning", "error")
+SCORING_MODES = ("signed", "unsigned")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _check_message(item: dict, where: str, errors: list, required: bool = True):
+    level = item.get("level", "info")
+    if level not in MESSAGE_LEVELS:
+        errors.append(f"{where}.level: {level!r} is not one of {', '.join(MESSAGE_LEVELS)}")
+    message = item.get("message")
+    if message is None and not required:
+        return
+    if not isinstance(message, str) or not message.strip():
+        errors.append(f"{where}.message: expected a non-empty string")
+
+
+def _check_value(value, input_spec: dict, where: str, errors: list):
+    input_type = input_spec.get("type", "select")
+    if input_type == "select":
+        options = input_spec.get("options") or [""]
+        if isinstance(options, list) and value not in options:
+            errors.append(f"{where}: {value!r} is not an option of input {input_spec.get('id')!r}")
+    elif input_type == "number" and not _is_number(value):
+        errors.append(f"{where}: expected a number for input {input_spec.get('id')!r}, got {value!r}")
+
+
+def _check_range(op: str, value, input_spec: dict, where: str, errors: list):
+    # where points at the condition or band; ranges only apply to number inputs.
+    if input_spec.get("type", "select") != "number":
+        errors.append(f"{where}.op: {op!r} needs a number input, but {input_spec.get('id')!r} is not one")
+    elif range_bounds(op, value) is None:
+        expected = "[low, high] with low <= high" if op == "between" else "a number"
+        errors.append(f"{where}.value: expected {expected} for {op!r}, got {value!r}")
+
+
+def _check_conditions(conditions, inputs: dict, where: str, errors: list):
+    if not isinstance(conditions, list):
+        errors.append(f"{where}: expected a list")
+        return
+    for cidx, cond in enumerate(conditions):
+        at = f"{where}[{cidx}]"
+        if not isinstance(cond, dict):
+            errors.append(f"{at}: expected an object")
+            continue
+        input_id = cond.get("input_id")
+        if input_id not in inputs:
+            errors.append(f"{at}.input_id: {input_id!r} is not a declared input")
+        op = str(cond.get("op", "equals")).strip().lower()
+        if op not in CONDITION_OPS:
+            errors.append(f"{at}.op: {cond.get('op')!r} is not one of {', '.join(CONDITION_OPS)}")
+        if "value" not in cond:
+            errors.append(f"{at}.value: missing")
+        elif input_id in inputs and op in RANGE_OPS:
+            _check_range(op, cond["value"], inputs[input_id], at, errors)
+        elif input_id in inputs:
+            _check_value(cond["value"], inputs[input_id], f"{at}.value", errors)
+        join = cond.get("join_with_previous")
+        if join is not None and str(join).strip().upper() not in JOIN_OPERATORS:
+            errors.append(f"{at}.join_with_previous: {join!r} is not AND or OR")
+
+
+def _check_inputs(raw_inputs, errors: list) -> dict:
+    inputs = {}
+    if not isinstance(raw_inputs, list):
+        errors.append("inputs: expected a list")
+        return inputs
+    for iidx, item in enumerate(raw_inputs):
+        at = f"inputs[{iidx}]"
+        if not isinstance(item, dict):
+            errors.append(f"{at}: expected an object")
+            continue
+        input_id = item.get("id")
+        if not isinstance(input_id, str) or not input_id.strip():
+            errors.append(f"{at}.id: expected a non-empty string")
+            continue
+        if input_id in inputs:
+            errors.append(f"{at}.id: duplicate input id {input_id!r}")
+        inputs[input_id] = item
+        input_type = item.get("type", "select")
+        if input_type not in INPUT_TYPES:
+            errors.append(f"{at}.type: {input_type!r} is not one of {', '.join(INPUT_TYPES)}")
+        options = item.get("options")
+        if input_type == "select":
+            if not isinstance(options, list) or not options:
+                errors.append(f"{at}.options: a select input needs a non-empty list of options")
+            elif len({json.dumps(option, sort_keys=True) for option in options}) != len(options):
+                errors.append(f"{at}.options: duplicate options")
+    return inputs
+
+
+def _check_guideline_image(image, errors: list):
+    if isinstance(image, str):
+        return
+    if isinstance(image, dict):
+        if not any(isinstance(image.get(key), str) and image.get(key) for key in ("raw_url", "url", "github_path", "path")):
+            errors.append("guideline_image: expected one of raw_url, url, github_path or path")
+        return
+    errors.append("guideline_image: expected a string or an object")
+
+
+def validate_calculator(data) -> list[str]:
+    if not isinstance(data, dict):
+        return ["calculator: expected a JSON object"]
+    errors = []
+    if "name" in data and not isinstance(data["name"], str):
+        errors.append("name: expected a string")
+    inputs = _check_inputs(data.get("inputs"), errors)
+
+    rules = data.get("rules") or []
+    if not isinstance(rules, list):
+        errors.append("rules: expected a list")
+        rules = []
+    for ridx, rule in enumerate(rules):
+        at = f"rules[{ridx}]"
+        if not isinstance(rule, dict):
+            errors.append(f"{at}: expected an object")
+            continue
+        _check_message(rule, at, errors)
+        operator = rule.get("condition_operator")
+        if operator is not None and str(operator).strip().upper() not in JOIN_OPERATORS:
+            errors.append(f"{at}.condition_operator: {operator!r} is not AND or OR")
+        _check_conditions(rule.get("conditions", []), inputs, f"{at}.conditions", errors)
+
+    scoring_mode = data.get("scoring_mode", "signed")
+    if scoring_mode not in SCORING_MODES:
+        errors.append(f"scoring_mode: {scoring_mode!r} is not one of {', '.join(SCORING_MODES)}")
+    scoring_rules = data.get("scoring_rules") or []
+    if not isinstance(scoring_rules, list):
+        errors.append("scoring_rules: expected a list")
+        scoring_rules = []
+    for sidx, rule in enumerate(scoring_rules):
+        at = f"scoring_rules[{sidx}]"
+        if not isinstance(rule, dict):
+            errors.append(f"{at}: expected an object")
+            continue
+        input_id = rule.get("input_id")
+        if input_id not in inputs:
+            errors.append(f"{at}.input_id: {input_id!r} is not a declared input")
+        for key in ("favor_values", "against_values"):
+            listed = rule.get(key, [])
+            if not isinstance(listed, list):
+                errors.append(f"{at}.{key}: expected a list")
+            elif input_id in inputs:
+                for vidx, value in enumerate(listed):
+                    _check_value(value, inputs[input_id], f"{at}.{key}[{vidx}]", errors)
+        for key in ("favor_ranges", "against_ranges"):
+            bands = rule.get(key, [])
+            if not isinstance(bands, list):
+                errors.append(f"{at}.{key}: expected a list")
+                continue
+            for bidx, band in enumerate(bands):
+                if not isinstance(band, dict):
+                    errors.append(f"{at}.{key}[{bidx}]: expected an object with op and value")
+                    continue
+                op = str(band.get("op", "")).strip().lower()
+                if op not in RANGE_OPS:
+                    errors.append(f"{at}.{key}[{bidx}].op: {band.get('op')!r} is not one of {', '.join(RANGE_OPS)}")
+                elif input_id in inputs:
+                    _check_range(op, band.get("value"), inputs[input_id], f"{at}.{key}[{bidx}]", errors)
+        weight = rule.get("weight", 1)
+        if weight is not None and not _is_number(weight):
+            errors.append(f"{at}.weight: expected a number, got {weight!r}")
+        if not isinstance(rule.get("invert_favor", False), bool):
+            errors.append(f"{at}.invert_favor: expected true or false")
+
+    recommendations = data.get("scoring_recommendations") or []
+    if not isinstance(recommendations, list):
+        errors.append("scoring_recommendations: expected a list")
+        recommendations = []
+    for sidx, item in enumerate(recommendations):
+        at = f"scoring_recommendations[{sidx}]"
+        if not isinstance(item, dict):
+            errors.append(f"{at}: expected an object")
+            continue
+        try:
+            int(item.get("min_score"))
+        except (TypeError, ValueError):
+            errors.append(f"{at}.min_score: expected an integer, got {item.get('min_score')!r}")
+        _check_message(item, at, errors)
+        _check_conditions(item.get("conditions", []), inputs, f"{at}.conditions", errors)
+
+    if data.get("guideline_image"):
+        _check_guideline_image(data["guideline_image"], errors)
+    fallback = data.get("fallback")
+    if fallback is not None:
+        if isinstance(fallback, dict):
+            _check_message(fallback, "fallback", errors)
+        else:
+            errors.append("fallback: expected an object")
+    return errors
+
+
+def parse_calculator(raw: bytes):
+    # Returns (data, errors); data is None when the bytes are not a JSON object.
+    try:
+        data = json.loads(raw.decode("utf-8"))
+    except UnicodeDecodeError as exc:
+        return None, [f"calculator: not UTF-8 ({exc.reason} at byte {exc.start})"]
+    except json.JSONDecodeError as exc:
+        return None, [f"line {exc.lineno}, column {exc.colno}: {exc.msg}"]
+    errors = validate_calculator(data)
+    return (data if isinstance(data, dict) else None), errors
+
+
+def compile_calculator_file(path: str) -> list[str]:
+    # Validates a calculator on disk and refreshes its compiled sidecar. Files
+    # that parse but fail validation still get a sidecar, since the catalog
+    # loads them either way; the errors are returned for the caller to report.
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError as exc:
+        return [f"calculator: {exc}"]
+    data, errors = parse_calculator(raw)
+    if data is None:
+        discard_calculator_sidecar(path)
+        return errors
+    try:
+        write_calculator_sidecar(path, data, raw)
+    except OSError:
+        pass
+    return errors
@@ -0,0 +1,317 @@
+import bisect
+import marshal
+import os
+import re
+import sys
+import threading
+from array import array
+
+import calculator_engine
+from calculator_engine import catalog_version, load_calculator, load_catalog
+from perf_metrics import timed
+
+# An inverted index over calculator text, kept in step with the catalog: when
+# the catalog version changes, only calculators whose hash changed are
+# re-indexed. The postings are persisted in SEARCH_INDEX_NAME (marshal) so a
+# restart does not reload every definition. Query tokens match exactly, as a
+# prefix, or within one edit of a term sharing their first character.
+SEARCH_INDEX_NAME = ".search_index"
+SEARCH_FIELD_WEIGHTS = {
+    "name": 8,
+    "category": 3,
+    "description": 2,
+    "label": 2,
+    "option": 1,
+    "message": 1,
+}
+PREFIX_MATCH_FACTOR = 0.7
+FUZZY_MATCH_FACTOR = 0.5
+FUZZY_MIN_LENGTH = 4
+MAX_EXPANSIONS = 64
+
+_TOKEN = re.compile(r"[^\W_]+")
+_FORMAT = (1, marshal.version, sys.version_info[:2])
+
+_LOCK = threading.RLock()
+_STATE = {
+    "root": None,
+    "version": None,
+    "docs": {},
+    "doc_ids": [],
+    "doc_terms": None,
+    "postings": {},
+    "sorted_terms": None,
+    "term_groups": None,
+    "dirty": False,
+}
+
+
+def tokenize(text) -> list[str]:
+    return _TOKEN.findall(str(text).casefold())
+
+
+def _add_text(terms: dict, text, field: str):
+    weight = SEARCH_FIELD_WEIGHTS[field]
+    for token in tokenize(text):
+        if terms.get(token, 0) < weight:
+            terms[token] = weight
+
+
+def document_terms(calc: dict) -> dict:
+    # Maps each term to the weight of the most important field it appears in.
+    tool = calc["data"]
+    terms = {}
+    _add_text(terms, calc["name"], "name")
+    _add_text(terms, f"{calc['category']} {calc['subcategory']}", "category")
+    _add_text(terms, tool.get("description", ""), "description")
+    for item in tool.get("inputs") or []:
+        if not isinstance(item, dict):
+            continue
+        _add_text(terms, item.get("label", ""), "label")
+        for option in item.get("options") or []:
+            _add_text(terms, option, "option")
+    for key in ("rules", "scoring_recommendations"):
+        for item in tool.get(key) or []:
+            if isinstance(item, dict):
+                _add_text(terms, item.get("message", ""), "message")
+    return terms
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    # One insertion, deletion, substitution or adjacent transposition.
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > 1:
+        return False
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1 :]
+    if i == len(a):
+        return True
+    if a[i + 1 :] == b[i + 1 :]:
+        return True
+    return i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2 :] == b[i + 2 :]
+
+
+def _doc_terms() -> dict:
+    # Terms per document number, needed only to retract a document; derived
+    # from the postings on first use after loading a persisted index.
+    if _STATE["doc_terms"] is None:
+        doc_terms = {}
+        for term, (docnos, _weights) in _STATE["postings"].items():
+            for docno in docnos:
+                doc_terms.setdefault(docno, []).append(term)
+        _STATE["doc_terms"] = doc_terms
+    return _STATE["doc_terms"]
+
+
+def _unindex_doc(calc_id: str):
+    doc = _STATE["docs"].pop(calc_id, None)
+    if doc is None:
+        return
+    docno = doc[0]
+    _STATE["doc_ids"][docno] = None
+    for term in _doc_terms().pop(docno, ()):
+        docnos, weights = _STATE["postings"][term]
+        position = docnos.index(docno)
+        del docnos[position]
+        del weights[position]
+        if not docnos:
+            del _STATE["postings"][term]
+            _STATE["sorted_terms"] = None
+
+
+def _index_doc(calc_id: str, digest: str, terms: dict):
+    _unindex_doc(calc_id)
+    docno = len(_STATE["doc_ids"])
+    _STATE["doc_ids"].append(calc_id)
+    _STATE["docs"][calc_id] = (docno, digest)
+    _doc_terms()[docno] = list(terms)
+    postings = _STATE["postings"]
+    for term, weight in terms.items():
+        entry = postings.get(term)
+        if entry is None:
+            entry = postings[term] = (array("I"), array("B"))
+            _STATE["sorted_terms"] = None
+        entry[0].append(docno)
+        entry[1].append(weight)
+
+
+def search_index_path() -> str:
+    return os.path.join(calculator_engine.CALCULATORS_DIR, SEARCH_INDEX_NAME)
+
+
+def _load_persisted():
+    # Postings are stored as raw array bytes per term, which unmarshal far
+    # faster than millions of small dict entries.
+    try:
+        with open(search_index_path(), "rb") as f:
+            persisted = marshal.load(f)
+        if persisted["format"] != _FORMAT:
+            return None
+        postings = {}
+        for term, (docno_bytes, weight_bytes) in persisted["postings"].items():
+            docnos, weights = array("I"), array("B")
+            docnos.frombytes(docno_bytes)
+            weights.frombytes(weight_bytes)
+            postings[term] = (docnos, weights)
+        return persisted["docs"], persisted["doc_ids"], postings
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        return None
+
+
+def _save_persisted():
+    if not _STATE["dirty"]:
+        return
+    _STATE["dirty"] = False
+    # Compact away retracted document numbers before writing.
+    if len(_STATE["doc_ids"]) > len(_STATE["docs"]):
+        _reindex_compact()
+    payload = {
+        "format": _FORMAT,
+        "docs": _STATE["docs"],
+        "doc_ids": _STATE["doc_ids"],
+        "postings": {term: (docnos.tobytes(), weights.tobytes()) for term, (docnos, weights) in _STATE["postings"].items()},
+    }
+    dest = search_index_path()
+    tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            marshal.dump(payload, f)
+        os.replace(tmp, dest)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def _reindex_compact():
+    renumber = {}
+    doc_ids = []
+    for docno, calc_id in enumerate(_STATE["doc_ids"]):
+        if calc_id is not None:
+            renumber[docno] = len(doc_ids)
+            doc_ids.append(calc_id)
+    for term, (docnos, _weights) in _STATE["postings"].items():
+        for position, docno in enumerate(docnos):
+            docnos[position] = renumber[docno]
+    _STATE["docs"] = {calc_id: (renumber[docno], digest) for calc_id, (docno, digest) in _STATE["docs"].items()}
+    _STATE["doc_ids"] = doc_ids
+    _STATE["doc_terms"] = None
+
+
+def _reset(root: str):
+    persisted = _load_persisted()
+    docs, doc_ids, postings = persisted if persisted else ({}, [], {})
+    _STATE.update(
+        root=root,
+        version=None,
+        docs=docs,
+        doc_ids=doc_ids,
+        doc_terms=None if persisted else {},
+        postings=postings,
+        sorted_terms=None,
+        dirty=False,
+    )
+
+
+def refresh_search_index() -> list[dict]:
+    # Brings the index in line with the catalog and returns the catalog.
+    catalog = load_catalog()
+    version = catalog_version()
+    with _LOCK:
+        if _STATE["root"] != calculator_engine.CALCULATORS_DIR:
+            _reset(calculator_engine.CALCULATORS_DIR)
+        if _STATE["version"] == version:
+            return catalog
+        current = {calc["id"]: calc for calc in catalog}
+        for calc_id in [calc_id for calc_id in _STATE["docs"] if calc_id not in current]:
+            _unindex_doc(calc_id)
+            _STATE["dirty"] = True
+        for calc_id, entry in current.items():
+            doc = _STATE["docs"].get(calc_id)
+            if doc is not None and doc[1] == entry["hash"]:
+                continue
+            calc = load_calculator(calc_id)
+            if calc is None:
+                continue
+            _index_doc(calc_id, calc["hash"], document_terms(calc))
+            _STATE["dirty"] = True
+        _STATE["version"] = version
+        _save_persisted()
+    return catalog
+
+
+def _sorted_terms() -> list:
+    if _STATE["sorted_terms"] is None:
+        _STATE["sorted_terms"] = sorted(_STATE["postings"])
+        groups = {}
+        for term in _STATE["sorted_terms"]:
+            groups.setdefault((term[0], len(term)), []).append(term)
+        _STATE["term_groups"] = groups
+    return _STATE["sorted_terms"]
+
+
+def _fuzzy_terms(token: str) -> list:
+    _sorted_terms()
+    groups = _STATE["term_groups"]
+    found = []
+    for length in (len(token) - 1, len(token), len(token) + 1):
+        for term in groups.get((token[0], length), ()):
+            if _within_one_edit(token, term):
+                found.append(term)
+    return found
+
+
+def _token_scores(token: str) -> dict:
+    # Best score per document for one query token across its expansions.
+    postings = _STATE["postings"]
+    expansions = {}
+    if token in postings:
+        expansions[token] = 1.0
+    terms = _sorted_terms()
+    start = bisect.bisect_left(terms, token)
+    for term in terms[start : start + MAX_EXPANSIONS]:
+        if not term.startswith(token):
+            break
+        expansions.setdefault(term, PREFIX_MATCH_FACTOR)
+    if len(token) >= FUZZY_MIN_LENGTH:
+        for term in _fuzzy_terms(token):
+            expansions.setdefault(term, FUZZY_MATCH_FACTOR)
+    scores = {}
+    for term, factor in expansions.items():
+        docnos, weights = postings[term]
+        for docno, weight in zip(docnos, weights):
+            score = weight * factor
+            if score > scores.get(docno, 0.0):
+                scores[docno] = score
+    return scores
+
+
+@timed("search.query")
+def search_calculators(query: str, limit: int = 50) -> list[dict]:
+    # Catalog entries matching every query token, best first.
+    catalog = refresh_search_index()
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+    with _LOCK:
+        totals = None
+        for token in sorted(tokens, key=len, reverse=True):
+            scores = _token_scores(token)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {docno: total + scores[docno] for docno, total in totals.items() if docno in scores}
+            if not totals:
+                return []
+        ranked = [(total, _STATE["doc_ids"][docno]) for docno, total in totals.items()]
+    by_id = {calc["id"]: calc for calc in catalog}
+    ranked = sorted(
+        ((total, calc_id) for total, calc_id in ranked if calc_id in by_id),
+        key=lambda item: (-item[0], by_id[item[1]]["name"]),
+    )
+    return [by_id[calc_id] for _total, calc_id in ranked[:limit]]
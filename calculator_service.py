@@ -0,0 +1,354 @@
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import json
+import os
+import sys
+
+import calculator_engine
+import perf_metrics
+from calculator_engine import build_label_maps, build_decision_tree_graph, load_calculator
+from outcome_tables import evaluate_outcome, outcome_space, outcome_space_size, precompile_outcome_table
+
+_IMPORTED = time.perf_counter()
+
+
+def summarise_result(result: dict) -> dict:
+    rule = result["rule"]
+    reco = result["score_recommendation"]
+    return {
+        "rule": None
+        if rule is None
+        else {"name": rule.get("name", ""), "level": rule.get("level", "info"), "message": rule.get("message", "")},
+        "plus": result["plus"],
+        "minus": result["minus"],
+        "total": result["total"],
+        "score_recommendation": None
+        if reco is None
+        else {"min_score": reco["min_score"], "level": reco["level"], "message": reco["message"]},
+    }
+
+
+def score(calc_id: str, values: dict, include_graph: bool = False) -> dict:
+    calc = load_calculator(calc_id)
+    if calc is None:
+        raise LookupError(f"Unknown calculator: {calc_id}")
+    tool = calc["data"]
+    payload = {"calculator": calc["id"], "hash": calc["hash"], **summarise_result(evaluate_outcome(calc, values))}
+    if include_graph:
+        id_to_label = build_label_maps(tool.get("inputs", []))
+        payload["decision_tree"] = build_decision_tree_graph(tool, id_to_label, values)
+    return payload
+
+
+def list_catalog() -> list[dict]:
+    return [
+        {key: calc[key] for key in ("id", "name", "category", "subcategory", "hash")}
+        for calc in calculator_engine.load_catalog()
+    ]
+
+
+def make_request_handler():
+    # http.server pulls in email/html/mimetypes; import it only when serving so
+    # the one-shot scoring path stays cheap to start.
+    from http.server import BaseHTTPRequestHandler
+
+    class ScoringRequestHandler(BaseHTTPRequestHandler):
+        server_version = "calculator-service"
+
+        def _send_json(self, status: int, payload):
+            self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+        def _send(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/healthz":
+                self._send_json(200, {"status": "ok"})
+            elif self.path == "/calculators":
+                self._send_json(200, list_catalog())
+            elif self.path == "/metrics":
+                self._send(200, perf_metrics.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4")
+            elif self.path == "/metrics.json":
+                self._send_json(200, perf_metrics.snapshot())
+            else:
+                self._send_json(404, {"error": "Not found."})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send_json(404, {"error": "Not found."})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                request_body = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                if not isinstance(request_body, dict):
+                    raise ValueError("the body must be a JSON object.")
+                calc_id = request_body["calculator"]
+                if not isinstance(calc_id, str):
+                    raise ValueError("calculator must be a string.")
+                values = request_body.get("values") or {}
+                if not isinstance(values, dict):
+                    raise ValueError("values must be a JSON object.")
+            except (KeyError, ValueError, UnicodeDecodeError) as exc:
+                self._send_json(400, {"error": f"Invalid request: {exc}"})
+                return
+            try:
+                with perf_metrics.span("service.score"):
+                    payload = score(calc_id, values, bool(request_body.get("decision_tree")))
+                self._send_json(200, payload)
+            except LookupError as exc:
+                self._send_json(404, {"error": str(exc)})
+
+        def log_message(self, format, *args):
+            if self.server.verbose:
+                super().log_message(format, *args)
+
+    return ScoringRequestHandler
+
+
+def serve(host: str, port: int, verbose: bool = False):
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), make_request_handler())
+    server.verbose = verbose
+    print(f"Serving calculators on http://{host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Score calculators without the Streamlit UI.")
+    parser.add_argument("--root", default=calculator_engine.CALCULATORS_DIR, help="Calculators directory.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    score_parser = subparsers.add_parser("score", help="Score one calculator.")
+    score_parser.add_argument("--calculator", required=True, help="Calculator id, e.g. Cardiac/Aortic/tool.json.")
+    score_parser.add_argument("--values", default="{}", help="Input values as a JSON object, or @file.json.")
+    score_parser.add_argument("--decision-tree", action="store_true", help="Include the DOT decision tree.")
+    score_parser.add_argument("--timings", action="store_true", help="Report cold-start timings on stderr.")
+
+    subparsers.add_parser("list", help="List available calculators.")
+
+    search_parser = subparsers.add_parser("search", help="Search calculators by text.")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=20)
+
+    validate_parser = subparsers.add_parser("validate", help="Check calculators against the schema.")
+    validate_parser.add_argument("--calculator", action="append", default=[], help="Calculator id; defaults to all.")
+
+    precompile_parser = subparsers.add_parser(
+        "precompile", help="Write compiled sidecars, and outcome tables for all-select calculators."
+    )
+    precompile_parser.add_argument("--max-combinations", type=int, default=None)
+
+    batch_parser = subparsers.add_parser("batch", help="Score a CSV or Parquet cohort.")
+    batch_parser.add_argument("--calculator", required=True)
+    batch_parser.add_argument("--input", required=True, help="CSV or Parquet file, one column per input id.")
+    batch_parser.add_argument("--output", required=True, help="CSV file to write results to.")
+    batch_parser.add_argument("--batch-size", type=int, default=50_000)
+    batch_parser.add_argument("--keep", action="append", default=[], help="Input column to copy to the output.")
+
+    import_parser = subparsers.add_parser("import", help="Import a zip or folder of calculators and guideline images.")
+    import_parser.add_argument("source", help="Zip file or folder. Paths starting with a category keep their place.")
+    import_parser.add_argument("--category", default="", help="Category for files outside a category folder.")
+    import_parser.add_argument("--subcategory", default="")
+    import_parser.add_argument("--overwrite", action="store_true", help="Replace calculators that already exist.")
+    import_parser.add_argument("--push", action="store_true", help="Also push the import to GitHub as one commit.")
+
+    usage_parser = subparsers.add_parser("usage", help="Recommendations per calculator per week from the evaluation log.")
+    usage_parser.add_argument("--log", default=None, help="Evaluation log database; defaults to $CALCULATOR_EVAL_LOG.")
+    usage_parser.add_argument("--calculator", default=None)
+    usage_parser.add_argument("--since", default=None, help="First day, YYYY-MM-DD.")
+    usage_parser.add_argument("--until", default=None, help="Day after the last, YYYY-MM-DD.")
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Write a warm-start snapshot for new app replicas.")
+    snapshot_parser.add_argument("--output", default=None, help="Snapshot file; defaults to $CALCULATOR_SNAPSHOT.")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve a JSON scoring endpoint.")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--verbose", action="store_true")
+    serve_parser.add_argument("--perf", action="store_true", help="Collect timings for GET /metrics.")
+    return parser
+
+
+def _read_values(raw: str) -> dict:
+    if raw.startswith("@"):
+        with open(raw[1:], "r", encoding="utf-8") as f:
+            raw = f.read()
+    values = json.loads(raw)
+    if not isinstance(values, dict):
+        raise ValueError("--values must be a JSON object.")
+    return values
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    calculator_engine.set_calculators_dir(args.root)
+
+    if args.command == "score":
+        try:
+            values = _read_values(args.values)
+        except (OSError, ValueError) as exc:
+            print(f"Invalid values: {exc}", file=sys.stderr)
+            return 2
+        loaded = time.perf_counter()
+        try:
+            payload = score(args.calculator, values, args.decision_tree)
+        except LookupError as exc:
+            print(str(exc), file=sys.stderr)
+            return 1
+        print(json.dumps(payload, indent=2))
+        if args.timings:
+            done = time.perf_counter()
+            timings = {
+                "import_ms": round((_IMPORTED - _STARTED) * 1000, 2),
+                "score_ms": round((done - loaded) * 1000, 2),
+                "total_ms": round((done - _STARTED) * 1000, 2),
+            }
+            print(json.dumps(timings), file=sys.stderr)
+        return 0
+
+    if args.command == "list":
+        print(json.dumps(list_catalog(), indent=2))
+        return 0
+
+    if args.command == "search":
+        from calculator_search import search_calculators
+
+        print(json.dumps([{key: calc[key] for key in ("id", "name", "category", "subcategory")} for calc in search_calculators(args.query, args.limit)], indent=2))
+        return 0
+
+    if args.command == "validate":
+        from calculator_schema import parse_calculator
+
+        if args.calculator:
+            paths = [os.path.join(calculator_engine.CALCULATORS_DIR, *calc_id.split("/")) for calc_id in args.calculator]
+        else:
+            paths = calculator_engine.calculator_paths()
+        invalid = 0
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    errors = parse_calculator(f.read())[1]
+            except OSError as exc:
+                errors = [str(exc)]
+            invalid += bool(errors)
+            for message in errors:
+                print(f"{os.path.relpath(path, calculator_engine.CALCULATORS_DIR)}: {message}")
+        print(f"{len(paths) - invalid} valid, {invalid} invalid.", file=sys.stderr)
+        return 1 if invalid else 0
+
+    if args.command == "precompile":
+        from calculator_schema import compile_calculator_file
+
+        for path in calculator_engine.calculator_paths():
+            for message in compile_calculator_file(path):
+                print(f"{os.path.relpath(path, calculator_engine.CALCULATORS_DIR)}: {message}", file=sys.stderr)
+        calculator_engine.invalidate_calculators()
+        for calc in calculator_engine.load_calculators():
+            space = outcome_space(calc["data"])
+            table = precompile_outcome_table(calc, args.max_combinations)
+            if table is not None:
+                status = f"table with {outcome_space_size(space)} outcomes"
+            elif space is None:
+                status = "skipped (not all-select)"
+            else:
+                status = f"skipped ({outcome_space_size(space)} outcomes over limit)"
+            print(f"{calc['id']}: {status}", file=sys.stderr)
+        return 0
+
+    if args.command == "batch":
+        import cohort_eval
+
+        calc = load_calculator(args.calculator)
+        if calc is None:
+            print(f"Unknown calculator: {args.calculator}", file=sys.stderr)
+            return 1
+        rows = cohort_eval.write_results_csv(calc["data"], args.input, args.output, args.batch_size, args.keep)
+        print(f"Scored {rows} rows.", file=sys.stderr)
+        return 0
+
+    if args.command == "usage":
+        from evaluation_log import EVAL_LOG_FILE, recommendation_distribution
+
+        path = args.log or EVAL_LOG_FILE
+        if not path:
+            print("No evaluation log: pass --log or set CALCULATOR_EVAL_LOG.", file=sys.stderr)
+            return 2
+        try:
+            rows = recommendation_distribution(args.calculator, args.since, args.until, path)
+        except ValueError as exc:
+            print(f"Invalid date: {exc}", file=sys.stderr)
+            return 2
+        print(json.dumps(rows, indent=2))
+        return 0
+
+    if args.command == "snapshot":
+        from warm_start import WARM_START_FILE, write_snapshot
+
+        output = args.output or WARM_START_FILE
+        try:
+            counts = write_snapshot(output)
+        except OSError as exc:
+            print(f"Cannot write {output}: {exc}", file=sys.stderr)
+            return 1
+        print(f"Wrote {output}: {counts['calculators']} calculators, {counts['images']} images, {counts['bytes']} bytes.", file=sys.stderr)
+        return 0
+
+    if args.command == "import":
+        import calculator_import
+
+        try:
+            if os.path.isdir(args.source):
+                files = calculator_import.read_import_folder(args.source)
+            else:
+                with open(args.source, "rb") as f:
+                    files = calculator_import.read_import_archive(f.read())
+        except (OSError, ValueError) as exc:
+            print(f"Cannot read {args.source}: {exc}", file=sys.stderr)
+            return 2
+        root = calculator_engine.CALCULATORS_DIR
+        # Existing top-level folders count as categories, so a zip of the tree imports in place.
+        categories = {args.category}
+        if os.path.isdir(root):
+            categories.update(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+        target_parts = [part for part in (args.category, args.subcategory) if part]
+        plan = calculator_import.plan_import(files, root, target_parts, categories, args.overwrite)
+        for message in plan["errors"]:
+            print(message, file=sys.stderr)
+        if plan["errors"]:
+            print(f"Nothing imported: {len(plan['errors'])} problems.", file=sys.stderr)
+            return 1
+        calculator_import.write_import(plan)
+        print(f"Imported {len(plan['calculators'])} calculators and {len(plan['images'])} guideline images; skipped {len(plan['skipped'])}.", file=sys.stderr)
+        if args.push:
+            from github_sync import commit_files
+
+            repo_files = calculator_import.import_repo_files(plan)
+            try:
+                result = commit_files(os.environ.get("GITHUB_TOKEN"), repo_files, f"Import {len(repo_files)} calculator files")
+            except Exception as exc:
+                print(f"GitHub push failed: {exc}", file=sys.stderr)
+                return 1
+            print(json.dumps(result))
+        return 0
+
+    if args.perf:
+        perf_metrics.set_enabled(True)
+    serve(args.host, args.port, args.verbose)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
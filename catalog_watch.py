@@ -0,0 +1,131 @@
+import os
+import threading
+
+import calculator_engine
+from calculator_engine import file_stamp, invalidate_calculators, set_catalog_watched
+from perf_metrics import count
+
+# One watcher per process turns file changes under the calculators directory
+# into dirty registry paths, so every session's next load_catalog refreshes
+# just those files instead of rescanning the tree. It uses watchdog (inotify on
+# Linux) when installed and otherwise diffs file stamps on a background thread.
+# Directory-level changes fall back to a full rescan.
+WATCH_POLL_SECONDS = 2.0
+_WATCHED_EVENTS = {"created", "modified", "deleted", "moved", "closed"}
+
+_WATCH_LOCK = threading.Lock()
+_WATCH = {"root": None, "mode": None, "observer": None, "stop": None}
+
+
+def _push(root: str, paths):
+    # Events from a watcher left over from a previous directory are ignored.
+    if root != calculator_engine.CALCULATORS_DIR:
+        return
+    count("catalog_watch.event")
+    if paths is None:
+        invalidate_calculators()
+        return
+    absolute_root = os.path.abspath(root)
+    invalidate_calculators(
+        os.path.join(root, os.path.relpath(os.path.abspath(path), absolute_root)) for path in paths if path.endswith(".json")
+    )
+
+
+def _start_observer(root: str):
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class CatalogEventHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.event_type not in _WATCHED_EVENTS:
+                return
+            if event.is_directory:
+                if event.event_type != "modified":
+                    _push(root, None)
+                return
+            paths = [os.fsdecode(event.src_path)]
+            if getattr(event, "dest_path", ""):
+                paths.append(os.fsdecode(event.dest_path))
+            _push(root, paths)
+
+    observer = Observer()
+    observer.daemon = True
+    try:
+        observer.schedule(CatalogEventHandler(), root, recursive=True)
+        observer.start()
+    except Exception:
+        return None
+    return observer
+
+
+def _stamp_tree(root: str) -> dict:
+    stamps = {}
+    pending = [root]
+    while pending:
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.name.endswith(".json"):
+                    stamps[entry.path] = file_stamp(entry.stat())
+            except OSError:
+                continue
+    return stamps
+
+
+def _poll(root: str, stamps: dict, stop: threading.Event, interval: float):
+    while not stop.wait(interval):
+        current = _stamp_tree(root)
+        changed = [path for path in stamps.keys() | current.keys() if stamps.get(path) != current.get(path)]
+        stamps = current
+        if changed:
+            _push(root, changed)
+
+
+def start_catalog_watcher(poll_seconds: float = WATCH_POLL_SECONDS) -> str:
+    # Idempotent; restarts when the calculators directory has changed. Returns
+    # "watchdog" or "polling".
+    root = calculator_engine.CALCULATORS_DIR
+    with _WATCH_LOCK:
+        if _WATCH["root"] == root:
+            set_catalog_watched(True)
+            return _WATCH["mode"]
+        _stop_locked()
+        observer = _start_observer(root)
+        if observer is not None:
+            _WATCH.update(root=root, mode="watchdog", observer=observer)
+        else:
+            stop = threading.Event()
+            args = (root, _stamp_tree(root), stop, poll_seconds)
+            threading.Thread(target=_poll, args=args, name="catalog-watch", daemon=True).start()
+            _WATCH.update(root=root, mode="polling", stop=stop)
+        # Changes made before the watcher started are caught by one full scan.
+        invalidate_calculators()
+        set_catalog_watched(True)
+        return _WATCH["mode"]
+
+
+def _stop_locked():
+    if _WATCH["observer"] is not None:
+        _WATCH["observer"].stop()
+    if _WATCH["stop"] is not None:
+        _WATCH["stop"].set()
+    if _WATCH["root"] is not None:
+        set_catalog_watched(False)
+    _WATCH.update(root=None, mode=None, observer=None, stop=None)
+
+
+def stop_catalog_watcher():
+    with _WATCH_LOCK:
+        _stop_locked()
+
+
+def catalog_watcher_mode() -> str | None:
+    return _WATCH["mode"]
@@ -0,0 +1,399 @@
+import csv
+import os
+
+import numpy as np
+
+from calculator_engine import RANGE_OPS, compile_rules, condition_op, in_range, range_bounds, range_points, range_samples
+
+DEFAULT_BATCH_SIZE = 50_000
+
+# Stands in for unhashable condition values: never equal to a table cell.
+_UNMATCHABLE = object()
+
+
+def _freeze(value):
+    try:
+        hash(value)
+    except TypeError:
+        return _UNMATCHABLE
+    return value
+
+
+def _add_vocab(vocab: dict, value):
+    value = _freeze(value)
+    if value is not _UNMATCHABLE and value not in vocab:
+        vocab[value] = len(vocab)
+
+
+def _collect_vocabularies(tool) -> dict:
+    vocabularies: dict = {}
+    input_types = {}
+    for item in tool.get("inputs", []):
+        input_id = item.get("id")
+        input_types[input_id] = item.get("type", "select")
+        vocab = vocabularies.setdefault(input_id, {})
+        for option in item.get("options", []) or []:
+            _add_vocab(vocab, option)
+    for rule in tool.get("rules", []) or []:
+        for cond in rule.get("conditions") or []:
+            _add_vocab(vocabularies.setdefault(cond.get("input_id"), {}), cond.get("value"))
+    for rule in tool.get("scoring_rules", []) or []:
+        vocab = vocabularies.setdefault(rule.get("input_id"), {})
+        for value in [*rule.get("favor_values", []), *rule.get("against_values", [])]:
+            _add_vocab(vocab, value)
+    for item in tool.get("scoring_recommendations", []) or []:
+        for cond in item.get("conditions", []) or []:
+            _add_vocab(vocabularies.setdefault(cond.get("input_id"), {}), cond.get("value"))
+    return {"vocab": vocabularies, "types": input_types}
+
+
+def _coerce_text(text, input_type, vocab):
+    # Table cells arrive as text; map them back onto the typed values used by the
+    # calculator so "1" matches 1 and number inputs compare as floats, like the UI.
+    if not isinstance(text, str) or text in vocab:
+        return text
+    if input_type == "number":
+        try:
+            return float(text)
+        except ValueError:
+            return text
+    for value in vocab:
+        if value is not None and not isinstance(value, str) and str(value) == text:
+            return value
+    return text
+
+
+def _numeric_column(column, input_type, n_rows):
+    # Range conditions read a float column, NaN where the cell is not a number;
+    # text cells count as numbers only for number inputs, like _coerce_text.
+    if column is None:
+        return np.full(n_rows, np.nan)
+    array = np.asarray(column)
+    if array.dtype.kind in "iuf":
+        return array.astype(np.float64)
+    try:
+        uniques, inverse = np.unique(array, return_inverse=True)
+    except TypeError:
+        uniques, inverse = array, np.arange(n_rows)
+    lookup = np.full(len(uniques) + 1, np.nan)
+    for uidx, value in enumerate(uniques.tolist()):
+        if isinstance(value, str) and input_type == "number":
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lookup[uidx] = value
+    return lookup[inverse.reshape(-1)]
+
+
+def _encode_column(column, input_id, plan, n_rows):
+    vocab = plan["vocab"].get(input_id, {})
+    input_type = plan["types"].get(input_id, "select")
+    if column is None:
+        return np.full(n_rows, vocab.get(None, -1), dtype=np.int32)
+    try:
+        uniques, inverse = np.unique(np.asarray(column), return_inverse=True)
+    except TypeError:
+        values = [_coerce_text(value, input_type, vocab) for value in column]
+        return np.fromiter((vocab.get(_freeze(value), -1) for value in values), dtype=np.int32, count=n_rows)
+    lookup = np.array(
+        [vocab.get(_freeze(_coerce_text(value, input_type, vocab)), -1) for value in uniques.tolist()] or [-1],
+        dtype=np.int32,
+    )
+    return lookup[inverse.reshape(-1)]
+
+
+def build_batch_plan(tool) -> dict:
+    plan = _collect_vocabularies(tool)
+    compiled = compile_rules(tool)
+    range_bounds_by_input: dict = {}
+
+    def range_condition(input_id, op, expected):
+        bounds = range_bounds(op, expected)
+        if bounds is None:
+            return (input_id, _UNMATCHABLE, "equals")
+        range_bounds_by_input.setdefault(input_id, set()).add(bounds)
+        return (input_id, bounds, "range")
+
+    slots_by_rule = [dict() for _ in compiled["rules"]]
+    for op, index in (("equals", compiled["eq"]), ("not_equals", compiled["ne"])):
+        for input_id, by_value in index.items():
+            for expected, slots in by_value.items():
+                for ridx, bit in slots:
+                    slots_by_rule[ridx][bit] = (input_id, expected, op)
+    for ridx, bit, input_id, _expected, is_not_equals in compiled["scan"]:
+        slots_by_rule[ridx][bit] = (input_id, _UNMATCHABLE, "not_equals" if is_not_equals else "equals")
+    for ridx, rule in enumerate(compiled["rules"]):
+        for cidx, cond in enumerate(rule.get("conditions") or []):
+            op = condition_op(cond)
+            if op in RANGE_OPS:
+                slots_by_rule[ridx][1 << cidx] = range_condition(cond.get("input_id"), op, cond.get("value"))
+
+    rules = []
+    for ridx, rule in enumerate(compiled["rules"]):
+        slots = slots_by_rule[ridx]
+        groups = [[slots[1 << cidx] for cidx in range(group.bit_length()) if group & (1 << cidx)] for group in compiled["groups"][ridx]]
+        rules.append({"conditions": list(slots.values()), "groups": groups, "size": compiled["sizes"][ridx]})
+    plan["rules"] = rules
+    plan["rule_objects"] = compiled["rules"]
+
+    scoring_rules = []
+    integral = True
+    for rule in tool.get("scoring_rules", []) or []:
+        input_id = rule.get("input_id")
+        if not input_id:
+            continue
+        weight = rule.get("weight", 1) or 1
+        integral = integral and isinstance(weight, int)
+        bands = {}
+        for key in ("favor_ranges", "against_ranges"):
+            conditions = [range_condition(input_id, condition_op(band), band.get("value")) for band in rule.get(key) or ()]
+            bands[key] = [expected for _input_id, expected, op in conditions if op == "range"]
+        scoring_rules.append(
+            {
+                "input_id": input_id,
+                "favor": [_freeze(v) for v in rule.get("favor_values", [])],
+                "against": [_freeze(v) for v in rule.get("against_values", [])],
+                "favor_ranges": bands["favor_ranges"],
+                "against_ranges": bands["against_ranges"],
+                "invert": bool(rule.get("invert_favor", False)),
+                "weight": weight,
+            }
+        )
+    plan["scoring_rules"] = scoring_rules
+    plan["score_dtype"] = np.int64 if integral else np.float64
+    plan["signed"] = tool.get("scoring_mode", "signed") == "signed"
+
+    recommendations = []
+    for item in tool.get("scoring_recommendations", []) or []:
+        try:
+            min_score = int(item.get("min_score"))
+        except (TypeError, ValueError):
+            continue
+        conditions = []
+        for cond in item.get("conditions", []) or []:
+            op = condition_op(cond)
+            if op in RANGE_OPS:
+                conditions.append(range_condition(cond.get("input_id"), op, cond.get("value")))
+            else:
+                conditions.append((cond.get("input_id"), _freeze(cond.get("value")), "not_equals" if op == "not_equals" else "equals"))
+        recommendations.append({"item": item, "min_score": min_score, "conditions": conditions})
+    plan["recommendations"] = recommendations
+    plan["ranges"] = {}
+    for input_id, bounds_set in range_bounds_by_input.items():
+        points = range_points(bounds_set)
+        plan["ranges"][input_id] = {"points": np.array(points, dtype=np.float64), "samples": range_samples(points)}
+    plan["columns"] = sorted(k for k in plan["vocab"] if isinstance(k, str))
+    return plan
+
+
+def _range_regions(points, numbers):
+    # The same pieces as calculator_engine.range_region, found with one
+    # searchsorted per column; -1 marks cells that are not numbers.
+    pidx = np.searchsorted(points, numbers, side="left")
+    on_point = np.zeros(len(numbers), dtype=bool)
+    if len(points):
+        on_point = (pidx < len(points)) & (points[np.minimum(pidx, len(points) - 1)] == numbers)
+    regions = 2 * pidx + on_point
+    regions[np.isnan(numbers)] = -1
+    return regions
+
+
+def _condition_matchers(plan, codes, numbers, n_rows):
+    # Equality masks are shared between every rule, scoring rule and threshold
+    # that tests the same (input_id, value) pair within a batch; range masks
+    # likewise per (input_id, bounds), through the input's breakpoint regions.
+    equal = {}
+    regions = {}
+
+    def in_bounds(input_id, bounds):
+        key = (input_id, bounds, "range")
+        mask = equal.get(key)
+        if mask is None:
+            index = plan["ranges"][input_id]
+            if input_id not in regions:
+                regions[input_id] = _range_regions(index["points"], numbers[input_id])
+            table = np.array([in_range(sample, bounds) for sample in index["samples"]] + [False], dtype=bool)
+            mask = equal[key] = table[regions[input_id]]
+        return mask
+
+    def match(input_id, expected, op):
+        if op == "range":
+            return in_bounds(input_id, expected)
+        key = (input_id, expected)
+        eq = equal.get(key)
+        if eq is None:
+            vocab = plan["vocab"].get(input_id, {})
+            code = vocab.get(expected, -2) if expected is not _UNMATCHABLE else -2
+            eq = codes[input_id] == code if input_id in codes else np.zeros(n_rows, dtype=bool)
+            equal[key] = eq
+        return ~eq if op == "not_equals" else eq
+
+    def isin(input_id, values):
+        vocab = plan["vocab"].get(input_id, {})
+        wanted = [vocab[v] for v in values if v is not _UNMATCHABLE and v in vocab]
+        if input_id not in codes or not wanted:
+            return np.zeros(n_rows, dtype=bool)
+        return np.isin(codes[input_id], wanted)
+
+    def in_bands(input_id, bands):
+        mask = np.zeros(n_rows, dtype=bool)
+        for bounds in bands:
+            mask |= in_bounds(input_id, bounds)
+        return mask
+
+    return match, isin, in_bands
+
+
+def _lookup(values, index):
+    table = np.empty(len(values) + 1, dtype=object)
+    table[:-1] = values
+    table[-1] = None
+    return table[index]
+
+
+def evaluate_batch(tool, columns, plan=None) -> dict:
+    plan = plan or build_batch_plan(tool)
+    n_rows = len(next(iter(columns.values()))) if columns else 0
+    codes = {input_id: _encode_column(columns.get(input_id), input_id, plan, n_rows) for input_id in plan["vocab"]}
+    numbers = {
+        input_id: _numeric_column(columns.get(input_id), plan["types"].get(input_id, "select"), n_rows)
+        for input_id in plan["ranges"]
+    }
+    match, isin, in_bands = _condition_matchers(plan, codes, numbers, n_rows)
+
+    best_index = np.full(n_rows, -1, dtype=np.int32)
+    best_count = np.zeros(n_rows, dtype=np.int32)
+    best_ratio = np.zeros(n_rows, dtype=np.float64)
+    best_total = np.zeros(n_rows, dtype=np.int32)
+    for ridx, rule in enumerate(plan["rules"]):
+        if not rule["size"]:
+            continue
+        is_match = np.zeros(n_rows, dtype=bool)
+        for group in rule["groups"]:
+            group_match = np.ones(n_rows, dtype=bool)
+            for cond in group:
+                group_match &= match(*cond)
+            is_match |= group_match
+        if not is_match.any():
+            continue
+        matched = np.zeros(n_rows, dtype=np.int32)
+        for cond in rule["conditions"]:
+            matched += match(*cond)
+        ratio = matched / rule["size"]
+        # Same order-dependent tie-breaking as evaluate_rules, applied row-wise.
+        full_override = is_match & (ratio == 1.0) & (best_ratio == 1.0) & (rule["size"] > best_total)
+        better = (matched > best_count) | ((matched == best_count) & (ratio > best_ratio))
+        update = full_override | (is_match & ~full_override & better)
+        best_index[update] = ridx
+        best_count[update] = matched[update]
+        best_ratio[update] = ratio[update]
+        best_total[update] = rule["size"]
+
+    dtype = plan["score_dtype"]
+    plus = np.zeros(n_rows, dtype=dtype)
+    minus = np.zeros(n_rows, dtype=dtype)
+    for rule in plan["scoring_rules"]:
+        favor = isin(rule["input_id"], rule["favor"]) | in_bands(rule["input_id"], rule["favor_ranges"])
+        against = (isin(rule["input_id"], rule["against"]) | in_bands(rule["input_id"], rule["against_ranges"])) & ~favor
+        positive, negative = (against, favor) if rule["invert"] else (favor, against)
+        plus += positive * rule["weight"]
+        if plan["signed"]:
+            minus += negative * rule["weight"]
+    total = plus - minus if plan["signed"] else plus.copy()
+
+    score_index = np.full(n_rows, -1, dtype=np.int32)
+    score_min = np.zeros(n_rows, dtype=np.int64)
+    for sidx, reco in enumerate(plan["recommendations"]):
+        candidate = total >= reco["min_score"]
+        for input_id, expected, op in reco["conditions"]:
+            candidate &= match(input_id, expected, op)
+        update = candidate & ((score_index == -1) | (reco["min_score"] > score_min))
+        score_index[update] = sidx
+        score_min[update] = reco["min_score"]
+
+    rule_objects = plan["rule_objects"]
+    score_items = [reco["item"] for reco in plan["recommendations"]]
+    return {
+        "rule_index": best_index,
+        "rule_name": _lookup([rule.get("name") for rule in rule_objects], best_index),
+        "level": _lookup([rule.get("level", "info") for rule in rule_objects], best_index),
+        "message": _lookup([rule.get("message", "") for rule in rule_objects], best_index),
+        "plus": plus,
+        "minus": minus,
+        "total": total,
+        "score_index": score_index,
+        "score_level": _lookup([item.get("level", "info") for item in score_items], score_index),
+        "score_message": _lookup([item.get("message", "") for item in score_items], score_index),
+    }
+
+
+def iter_csv_batches(path: str, batch_size: int = DEFAULT_BATCH_SIZE, columns=None):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        keep = [i for i, name in enumerate(header) if columns is None or name in columns]
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) >= batch_size:
+                yield _transpose(header, keep, rows)
+                rows = []
+        if rows:
+            yield _transpose(header, keep, rows)
+
+
+def _transpose(header, keep, rows):
+    width = len(header)
+    rows = [row + [""] * (width - len(row)) if len(row) < width else row for row in rows]
+    transposed = list(zip(*rows))
+    return {header[i]: list(transposed[i]) for i in keep}
+
+
+def iter_parquet_batches(path: str, batch_size: int = DEFAULT_BATCH_SIZE, columns=None):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    names = set(parquet.schema_arrow.names)
+    wanted = [name for name in columns if name in names] if columns is not None else None
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=wanted):
+        yield {name: batch.column(name).to_numpy(zero_copy_only=False) for name in batch.schema.names}
+
+
+def iter_table_batches(path: str, batch_size: int = DEFAULT_BATCH_SIZE, columns=None):
+    if os.path.splitext(path)[1].lower() in {".parquet", ".pq"}:
+        return iter_parquet_batches(path, batch_size, columns)
+    return iter_csv_batches(path, batch_size, columns)
+
+
+def evaluate_table(tool, batches, keep_columns=()):
+    plan = build_batch_plan(tool)
+    for batch in batches:
+        result = evaluate_batch(tool, batch, plan)
+        for name in keep_columns:
+            if name in batch:
+                result[name] = batch[name]
+        yield result
+
+
+RESULT_COLUMNS = ["rule_index", "rule_name", "level", "message", "plus", "minus", "total", "score_level", "score_message"]
+
+
+def write_results_csv(tool, src_path: str, dest_path: str, batch_size: int = DEFAULT_BATCH_SIZE, keep_columns=()):
+    plan = build_batch_plan(tool)
+    columns = set(plan["columns"]) | set(keep_columns)
+    rows_written = 0
+    with open(dest_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        header = [*keep_columns, *RESULT_COLUMNS]
+        writer.writerow(header)
+        for batch in iter_table_batches(src_path, batch_size, columns):
+            result = evaluate_batch(tool, batch, plan)
+            for name in keep_columns:
+                result[name] = batch.get(name, [""] * len(result["rule_index"]))
+            writer.writerows(zip(*([("" if v is None else v) for v in result[name]] for name in header)))
+            rows_written += len(result["rule_index"])
+    return rows_written
@@ -0,0 +1,285 @@
+import atexit
+import datetime
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from perf_metrics import count
+
+# Opt-in audit log of the recommendations the app produces. Set
+# CALCULATOR_EVAL_LOG to a SQLite file (or call set_evaluation_log) to enable
+# it. log_evaluation only puts a tuple on a bounded queue; one background
+# writer drains it in batches into a WAL-mode database, one transaction per
+# batch. Each batch also bumps a weekly rollup keyed by calculator and outcome,
+# so distribution queries read a few rows per week rather than the raw log.
+EVAL_LOG_FILE = os.environ.get("CALCULATOR_EVAL_LOG") or None
+EVAL_LOG_QUEUE_SIZE = 10_000
+EVAL_LOG_BATCH_SIZE = 500
+EVAL_LOG_FLUSH_SECONDS = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY,
+    logged_at REAL NOT NULL,
+    week INTEGER NOT NULL,
+    calculator TEXT NOT NULL,
+    calculator_hash TEXT,
+    inputs TEXT NOT NULL,
+    rule_level TEXT,
+    rule_message TEXT,
+    score_level TEXT,
+    score_message TEXT,
+    plus REAL,
+    minus REAL,
+    total REAL,
+    duration_ms REAL
+);
+CREATE INDEX IF NOT EXISTS evaluations_calculator_time ON evaluations (calculator, logged_at);
+CREATE TABLE IF NOT EXISTS weekly_outcomes (
+    calculator TEXT NOT NULL,
+    week INTEGER NOT NULL,
+    rule_level TEXT NOT NULL,
+    rule_message TEXT NOT NULL,
+    score_message TEXT NOT NULL,
+    evaluations INTEGER NOT NULL,
+    PRIMARY KEY (calculator, week, rule_level, rule_message, score_message)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS weekly_outcomes_week ON weekly_outcomes (week);
+"""
+
+_STATE_LOCK = threading.Lock()
+_STATE = {"path": EVAL_LOG_FILE, "queue": None, "thread": None, "stopping": None}
+
+
+def _week(timestamp: float) -> int:
+    # Weeks start on Monday (UTC); week 0 holds 1970-01-01, a Thursday.
+    return (int(timestamp // 86400) + 3) // 7
+
+
+def week_start(week: int) -> str:
+    return (datetime.date(1970, 1, 1) + datetime.timedelta(days=week * 7 - 3)).isoformat()
+
+
+def _week_of(day) -> int:
+    if isinstance(day, str):
+        day = datetime.date.fromisoformat(day)
+    elif isinstance(day, datetime.datetime):
+        day = day.date()
+    return ((day - datetime.date(1970, 1, 1)).days + 3) // 7
+
+
+def _open(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _write_batch(conn: sqlite3.Connection, batch: list):
+    rows = []
+    rollup = Counter()
+    for logged_at, calc_id, calc_hash, values, rule, reco, scores, duration in batch:
+        week = _week(logged_at)
+        rule_level = rule.get("level", "info") if rule else None
+        rule_message = rule.get("message", "") if rule else None
+        score_level = reco.get("level") if reco else None
+        score_message = reco.get("message") if reco else None
+        inputs = json.dumps(values, sort_keys=True, default=str)
+        rows.append((logged_at, week, calc_id, calc_hash, inputs, rule_level, rule_message, score_level, score_message, *scores, duration))
+        rollup[(calc_id, week, rule_level or "", rule_message or "", score_message or "")] += 1
+    with conn:
+        conn.executemany(
+            "INSERT INTO evaluations (logged_at, week, calculator, calculator_hash, inputs, rule_level, rule_message,"
+            " score_level, score_message, plus, minus, total, duration_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.executemany(
+            "INSERT INTO weekly_outcomes VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (calculator, week, rule_level, rule_message,"
+            " score_message) DO UPDATE SET evaluations = evaluations + excluded.evaluations",
+            [(*key, n) for key, n in rollup.items()],
+        )
+
+
+def _writer(path: str, pending: queue.Queue, stopping: threading.Event):
+    conn = None
+    running = True
+    while running:
+        try:
+            item = pending.get(timeout=EVAL_LOG_FLUSH_SECONDS)
+        except queue.Empty:
+            if stopping.is_set():
+                break
+            continue
+        batch = []
+        flushed = []
+        while True:
+            if item is None:
+                running = False
+            elif isinstance(item, threading.Event):
+                flushed.append(item)
+            else:
+                batch.append(item)
+            if not running or len(batch) >= EVAL_LOG_BATCH_SIZE:
+                break
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                break
+        if batch:
+            try:
+                if conn is None:
+                    conn = _open(path)
+                _write_batch(conn, batch)
+                count("eval_log.written", len(batch))
+            except sqlite3.Error:
+                count("eval_log.failed", len(batch))
+                conn = None
+        for event in flushed:
+            event.set()
+    if conn is not None:
+        conn.close()
+
+
+def _queue_locked() -> queue.Queue | None:
+    if _STATE["path"] is None:
+        return None
+    if _STATE["thread"] is None:
+        _STATE["queue"] = queue.Queue(maxsize=EVAL_LOG_QUEUE_SIZE)
+        _STATE["stopping"] = threading.Event()
+        _STATE["thread"] = threading.Thread(
+            target=_writer, args=(_STATE["path"], _STATE["queue"], _STATE["stopping"]), name="evaluation-log", daemon=True
+        )
+        _STATE["thread"].start()
+    return _STATE["queue"]
+
+
+def evaluation_log_enabled() -> bool:
+    return _STATE["path"] is not None
+
+
+def log_evaluation(calc: dict, values: dict, result: dict, duration: float):
+    # Never blocks: when the writer falls behind and the queue is full, the
+    # evaluation is dropped and counted.
+    if _STATE["path"] is None:
+        return
+    with _STATE_LOCK:
+        pending = _queue_locked()
+    if pending is None:
+        return
+    item = (
+        time.time(),
+        calc["id"],
+        calc.get("hash"),
+        dict(values),
+        result["rule"],
+        result["score_recommendation"],
+        (result["plus"], result["minus"], result["total"]),
+        round(duration * 1000, 3),
+    )
+    try:
+        pending.put_nowait(item)
+    except queue.Full:
+        count("eval_log.dropped")
+
+
+def flush_evaluation_log(timeout: float = 10.0) -> bool:
+    # Waits until everything logged so far is written.
+    with _STATE_LOCK:
+        pending = _STATE["queue"] if _STATE["thread"] is not None else None
+    if pending is None:
+        return True
+    done = threading.Event()
+    try:
+        pending.put(done, timeout=timeout)
+    except queue.Full:
+        return False
+    return done.wait(timeout)
+
+
+def _stop_locked(timeout: float):
+    # Bounded, since _STATE_LOCK is held: if a stuck writer leaves no room for
+    # the stop marker, it exits on its own once the queue runs dry.
+    thread = _STATE["thread"]
+    if thread is not None:
+        _STATE["stopping"].set()
+        try:
+            _STATE["queue"].put(None, timeout=timeout)
+        except queue.Full:
+            count("eval_log.stop_timeouts")
+        else:
+            thread.join(timeout)
+    _STATE.update(queue=None, thread=None, stopping=None)
+
+
+def set_evaluation_log(path: str | None):
+    # Switches logging to another database, or off with None, after writing
+    # what is already queued.
+    with _STATE_LOCK:
+        _stop_locked(EVAL_LOG_FLUSH_SECONDS * 10)
+        _STATE["path"] = path
+
+
+def _close_at_exit():
+    with _STATE_LOCK:
+        _stop_locked(EVAL_LOG_FLUSH_SECONDS * 5)
+
+
+atexit.register(_close_at_exit)
+
+
+def _read(path: str | None, sql: str, params) -> list[sqlite3.Row]:
+    path = path or _STATE["path"]
+    if not path or not os.path.exists(path):
+        return []
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.row_factory = sqlite3.Row
+        return conn.execute(sql, params).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+def recommendation_distribution(calculator: str | None = None, since=None, until=None, path: str | None = None) -> list[dict]:
+    # Evaluations per calculator, week and outcome from the weekly rollup.
+    # since and until are dates (or ISO date strings); until is exclusive.
+    where = []
+    params = []
+    if calculator is not None:
+        where.append("calculator = ?")
+        params.append(calculator)
+    if since is not None:
+        where.append("week >= ?")
+        params.append(_week_of(since))
+    if until is not None:
+        where.append("week < ?")
+        params.append(_week_of(until))
+    sql = "SELECT calculator, week, rule_level, rule_message, score_message, evaluations FROM weekly_outcomes"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY calculator, week, evaluations DESC"
+    return [{**dict(row), "week": week_start(row["week"])} for row in _read(path, sql, params)]
+
+
+def recent_evaluations(calculator: str, limit: int = 100, before: float | None = None, path: str | None = None) -> list[dict]:
+    # Newest first; pass the last logged_at as before to page back through a
+    # calculator's history.
+    sql = "SELECT * FROM evaluations WHERE calculator = ?"
+    params = [calculator]
+    if before is not None:
+        sql += " AND logged_at < ?"
+        params.append(before)
+    sql += " ORDER BY logged_at DESC LIMIT ?"
+    params.append(limit)
+    rows = []
+    for row in _read(path, sql, params):
+        row = dict(row)
+        row["inputs"] = json.loads(row["inputs"])
+        rows.append(row)
+    return rows
@@ -0,0 +1,388 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from github_sync import git_blob_sha
+
+# A local stand-in for the parts of the GitHub REST API the app uses, serving a
+# directory as the tip of every branch. Point GITHUB_API_URL at it to exercise
+# sync, save, bulk import and image paths without network access. The Git data
+# API (ref, commits, blobs, trees) keeps only the head commit: a ref update
+# must fast-forward it and writes the new tree's changes into the directory.
+
+
+class StandinState:
+    def __init__(self, root: str, rate_limit_every: int = 0, latency: float = 0.0, rate_limit_status: int = 429, idle_timeout: float = 0.0):
+        self.root = os.path.abspath(root)
+        self.rate_limit_every = rate_limit_every
+        self.rate_limit_status = rate_limit_status
+        self.latency = latency
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.requests_by_route = {}
+        self.connections = set()
+        self.blobs = {}
+        self.created_blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.head = {"sha": hashlib.sha1(b"standin").hexdigest(), "tree": hashlib.sha1(b"standin tree").hexdigest()}
+
+    def advance(self, tree: str, message: str) -> str:
+        # Records a commit on top of the head; call with the lock held.
+        sha = hashlib.sha1(json.dumps([self.head["sha"], tree, message]).encode("utf-8")).hexdigest()
+        self.commits[sha] = {"tree": tree, "parents": [self.head["sha"]], "message": message}
+        self.head = {"sha": sha, "tree": tree}
+        return sha
+
+    def count(self, route: str, client) -> int:
+        with self.lock:
+            self.request_count += 1
+            self.requests_by_route[route] = self.requests_by_route.get(route, 0) + 1
+            self.connections.add(client)
+            return self.request_count
+
+    def files(self) -> dict:
+        found = {}
+        for root, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for filename in files:
+                if filename.startswith("."):
+                    continue
+                path = os.path.join(root, filename)
+                found[os.path.relpath(path, self.root).replace(os.sep, "/")] = path
+        return found
+
+    def blob_path(self, sha: str) -> str | None:
+        with self.lock:
+            path = self.blobs.get(sha)
+        if path is None:
+            index = {}
+            for candidate in self.files().values():
+                with open(candidate, "rb") as f:
+                    index[git_blob_sha(f.read())] = candidate
+            with self.lock:
+                self.blobs = index
+            path = index.get(sha)
+        return path
+
+    def resolve(self, repo_path: str) -> str | None:
+        path = os.path.abspath(os.path.join(self.root, *repo_path.split("/")))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            return None
+        return path
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "github-standin"
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self) -> StandinState:
+        return self.server.state
+
+    def setup(self):
+        # Like GitHub, hang up on a keep-alive connection left idle too long.
+        self.timeout = self.state.idle_timeout or None
+        super().setup()
+
+    def log_message(self, format, *args):
+        if getattr(self.server, "verbose", False):
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_not_modified(self, etag: str):
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _send_json(self, status: int, payload, headers: dict | None = None):
+        self._send(status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        segments = [unquote(s) for s in parts.path.strip("/").split("/")]
+        if len(segments) < 4 or segments[0] != "repos":
+            return None, segments, parse_qs(parts.query)
+        return "/".join(segments[3:5]) if segments[3] == "git" else segments[3], segments[3:], parse_qs(parts.query)
+
+    def _throttled(self, route: str) -> bool:
+        number = self.state.count(route, self.client_address)
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if self.state.rate_limit_every and number % self.state.rate_limit_every == 0:
+            # GitHub answers 429, or 403 with an exhausted quota and its reset time.
+            if self.state.rate_limit_status == 403:
+                headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()))}
+            else:
+                headers = {"Retry-After": "0"}
+            self._send_json(self.state.rate_limit_status, {"message": "API rate limit exceeded"}, headers)
+            return True
+        return False
+
+    def do_GET(self):
+        route, segments, query = self._route()
+        if route is None:
+            self._send_json(404, {"message": "Not Found"})
+            return
+        if self._throttled(route):
+            return
+        if route == "git/trees":
+            self._get_tree(query)
+        elif route == "git/blobs" and len(segments) == 3:
+            self._get_blob(segments[2])
+        elif route == "git/ref" and len(segments) == 4 and segments[2] == "heads":
+            with self.state.lock:
+                head = self.state.head["sha"]
+            self._send_json(200, {"ref": "/".join(["refs", *segments[2:]]), "object": {"sha": head, "type": "commit"}})
+        elif route == "git/commits" and len(segments) == 3:
+            with self.state.lock:
+                commit = self.state.commits.get(segments[2])
+                if commit is None and segments[2] == self.state.head["sha"]:
+                    commit = {"tree": self.state.head["tree"], "parents": [], "message": ""}
+            if commit is None:
+                self._send_json(404, {"message": "Not Found"})
+            else:
+                self._send_json(200, {"sha": segments[2], "tree": {"sha": commit["tree"]}, "message": commit["message"]})
+        elif route == "contents":
+            self._get_contents("/".join(segments[1:]))
+        else:
+            self._send_json(404, {"message": "Not Found"})
+
+    def _read_payload(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+
+    def do_POST(self):
+        route, _segments, _query = self._route()
+        if route not in {"git/blobs", "git/trees", "git/commits"}:
+            self._send_json(404, {"message": "Not Found"})
+            return
+        payload = self._read_payload()
+        if self._throttled(route):
+            return
+        if route == "git/blobs":
+            content = str(payload.get("content", ""))
+            data = base64.b64decode(content) if payload.get("encoding") == "base64" else content.encode("utf-8")
+            sha = git_blob_sha(data)
+            with self.state.lock:
+                self.state.created_blobs[sha] = data
+            self._send_json(201, {"sha": sha})
+        elif route == "git/trees":
+            entries = payload.get("tree")
+            if not isinstance(entries, list) or any(not self.state.resolve(str(entry.get("path", ""))) for entry in entries):
+                self._send_json(422, {"message": "Invalid tree"})
+                return
+            sha = hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+            with self.state.lock:
+                self.state.trees[sha] = {"base": payload.get("base_tree"), "entries": entries}
+            self._send_json(201, {"sha": sha})
+        else:
+            tree = payload.get("tree")
+            parents = payload.get("parents") or []
+            with self.state.lock:
+                if tree not in self.state.trees:
+                    self._send_json(422, {"message": "Tree not found"})
+                    return
+                sha = hashlib.sha1(json.dumps([parents, tree, payload.get("message")]).encode("utf-8")).hexdigest()
+                self.state.commits[sha] = {"tree": tree, "parents": parents, "message": payload.get("message", "")}
+            self._send_json(201, {"sha": sha, "tree": {"sha": tree}, "parents": [{"sha": parent} for parent in parents]})
+
+    def do_PATCH(self):
+        route, segments, _query = self._route()
+        if route != "git/refs" or len(segments) != 4 or segments[2] != "heads":
+            self._send_json(404, {"message": "Not Found"})
+            return
+        payload = self._read_payload()
+        if self._throttled(route):
+            return
+        with self.state.lock:
+            commit = self.state.commits.get(payload.get("sha"))
+            if commit is None:
+                self._send_json(422, {"message": "Object does not exist"})
+                return
+            tree = self.state.trees.get(commit["tree"])
+            if commit["parents"] != [self.state.head["sha"]] or tree is None or tree["base"] != self.state.head["tree"]:
+                self._send_json(422, {"message": "Update is not a fast forward"})
+                return
+            # None removes the path; blobs must have been created through the API.
+            changes = []
+            for entry in tree["entries"]:
+                if "content" in entry:
+                    data = str(entry["content"]).encode("utf-8")
+                elif entry.get("sha") is None:
+                    data = None
+                else:
+                    data = self.state.created_blobs.get(entry["sha"])
+                    if data is None:
+                        self._send_json(422, {"message": f"Blob {entry['sha']} does not exist"})
+                        return
+                changes.append((self.state.resolve(entry["path"]), data))
+            for path, data in changes:
+                if data is None:
+                    if os.path.isfile(path):
+                        os.remove(path)
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+            self.state.head = {"sha": payload["sha"], "tree": commit["tree"]}
+            self.state.blobs = {}
+        self._send_json(200, {"ref": "/".join(segments[1:]), "object": {"sha": payload["sha"], "type": "commit"}})
+
+    def do_PUT(self):
+        route, segments, _query = self._route()
+        if route != "contents":
+            self._send_json(404, {"message": "Not Found"})
+            return
+        # The body is read even when throttled so the keep-alive connection
+        # stays in step.
+        payload = self._read_payload()
+        if self._throttled(route):
+            return
+        repo_path = "/".join(segments[1:])
+        path = self.state.resolve(repo_path)
+        if path is None:
+            self._send_json(422, {"message": "Invalid path"})
+            return
+        with self.state.lock:
+            existing = None
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    existing = git_blob_sha(f.read())
+            if existing and payload.get("sha") != existing:
+                self._send_json(409, {"message": "sha does not match"})
+                return
+            data = base64.b64decode(payload.get("content", ""))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            tree = hashlib.sha1(json.dumps([self.state.head["tree"], repo_path, git_blob_sha(data)]).encode("utf-8")).hexdigest()
+            commit = self.state.advance(tree, str(payload.get("message", "")))
+        self._send_json(
+            201 if existing is None else 200,
+            {"content": {"path": repo_path, "sha": git_blob_sha(data)}, "commit": {"sha": commit}},
+        )
+
+    def _get_tree(self, query):
+        entries = []
+        for repo_path, path in sorted(self.state.files().items()):
+            with open(path, "rb") as f:
+                data = f.read()
+            entries.append({"path": repo_path, "type": "blob", "sha": git_blob_sha(data), "size": len(data)})
+        etag = '"%s"' % git_blob_sha(json.dumps(entries).encode("utf-8"))
+        if self.headers.get("If-None-Match") == etag:
+            self._send_not_modified(etag)
+            return
+        self._send_json(200, {"sha": "standin", "tree": entries, "truncated": False}, {"ETag": etag})
+
+    def _get_blob(self, sha: str):
+        path = self.state.blob_path(sha)
+        data = None
+        if path is not None and os.path.isfile(path):
+            with open(path, "rb") as f:
+                data = f.read()
+        if data is None or git_blob_sha(data) != sha:
+            self._send_json(404, {"message": "Not Found"})
+        elif self.headers.get("Accept") == "application/vnd.github.raw":
+            self._send(200, data, "application/octet-stream")
+        else:
+            content = base64.b64encode(data).decode("ascii")
+            self._send_json(200, {"sha": sha, "size": len(data), "encoding": "base64", "content": content})
+
+    def _get_contents(self, repo_path: str):
+        path = self.state.resolve(repo_path)
+        if path is None or not os.path.exists(path):
+            self._send_json(404, {"message": "Not Found"})
+        elif os.path.isdir(path):
+            listing = []
+            for name in sorted(os.listdir(path)):
+                if name.startswith("."):
+                    continue
+                child = f"{repo_path}/{name}".strip("/")
+                child_path = os.path.join(path, name)
+                if os.path.isdir(child_path):
+                    listing.append({"name": name, "path": child, "type": "dir"})
+                else:
+                    with open(child_path, "rb") as f:
+                        listing.append({"name": name, "path": child, "type": "file", "sha": git_blob_sha(f.read())})
+            self._send_json(200, listing)
+        else:
+            with open(path, "rb") as f:
+                data = f.read()
+            etag = '"%s"' % git_blob_sha(data)
+            if self.headers.get("If-None-Match") == etag:
+                self._send_not_modified(etag)
+                return
+            if self.headers.get("Accept") == "application/vnd.github.raw":
+                self._send(200, data, "application/octet-stream", {"ETag": etag})
+                return
+            payload = {
+                "name": os.path.basename(path),
+                "path": repo_path,
+                "type": "file",
+                "sha": git_blob_sha(data),
+                "encoding": "base64",
+                "content": base64.b64encode(data).decode("ascii"),
+            }
+            self._send_json(200, payload, {"ETag": etag})
+
+
+def start_standin_server(root: str, host: str = "127.0.0.1", port: int = 0, **options):
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.state = StandinState(root, **options)
+    thread = threading.Thread(target=server.serve_forever, name="github-standin", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve a directory through a GitHub API stand-in.")
+    parser.add_argument("root", help="Directory to serve as the repository contents.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with 429.")
+    parser.add_argument("--rate-limit-status", type=int, choices=(429, 403), default=429)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to sleep before each response.")
+    parser.add_argument("--idle-timeout", type=float, default=0.0, help="Close keep-alive connections idle this many seconds.")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    server, url = start_standin_server(
+        args.root,
+        args.host,
+        args.port,
+        rate_limit_every=args.rate_limit_every,
+        latency=args.latency,
+        rate_limit_status=args.rate_limit_status,
+        idle_timeout=args.idle_timeout,
+    )
+    server.verbose = args.verbose
+    print(f"GitHub stand-in serving {args.root} at {url} (set GITHUB_API_URL={url})", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+import base64
+import hashlib
+import http.client
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib import error
+from urllib.parse import quote, urlsplit
+
+from perf_metrics import count, timed
+
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_REPO = "ayushbalaji-dotcom/homepagev2"
+GITHUB_BRANCH = "main"
+GITHUB_CALCULATORS_DIR = "calculators"
+
+REQUEST_TIMEOUT = 20.0
+MAX_RETRIES = 4
+MAX_BACKOFF_SECONDS = 30.0
+SYNC_WORKERS = 8
+# A bulk commit is rebuilt on the new head when someone else pushes between
+# reading the branch and moving it.
+COMMIT_ATTEMPTS = 3
+# Lives in the calculators directory; no .json suffix so the registry skips it.
+SYNC_MANIFEST_NAME = ".sync_manifest"
+GUIDELINE_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif")
+
+# One keep-alive connection per (thread, host); sync workers and script threads
+# each reuse theirs instead of opening a fresh TLS session per request.
+_connections = threading.local()
+
+
+def api_url(path: str) -> str:
+    return f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/{path}"
+
+
+def _get_connection(scheme: str, netloc: str):
+    pool = getattr(_connections, "pool", None)
+    if pool is None:
+        pool = _connections.pool = {}
+    conn = pool.get((scheme, netloc))
+    if conn is None:
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(netloc, timeout=REQUEST_TIMEOUT)
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=REQUEST_TIMEOUT)
+        pool[(scheme, netloc)] = conn
+    return conn
+
+
+def _drop_connection(scheme: str, netloc: str):
+    pool = getattr(_connections, "pool", {})
+    conn = pool.pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def _retry_delay(status: int, headers, attempt: int):
+    # GitHub signals rate limiting with 429, or 403 plus Retry-After or an
+    # exhausted X-RateLimit-Remaining; 5xx responses are retried with backoff too.
+    retry_after = headers.get("Retry-After")
+    remaining = headers.get("X-RateLimit-Remaining")
+    if status == 429 or (status == 403 and (retry_after is not None or remaining == "0")):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), MAX_BACKOFF_SECONDS)
+            except ValueError:
+                pass
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining == "0" and reset:
+            try:
+                return min(max(float(reset) - time.time(), 0.0), MAX_BACKOFF_SECONDS)
+            except ValueError:
+                pass
+        return _backoff(attempt)
+    if status >= 500:
+        return _backoff(attempt)
+    return None
+
+
+def _backoff(attempt: int) -> float:
+    return min(0.5 * (2**attempt) + random.uniform(0, 0.25), MAX_BACKOFF_SECONDS)
+
+
+def _exchange(scheme: str, netloc: str, method: str, target: str, body, headers: dict):
+    # A pooled connection the server closed while idle fails before any
+    # response: on send, or with RemoteDisconnected. The request never reached
+    # the server, so it is repeated once on a fresh connection whatever the
+    # method. Later failures are left to the caller.
+    while True:
+        conn = _get_connection(scheme, netloc)
+        reused = conn.sock is not None
+        sent = False
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            sent = True
+            resp = conn.getresponse()
+            return resp, resp.read()
+        except (OSError, http.client.HTTPException) as exc:
+            _drop_connection(scheme, netloc)
+            if not reused or (sent and not isinstance(exc, http.client.RemoteDisconnected)):
+                raise
+            count("github.reconnects")
+
+
+@timed("github.request")
+def send_request(method: str, url: str, token: str | None, body: bytes | None = None, headers: dict | None = None):
+    parts = urlsplit(url)
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    request_headers = {
+        "Accept": "application/vnd.github+json",
+        "User-Agent": "calculator-home",
+    }
+    if token:
+        request_headers["Authorization"] = f"Bearer {token}"
+    if body is not None:
+        request_headers["Content-Type"] = "application/json"
+    request_headers.update(headers or {})
+
+    for attempt in range(MAX_RETRIES + 1):
+        count("github.requests")
+        if attempt:
+            count("github.retries")
+        try:
+            resp, data = _exchange(parts.scheme, parts.netloc, method, target, body, request_headers)
+        except (OSError, http.client.HTTPException):
+            if method != "GET" or attempt == MAX_RETRIES:
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+        if resp.will_close:
+            _drop_connection(parts.scheme, parts.netloc)
+        delay = _retry_delay(resp.status, resp.headers, attempt)
+        if delay is not None and attempt < MAX_RETRIES:
+            time.sleep(delay)
+            continue
+        return resp.status, resp.headers, data
+    raise RuntimeError("unreachable")
+
+
+def github_request(method: str, url: str, token: str | None, payload: dict | None = None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else None
+    status, headers, data = send_request(method, url, token, body)
+    if status >= 400:
+        raise error.HTTPError(url, status, http.client.responses.get(status, "Error"), headers, io.BytesIO(data))
+    return json.loads(data.decode("utf-8")) if data else {}
+
+
+def git_blob_sha(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def manifest_path(dest_dir: str) -> str:
+    return os.path.join(dest_dir, SYNC_MANIFEST_NAME)
+
+
+def load_manifest(dest_dir: str) -> dict:
+    try:
+        with open(manifest_path(dest_dir), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"tree_etag": None, "files": {}}
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), dict):
+        return {"tree_etag": None, "files": {}}
+    return manifest
+
+
+def write_file_atomic(path: str, data: bytes):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def save_manifest(dest_dir: str, manifest: dict):
+    write_file_atomic(manifest_path(dest_dir), json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8"))
+
+
+def _local_blob_sha(path: str) -> str | None:
+    try:
+        with open(path, "rb") as f:
+            return git_blob_sha(f.read())
+    except OSError:
+        return None
+
+
+def is_synced_path(path: str) -> bool:
+    # Calculator JSONs plus the <name>_guideline.<ext> images the app shows
+    # next to them.
+    stem, ext = os.path.splitext(path.lower())
+    return ext == ".json" or (ext in GUIDELINE_IMAGE_EXTENSIONS and stem.endswith("_guideline"))
+
+
+def _list_via_contents(token: str | None) -> list[dict]:
+    def walk(dir_path: str) -> list[dict]:
+        entries = github_request("GET", api_url(f"contents/{quote(dir_path)}?ref={GITHUB_BRANCH}"), token)
+        found = []
+        if isinstance(entries, dict):
+            entries = [entries]
+        for entry in entries:
+            if entry.get("type") == "dir":
+                found.extend(walk(entry.get("path", "")))
+            elif entry.get("type") == "file" and is_synced_path(str(entry.get("path", ""))):
+                found.append({"path": entry.get("path"), "sha": entry.get("sha")})
+        return found
+
+    return walk(GITHUB_CALCULATORS_DIR)
+
+
+def list_remote_calculators(token: str | None, etag: str | None = None):
+    # Returns (entries, etag); entries is None when the tree is unchanged since
+    # the given ETag. A 304 does not count against the GitHub rate limit.
+    url = api_url(f"git/trees/{quote(GITHUB_BRANCH)}?recursive=1")
+    status, headers, data = send_request("GET", url, token, headers={"If-None-Match": etag} if etag else None)
+    if status == 304:
+        return None, etag
+    if status >= 400:
+        raise error.HTTPError(url, status, http.client.responses.get(status, "Error"), headers, io.BytesIO(data))
+    tree = json.loads(data.decode("utf-8"))
+    if tree.get("truncated"):
+        return _list_via_contents(token), None
+    prefix = f"{GITHUB_CALCULATORS_DIR}/"
+    entries = [
+        {"path": entry["path"], "sha": entry.get("sha")}
+        for entry in tree.get("tree", [])
+        if entry.get("type") == "blob" and entry.get("path", "").startswith(prefix) and is_synced_path(entry["path"])
+    ]
+    return entries, headers.get("ETag")
+
+
+def download_blob(sha: str, token: str | None) -> bytes:
+    url = api_url(f"git/blobs/{sha}")
+    status, headers, data = send_request("GET", url, token, headers={"Accept": "application/vnd.github.raw"})
+    if status >= 400:
+        raise error.HTTPError(url, status, http.client.responses.get(status, "Error"), headers, io.BytesIO(data))
+    if headers.get_content_type() == "application/json":
+        payload = json.loads(data.decode("utf-8"))
+        return base64.b64decode(str(payload.get("content", "")).replace("\n", ""))
+    return data
+
+
+def local_calculator_path(remote_path: str, dest_dir: str) -> str | None:
+    rel_path = remote_path[len(f"{GITHUB_CALCULATORS_DIR}/") :] if remote_path.startswith(f"{GITHUB_CALCULATORS_DIR}/") else remote_path
+    parts = rel_path.split("/")
+    if any(part in {"", ".", ".."} for part in parts):
+        return None
+    return os.path.join(dest_dir, *parts)
+
+
+def _sync_result(message: str, **counts) -> dict:
+    result = {
+        "added": 0,
+        "updated": 0,
+        "removed": 0,
+        "unchanged": 0,
+        "failed": 0,
+        "changed_paths": [],
+        "cancelled": False,
+        "message": message,
+    }
+    result.update(counts)
+    return result
+
+
+def summarise_sync(result: dict) -> str:
+    summary = f"{result['added']} added, {result['updated']} updated, {result['removed']} removed"
+    if result["failed"]:
+        summary += f", {result['failed']} failed"
+    if result.get("cancelled"):
+        return f"GitHub sync stopped early: {summary}."
+    return f"Synced from GitHub: {summary}."
+
+
+@timed("github.sync")
+def sync_calculators(token: str | None, dest_dir: str, workers: int = SYNC_WORKERS, progress=None, cancelled=None) -> dict:
+    # progress(done, total, message) is called as downloads land; once
+    # cancelled() is true, queued downloads are dropped and removals skipped.
+    # Files already written stay, and the manifest records them.
+    progress = progress or (lambda done, total, message=None: None)
+    cancelled = cancelled or (lambda: False)
+    manifest = load_manifest(dest_dir)
+    known = manifest["files"]
+    progress(0, 0, "Listing remote calculators")
+    try:
+        remote, etag = list_remote_calculators(token, manifest.get("tree_etag"))
+    except Exception as exc:
+        return _sync_result(f"GitHub sync failed: {exc}")
+
+    if remote is None:
+        # Tree unchanged: only files removed locally since the last sync need work.
+        remote = [{"path": path, "sha": entry["sha"]} for path, entry in known.items()]
+
+    added = updated = unchanged = failed = 0
+    changed_paths = []
+    manifest_changed = False
+    downloads = []
+    for entry in remote:
+        local_path = local_calculator_path(entry["path"], dest_dir)
+        if local_path is None or not entry.get("sha"):
+            continue
+        previous = known.get(entry["path"])
+        if previous and previous.get("sha") == entry["sha"] and os.path.isfile(local_path):
+            unchanged += 1
+            continue
+        if _local_blob_sha(local_path) == entry["sha"]:
+            known[entry["path"]] = {"sha": entry["sha"]}
+            manifest_changed = True
+            unchanged += 1
+            continue
+        downloads.append((entry, local_path, os.path.exists(local_path)))
+
+    stopped = False
+    if downloads:
+        progress(0, len(downloads), f"Downloading {len(downloads)} files")
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(downloads)))) as executor:
+            futures = {executor.submit(download_blob, entry["sha"], token): (entry, local_path, existed) for entry, local_path, existed in downloads}
+            for finished, future in enumerate(as_completed(futures), 1):
+                progress(finished, len(downloads))
+                entry, local_path, existed = futures[future]
+                try:
+                    data = future.result()
+                    write_file_atomic(local_path, data)
+                except Exception:
+                    failed += 1
+                else:
+                    known[entry["path"]] = {"sha": git_blob_sha(data)}
+                    manifest_changed = True
+                    changed_paths.append(local_path)
+                    if existed:
+                        updated += 1
+                    else:
+                        added += 1
+                if cancelled() and finished < len(downloads):
+                    stopped = True
+                    for pending in futures:
+                        pending.cancel()
+                    break
+
+    removed = 0
+    remote_paths = {entry["path"] for entry in remote}
+    stale = [] if stopped else [path for path in known if path not in remote_paths]
+    for path in stale:
+        entry = known.pop(path)
+        manifest_changed = True
+        local_path = local_calculator_path(path, dest_dir)
+        # Files edited locally since they were synced are left in place.
+        if local_path is None or _local_blob_sha(local_path) != entry.get("sha"):
+            continue
+        try:
+            os.remove(local_path)
+        except OSError:
+            continue
+        removed += 1
+        changed_paths.append(local_path)
+
+    new_etag = etag if not failed and not stopped else None
+    if manifest.get("tree_etag") != new_etag:
+        manifest["tree_etag"] = new_etag
+        manifest_changed = True
+    if manifest_changed:
+        try:
+            save_manifest(dest_dir, manifest)
+        except OSError:
+            pass
+
+    result = _sync_result(
+        "",
+        added=added,
+        updated=updated,
+        removed=removed,
+        unchanged=unchanged,
+        failed=failed,
+        changed_paths=changed_paths,
+        cancelled=stopped,
+    )
+    result["message"] = summarise_sync(result)
+    return result
+
+
+def _create_blob(data: bytes, token: str | None) -> str:
+    payload = {"content": base64.b64encode(data).decode("ascii"), "encoding": "base64"}
+    return github_request("POST", api_url("git/blobs"), token, payload)["sha"]
+
+
+@timed("github.commit")
+def commit_files(token: str | None, files: dict, message: str, workers: int = SYNC_WORKERS, progress=None, cancelled=None) -> dict:
+    # Pushes files (repository path -> bytes) to GITHUB_BRANCH as one commit
+    # through the Git data API. UTF-8 files travel inline in the tree request;
+    # only binary files (guideline images) are uploaded as blobs first, in
+    # parallel. Then it reads the branch head and its tree, creates one tree
+    # and one commit, and fast-forwards the ref: five requests plus one per
+    # image, whatever the number of calculators.
+    progress = progress or (lambda done, total, message=None: None)
+    cancelled = cancelled or (lambda: False)
+    entries = {}
+    binary = {}
+    for path, data in files.items():
+        try:
+            entries[path] = {"path": path, "mode": "100644", "type": "blob", "content": data.decode("utf-8")}
+        except UnicodeDecodeError:
+            binary[path] = data
+    steps = len(binary) + 5
+    if binary:
+        progress(0, steps, f"Uploading {len(binary)} images")
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(binary)))) as executor:
+            futures = {executor.submit(_create_blob, data, token): path for path, data in binary.items()}
+            for done, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                entries[path] = {"path": path, "mode": "100644", "type": "blob", "sha": future.result()}
+                progress(done, steps)
+    tree_entries = [entries[path] for path in sorted(entries)]
+    for attempt in range(COMMIT_ATTEMPTS):
+        if cancelled():
+            return {"commit": None, "files": 0, "cancelled": True}
+        progress(len(binary), steps, f"Committing {len(files)} files")
+        head = github_request("GET", api_url(f"git/ref/heads/{quote(GITHUB_BRANCH)}"), token)["object"]["sha"]
+        base_tree = github_request("GET", api_url(f"git/commits/{head}"), token)["tree"]["sha"]
+        progress(len(binary) + 2, steps)
+        tree = github_request("POST", api_url("git/trees"), token, {"base_tree": base_tree, "tree": tree_entries})["sha"]
+        commit = github_request("POST", api_url("git/commits"), token, {"message": message, "tree": tree, "parents": [head]})["sha"]
+        progress(len(binary) + 4, steps)
+        try:
+            github_request("PATCH", api_url(f"git/refs/heads/{quote(GITHUB_BRANCH)}"), token, {"sha": commit, "force": False})
+        except error.HTTPError as exc:
+            if exc.code != 422 or attempt == COMMIT_ATTEMPTS - 1:
+                raise
+            count("github.commit_retries")
+            continue
+        progress(steps, steps)
+        return {"commit": commit, "files": len(files), "cancelled": False}
+    raise RuntimeError("unreachable")
+
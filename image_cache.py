@@ -0,0 +1,221 @@
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+from github_sync import GITHUB_BRANCH, api_url, send_request, write_file_atomic
+from perf_metrics import count, timed
+
+# Guideline images are stored on disk under their SHA-256 and kept in a byte-
+# bounded in-memory LRU. GitHub copies are revalidated with If-None-Match at
+# most every IMAGE_REVALIDATE_SECONDS; a 304 costs no download.
+IMAGE_CACHE_DIR = os.environ.get("CALCULATOR_IMAGE_CACHE", os.path.join(".cache", "images"))
+IMAGE_MEMORY_BUDGET = 32 * 1024 * 1024
+IMAGE_REVALIDATE_SECONDS = 600.0
+LOCAL_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif")
+
+_LOCK = threading.RLock()
+_MEMORY = OrderedDict()
+_MEMORY_STATE = {"bytes": 0}
+_INDEX = {"loaded": False, "entries": {}}
+_LOCAL_DIRS = {}
+# Images bundled in a warm-start snapshot stand in for files missing under
+# IMAGE_CACHE_DIR; read(rel_path) returns the bytes.
+_SNAPSHOT = {"read": None, "names": frozenset()}
+
+
+def _index_path() -> str:
+    return os.path.join(IMAGE_CACHE_DIR, "index.json")
+
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(IMAGE_CACHE_DIR, digest)
+
+
+def _load_index() -> dict:
+    if not _INDEX["loaded"]:
+        try:
+            with open(_index_path(), "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                _INDEX["entries"] = entries
+        except (OSError, ValueError):
+            pass
+        _INDEX["loaded"] = True
+    return _INDEX["entries"]
+
+
+def _save_index():
+    try:
+        write_file_atomic(_index_path(), json.dumps(_INDEX["entries"], indent=1, sort_keys=True).encode("utf-8"))
+    except OSError:
+        pass
+
+
+def set_image_snapshot(read, names, index_entries: dict):
+    # Index entries only fill in paths this replica has not fetched itself.
+    with _LOCK:
+        _SNAPSHOT.update(read=read, names=frozenset(names))
+        entries = _load_index()
+        for path, entry in index_entries.items():
+            entries.setdefault(path, entry)
+
+
+def _snapshot_name(path: str) -> str | None:
+    rel_path = os.path.relpath(path, IMAGE_CACHE_DIR)
+    if rel_path.startswith(os.pardir):
+        return None
+    return rel_path.replace(os.sep, "/")
+
+
+def _snapshot_image(path: str) -> bytes | None:
+    name = _snapshot_name(path)
+    if _SNAPSHOT["read"] is None or name not in _SNAPSHOT["names"]:
+        return None
+    count("image_cache.snapshot")
+    return _SNAPSHOT["read"](name)
+
+
+def cached_image_exists(path: str) -> bool:
+    return os.path.exists(path) or _snapshot_name(path) in _SNAPSHOT["names"]
+
+
+def _remember(key, data: bytes):
+    if len(data) > IMAGE_MEMORY_BUDGET:
+        return
+    if key in _MEMORY:
+        _MEMORY_STATE["bytes"] -= len(_MEMORY.pop(key))
+    _MEMORY[key] = data
+    _MEMORY_STATE["bytes"] += len(data)
+    while _MEMORY_STATE["bytes"] > IMAGE_MEMORY_BUDGET:
+        _old_key, old = _MEMORY.popitem(last=False)
+        _MEMORY_STATE["bytes"] -= len(old)
+
+
+def _recall(key):
+    data = _MEMORY.get(key)
+    if data is not None:
+        _MEMORY.move_to_end(key)
+    return data
+
+
+def store_image_bytes(data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    path = _blob_path(digest)
+    if not os.path.exists(path):
+        write_file_atomic(path, data)
+    with _LOCK:
+        _remember(digest, data)
+    return digest
+
+
+def read_cached_image(digest: str) -> bytes | None:
+    with _LOCK:
+        data = _recall(digest)
+    if data is not None:
+        return data
+    try:
+        with open(_blob_path(digest), "rb") as f:
+            data = f.read()
+    except OSError:
+        data = _snapshot_image(_blob_path(digest))
+        if data is None:
+            return None
+    if hashlib.sha256(data).hexdigest() != digest:
+        return None
+    with _LOCK:
+        _remember(digest, data)
+    return data
+
+
+@timed("image.github")
+def get_github_image(path: str, token: str | None):
+    # Returns (bytes or None, error or None). A stale cached copy is served if
+    # revalidation fails, so a GitHub outage does not blank the page.
+    with _LOCK:
+        entry = dict(_load_index().get(path) or {})
+    cached = read_cached_image(entry["sha256"]) if entry.get("sha256") else None
+    if cached is not None and time.time() - entry.get("checked", 0) < IMAGE_REVALIDATE_SECONDS:
+        count("image_cache.fresh")
+        return cached, None
+
+    url = api_url(f"contents/{quote(path)}?ref={quote(GITHUB_BRANCH)}")
+    headers = {"Accept": "application/vnd.github.raw"}
+    if cached is not None and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    try:
+        status, response_headers, data = send_request("GET", url, token, headers=headers)
+    except (OSError, http.client.HTTPException) as exc:
+        return cached, None if cached is not None else f"GitHub fetch failed: {exc}"
+
+    if status == 304 and cached is not None:
+        count("image_cache.revalidated")
+        entry["checked"] = time.time()
+    elif status == 200 and data:
+        if response_headers.get_content_type() == "application/json":
+            return cached, None if cached is not None else "GitHub returned metadata instead of image content."
+        count("image_cache.downloaded")
+        try:
+            digest = store_image_bytes(data)
+        except OSError:
+            return data, None
+        cached = data
+        entry = {"sha256": digest, "etag": response_headers.get("ETag"), "checked": time.time()}
+    else:
+        return cached, None if cached is not None else f"GitHub fetch failed: HTTP {status}"
+
+    with _LOCK:
+        _load_index()[path] = entry
+        _save_index()
+    return cached, None
+
+
+def find_local_image(json_path: str) -> str | None:
+    # Directory listings are cached per directory and re-read only when the
+    # directory's mtime changes, instead of probing every extension per rerun.
+    if not json_path:
+        return None
+    directory = os.path.dirname(json_path) or "."
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+    with _LOCK:
+        cached = _LOCAL_DIRS.get(directory)
+    if cached is None or cached[0] != mtime:
+        try:
+            names = set(os.listdir(directory))
+        except OSError:
+            return None
+        cached = (mtime, names)
+        with _LOCK:
+            _LOCAL_DIRS[directory] = cached
+    stem = os.path.splitext(os.path.basename(json_path))[0] + "_guideline"
+    for ext in LOCAL_IMAGE_EXTENSIONS:
+        if f"{stem}{ext}" in cached[1]:
+            return os.path.join(directory, f"{stem}{ext}")
+    return None
+
+
+def read_local_image(path: str) -> bytes | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return _snapshot_image(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, stat.st_ctime_ns)
+    with _LOCK:
+        data = _recall(key)
+    if data is not None:
+        return data
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    with _LOCK:
+        _remember(key, data)
+    return data
@@ -0,0 +1,101 @@
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from github_sync import write_file_atomic
+from image_cache import IMAGE_CACHE_DIR, cached_image_exists, read_local_image
+
+# Downscaled, recompressed copies of guideline images, keyed by the SHA-256 of
+# the source. They are produced on a small background pool so uploads, syncs and
+# reruns never wait on Pillow; until a variant exists the original is served.
+# The app only shows guidelines at page width, so only that size is rendered.
+IMAGE_VARIANTS = {
+    "screen": 1280,
+}
+VARIANT_QUALITY = 80
+VARIANT_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=VARIANT_WORKERS, thread_name_prefix="image-variants")
+_pending_lock = threading.Lock()
+_pending = set()
+
+
+def variants_dir() -> str:
+    return os.path.join(IMAGE_CACHE_DIR, "variants")
+
+
+def variant_path(digest: str, name: str) -> str:
+    return os.path.join(variants_dir(), f"{digest}_{name}.webp")
+
+
+def _render_variant(image, width: int) -> bytes:
+    from PIL import Image
+
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=VARIANT_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def generate_variants(data: bytes, digest: str | None = None) -> dict:
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return {}
+    digest = digest or hashlib.sha256(data).hexdigest()
+    written = {}
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            image = ImageOps.exif_transpose(source)
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            for name, width in IMAGE_VARIANTS.items():
+                path = variant_path(digest, name)
+                if not os.path.exists(path):
+                    write_file_atomic(path, _render_variant(image, width))
+                written[name] = path
+    except (OSError, ValueError):
+        return written
+    return written
+
+
+def _generate_in_background(data: bytes, digest: str):
+    try:
+        generate_variants(data, digest)
+    finally:
+        with _pending_lock:
+            _pending.discard(digest)
+
+
+def schedule_variants(data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    if all(cached_image_exists(variant_path(digest, name)) for name in IMAGE_VARIANTS):
+        return digest
+    with _pending_lock:
+        if digest in _pending:
+            return digest
+        _pending.add(digest)
+    _executor.submit(_generate_in_background, data, digest)
+    return digest
+
+
+def schedule_variants_for_file(path: str):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    return schedule_variants(data)
+
+
+def best_variant(data: bytes, name: str = "screen") -> bytes:
+    # Returns the requested variant when it is ready and smaller than the
+    # source, otherwise the source itself; missing variants are scheduled.
+    digest = schedule_variants(data)
+    variant = read_local_image(variant_path(digest, name))
+    if variant is None:
+        return data
+    return variant if len(variant) < len(data) else data
@@ -0,0 +1,327 @@
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+from calculator_engine import evaluate_calculator, file_stamp
+from perf_metrics import count, timed
+
+# Calculators whose inputs are all selects have a finite outcome space. When it
+# is small enough the whole space is evaluated once and stored as a lookup table
+# next to the JSON (<name>.outcomes); anything else goes through a shared memo.
+OUTCOME_TABLE_MAX_COMBINATIONS = int(os.environ.get("CALCULATOR_OUTCOME_TABLE_MAX", "500000"))
+PRECOMPILE_OUTCOMES = os.environ.get("CALCULATOR_PRECOMPILE_OUTCOMES", "").lower() in {"1", "true", "yes"}
+OUTCOME_MEMO_SIZE = 4096
+OUTCOME_TABLE_CACHE_SIZE = 64
+
+_MAGIC = b"CALCOUT1"
+
+_TABLES_LOCK = threading.Lock()
+_TABLES = OrderedDict()
+# Hashes with no usable table on disk, mapped to the .outcomes file's stamp
+# (None if absent) at that time; the file is read again once the stamp changes.
+_MISSES = OrderedDict()
+_MEMO_LOCK = threading.Lock()
+_MEMO = OrderedDict()
+
+
+def outcome_table_path(json_path: str) -> str:
+    return os.path.splitext(json_path)[0] + ".outcomes"
+
+
+def _referenced_inputs(tool) -> set:
+    referenced = set()
+    for rule in tool.get("rules") or []:
+        referenced.update(cond.get("input_id") for cond in rule.get("conditions") or [])
+    if tool.get("scoring_rules"):
+        referenced.update(rule.get("input_id") for rule in tool.get("scoring_rules") or [])
+        for item in tool.get("scoring_recommendations") or []:
+            referenced.update(cond.get("input_id") for cond in item.get("conditions") or [])
+    referenced.discard(None)
+    return referenced
+
+
+def outcome_space(tool):
+    # Returns [(input_id, options), ...] when every input is a select with
+    # hashable options and integral scoring weights, else None.
+    space = []
+    for item in tool.get("inputs", []):
+        if item.get("type", "select") != "select":
+            return None
+        options = item.get("options", []) or [""]
+        try:
+            hash(tuple(options))
+        except TypeError:
+            return None
+        space.append((item.get("id"), list(options)))
+    if not space:
+        return None
+    for rule in tool.get("scoring_rules") or []:
+        weight = rule.get("weight", 1) or 1
+        if not isinstance(weight, int):
+            return None
+    return space
+
+
+def outcome_space_size(space) -> int:
+    return math.prod(len(options) for _input_id, options in space)
+
+
+def _smallest_typecode(low: int, high: int) -> str:
+    for typecode in ("b", "h", "i", "q"):
+        bits = array(typecode).itemsize * 8
+        if -(1 << (bits - 1)) <= low and high < (1 << (bits - 1)):
+            return typecode
+    raise OverflowError("Outcome value out of range.")
+
+
+def _evaluate_space_numpy(tool, space):
+    import numpy as np
+
+    import cohort_eval
+
+    size = outcome_space_size(space)
+    positions = np.arange(size, dtype=np.int64)
+    columns = {}
+    stride = size
+    for input_id, options in space:
+        stride //= len(options)
+        if all(isinstance(option, str) for option in options):
+            table = np.array(options)
+        else:
+            table = np.empty(len(options), dtype=object)
+            table[:] = options
+        columns[input_id] = table[(positions // stride) % len(options)]
+    plan = cohort_eval.build_batch_plan(tool)
+    result = cohort_eval.evaluate_batch(tool, columns, plan)
+    reco_positions = [
+        next(i for i, item in enumerate(tool.get("scoring_recommendations") or []) if item is reco["item"])
+        for reco in plan["recommendations"]
+    ]
+    reco_lookup = np.array(reco_positions + [-1], dtype=np.int64)
+    return (
+        result["rule_index"].tolist(),
+        reco_lookup[result["score_index"]].tolist(),
+        result["plus"].tolist(),
+        result["minus"].tolist(),
+    )
+
+
+def _evaluate_space_python(tool, space):
+    rule_ids = {id(rule): ridx for ridx, rule in enumerate(tool.get("rules") or [])}
+    reco_ids = {(item.get("level", "info"), item.get("message", ""), _min_score(item)): sidx for sidx, item in enumerate(tool.get("scoring_recommendations") or [])}
+    rules, recos, plus, minus = [], [], [], []
+    input_ids = [input_id for input_id, _options in space]
+    for combination in itertools.product(*(options for _input_id, options in space)):
+        result = evaluate_calculator(tool, dict(zip(input_ids, combination)))
+        rules.append(-1 if result["rule"] is None else rule_ids[id(result["rule"])])
+        reco = result["score_recommendation"]
+        recos.append(-1 if reco is None else reco_ids[(reco["level"], reco["message"], reco["min_score"])])
+        plus.append(result["plus"] or 0)
+        minus.append(result["minus"] or 0)
+    return rules, recos, plus, minus
+
+
+def _min_score(item):
+    try:
+        return int(item.get("min_score"))
+    except (TypeError, ValueError):
+        return None
+
+
+def build_outcome_table(calc, max_combinations: int | None = None):
+    tool = calc["data"]
+    space = outcome_space(tool)
+    limit = OUTCOME_TABLE_MAX_COMBINATIONS if max_combinations is None else max_combinations
+    if space is None or outcome_space_size(space) > limit:
+        return None
+    try:
+        columns = _evaluate_space_numpy(tool, space)
+    except ImportError:
+        columns = _evaluate_space_python(tool, space)
+    typecodes = [_smallest_typecode(min(column), max(column)) for column in columns]
+    header = {
+        "hash": calc["hash"],
+        "inputs": space,
+        "has_scores": bool(tool.get("scoring_rules")),
+        "signed": tool.get("scoring_mode", "signed") == "signed",
+        "typecodes": typecodes,
+        "byteorder": sys.byteorder,
+    }
+    table = dict(header)
+    table["columns"] = [array(typecode, column) for typecode, column in zip(typecodes, columns)]
+    _finalise_table(table, tool)
+    return table
+
+
+def _finalise_table(table, tool):
+    table["index"] = [({option: oidx for oidx, option in enumerate(options)}, len(options)) for _input_id, options in table["inputs"]]
+    table["input_ids"] = [input_id for input_id, _options in table["inputs"]]
+    table["foreign_inputs"] = _referenced_inputs(tool) - set(table["input_ids"])
+
+
+def save_outcome_table(table, json_path: str):
+    header = {key: table[key] for key in ("hash", "inputs", "has_scores", "signed", "typecodes", "byteorder")}
+    header_bytes = json.dumps(header).encode("utf-8")
+    dest = outcome_table_path(json_path)
+    tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_MAGIC)
+        f.write(len(header_bytes).to_bytes(4, "little"))
+        f.write(header_bytes)
+        for column in table["columns"]:
+            f.write(column.tobytes())
+    os.replace(tmp, dest)
+
+
+def load_outcome_table(calc):
+    try:
+        with open(outcome_table_path(calc["path"]), "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                return None
+            header = json.loads(f.read(int.from_bytes(f.read(4), "little")).decode("utf-8"))
+            if header.get("hash") != calc["hash"]:
+                return None
+            size = outcome_space_size(header["inputs"])
+            columns = []
+            for typecode in header["typecodes"]:
+                column = array(typecode)
+                column.frombytes(f.read(size * column.itemsize))
+                if len(column) != size:
+                    return None
+                if header["byteorder"] != sys.byteorder:
+                    column.byteswap()
+                columns.append(column)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    table = dict(header)
+    table["columns"] = columns
+    _finalise_table(table, calc["data"])
+    return table
+
+
+def discard_outcome_table(json_path: str):
+    try:
+        os.remove(outcome_table_path(json_path))
+    except OSError:
+        pass
+
+
+def precompile_outcome_table(calc, max_combinations: int | None = None):
+    table = load_outcome_table(calc)
+    if table is None:
+        table = build_outcome_table(calc, max_combinations)
+        if table is not None:
+            try:
+                save_outcome_table(table, calc["path"])
+            except OSError:
+                pass
+    with _TABLES_LOCK:
+        _TABLES[calc["hash"]] = table
+        _TABLES.move_to_end(calc["hash"])
+        while len(_TABLES) > OUTCOME_TABLE_CACHE_SIZE:
+            _TABLES.popitem(last=False)
+    return table
+
+
+def _table_stamp(json_path: str):
+    try:
+        return file_stamp(os.stat(outcome_table_path(json_path)))
+    except OSError:
+        return None
+
+
+def get_outcome_table(calc):
+    with _TABLES_LOCK:
+        if calc["hash"] in _TABLES:
+            _TABLES.move_to_end(calc["hash"])
+            return _TABLES[calc["hash"]]
+        missed = calc["hash"] in _MISSES
+        miss_stamp = _MISSES.get(calc["hash"])
+    if PRECOMPILE_OUTCOMES:
+        return precompile_outcome_table(calc)
+    stamp = _table_stamp(calc["path"])
+    if missed and stamp == miss_stamp:
+        return None
+    table = load_outcome_table(calc)
+    with _TABLES_LOCK:
+        if table is None:
+            _MISSES[calc["hash"]] = stamp
+            _MISSES.move_to_end(calc["hash"])
+            while len(_MISSES) > OUTCOME_TABLE_CACHE_SIZE:
+                _MISSES.popitem(last=False)
+            return None
+        _MISSES.pop(calc["hash"], None)
+        _TABLES[calc["hash"]] = table
+        while len(_TABLES) > OUTCOME_TABLE_CACHE_SIZE:
+            _TABLES.popitem(last=False)
+    return table
+
+
+def _pack_values(table, values):
+    position = 0
+    try:
+        for input_id, (index, radix) in zip(table["input_ids"], table["index"]):
+            position = position * radix + index[values[input_id]]
+    except (KeyError, TypeError):
+        return None
+    if any(values.get(input_id) is not None for input_id in table["foreign_inputs"]):
+        return None
+    return position
+
+
+def _result_from_table(table, tool, position):
+    rule_column, reco_column, plus_column, minus_column = table["columns"]
+    ridx = rule_column[position]
+    result = {"rule": tool["rules"][ridx] if ridx >= 0 else None, "plus": None, "minus": None, "total": None, "score_recommendation": None}
+    if not table["has_scores"]:
+        return result
+    plus = plus_column[position]
+    minus = minus_column[position]
+    result.update(plus=plus, minus=minus, total=plus - minus if table["signed"] else plus)
+    sidx = reco_column[position]
+    if sidx >= 0:
+        item = tool["scoring_recommendations"][sidx]
+        conditions = item.get("conditions", [])
+        result["score_recommendation"] = {
+            "min_score": int(item.get("min_score")),
+            "level": item.get("level", "info"),
+            "message": item.get("message", ""),
+            "matched": len(conditions),
+            "ratio": 1.0,
+        }
+    return result
+
+
+@timed("outcome.evaluate")
+def evaluate_outcome(calc, values) -> dict:
+    tool = calc["data"]
+    table = get_outcome_table(calc)
+    if table is not None:
+        position = _pack_values(table, values)
+        if position is not None:
+            count("outcome.table_hit")
+            return _result_from_table(table, tool, position)
+    try:
+        # True, 1 and 1.0 are equal but range conditions only accept numbers.
+        key = (calc["hash"], tuple(sorted((k, type(v).__name__, v) for k, v in values.items())))
+        hash(key)
+    except TypeError:
+        count("outcome.memo_miss")
+        return evaluate_calculator(tool, values)
+    with _MEMO_LOCK:
+        if key in _MEMO:
+            _MEMO.move_to_end(key)
+            count("outcome.memo_hit")
+            return _MEMO[key]
+    count("outcome.memo_miss")
+    result = evaluate_calculator(tool, values)
+    with _MEMO_LOCK:
+        _MEMO[key] = result
+        while len(_MEMO) > OUTCOME_MEMO_SIZE:
+            _MEMO.popitem(last=False)
+    return result
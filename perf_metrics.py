@@ -0,0 +1,223 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Timing spans and event counters for the hot paths. Collection is off unless
+# CALCULATOR_PERF is set, set_enabled(True) is called, or the current thread is
+# recording a rerun for the profiler panel; when off, a span or count costs a
+# couple of global reads. Durations feed a process-wide aggregator that keeps
+# a bounded sample per span for p50/p95/p99.
+PERF_SAMPLE_SIZE = 2048
+PERF_QUANTILES = (0.5, 0.95, 0.99)
+PERF_EXPORT_SECONDS = 15.0
+PERF_METRICS_FILE = os.environ.get("CALCULATOR_METRICS_FILE") or None
+
+_STATE = {
+    "enabled": os.environ.get("CALCULATOR_PERF", "").lower() in {"1", "true", "yes"},
+    "active_reruns": 0,
+    "exported_at": 0.0,
+}
+_LOCK = threading.Lock()
+_SAMPLES = {}
+_TOTALS = {}
+_COUNTERS = {}
+_local = threading.local()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "started", "rerun")
+
+    def __init__(self, name: str, rerun):
+        self.name = name
+        self.rerun = rerun
+
+    def __enter__(self):
+        if self.rerun is not None:
+            self.rerun["depth"] += 1
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        if self.rerun is not None:
+            self.rerun["depth"] -= 1
+            self.rerun["spans"].append((self.name, elapsed, self.rerun["depth"]))
+        if _STATE["enabled"]:
+            _record(self.name, elapsed)
+        return False
+
+
+def _record(name: str, elapsed: float):
+    with _LOCK:
+        samples = _SAMPLES.get(name)
+        if samples is None:
+            samples = _SAMPLES[name] = deque(maxlen=PERF_SAMPLE_SIZE)
+            _TOTALS[name] = [0, 0.0]
+        samples.append(elapsed)
+        totals = _TOTALS[name]
+        totals[0] += 1
+        totals[1] += elapsed
+
+
+def is_enabled() -> bool:
+    return _STATE["enabled"]
+
+
+def set_enabled(enabled: bool):
+    _STATE["enabled"] = bool(enabled)
+
+
+def span(name: str):
+    if not _STATE["enabled"] and not _STATE["active_reruns"]:
+        return _NULL_SPAN
+    return _Span(name, getattr(_local, "rerun", None))
+
+
+def timed(name: str):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _STATE["enabled"] and not _STATE["active_reruns"]:
+                return func(*args, **kwargs)
+            with _Span(name, getattr(_local, "rerun", None)):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def count(name: str, amount: int = 1):
+    if not _STATE["enabled"] and not _STATE["active_reruns"]:
+        return
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        rerun["counters"][name] = rerun["counters"].get(name, 0) + amount
+    if _STATE["enabled"]:
+        with _LOCK:
+            _COUNTERS[name] = _COUNTERS.get(name, 0) + amount
+
+
+def start_rerun():
+    # Records every span and count on this thread until finish_rerun().
+    if getattr(_local, "rerun", None) is None:
+        with _LOCK:
+            _STATE["active_reruns"] += 1
+    _local.rerun = {"spans": [], "counters": {}, "depth": 0, "started": time.perf_counter()}
+
+
+def finish_rerun() -> dict | None:
+    # Returns {"total", "spans": [{name, calls, total, self}], "counters"} for
+    # the rerun; "self" excludes time spent in nested spans.
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        return None
+    _local.rerun = None
+    with _LOCK:
+        _STATE["active_reruns"] -= 1
+    total = time.perf_counter() - rerun["started"]
+    by_name = {}
+    child_time = [0.0] * (max((depth for _name, _elapsed, depth in rerun["spans"]), default=0) + 2)
+    for name, elapsed, depth in rerun["spans"]:
+        # Spans close innermost first, so children's time is known when the
+        # parent closes.
+        row = by_name.setdefault(name, {"name": name, "calls": 0, "total": 0.0, "self": 0.0})
+        row["calls"] += 1
+        row["total"] += elapsed
+        row["self"] += elapsed - child_time[depth + 1]
+        child_time[depth + 1] = 0.0
+        child_time[depth] += elapsed
+    spans = sorted(by_name.values(), key=lambda row: row["total"], reverse=True)
+    return {"total": total, "spans": spans, "counters": dict(rerun["counters"])}
+
+
+def _quantile(ordered: list, q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def snapshot() -> dict:
+    with _LOCK:
+        samples = {name: sorted(values) for name, values in _SAMPLES.items()}
+        totals = {name: tuple(values) for name, values in _TOTALS.items()}
+        counters = dict(_COUNTERS)
+    spans = {}
+    for name, ordered in samples.items():
+        calls, total = totals[name]
+        spans[name] = {
+            "count": calls,
+            "sum": total,
+            **{f"p{round(q * 100)}": _quantile(ordered, q) for q in PERF_QUANTILES},
+        }
+    return {"spans": spans, "counters": counters}
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text() -> str:
+    data = snapshot()
+    lines = [
+        "# HELP calculator_span_seconds Time spent in instrumented code paths.",
+        "# TYPE calculator_span_seconds summary",
+    ]
+    for name, stats in sorted(data["spans"].items()):
+        for q in PERF_QUANTILES:
+            lines.append(f'calculator_span_seconds{{span="{_label(name)}",quantile="{q}"}} {stats[f"p{round(q * 100)}"]:.9f}')
+        lines.append(f'calculator_span_seconds_sum{{span="{_label(name)}"}} {stats["sum"]:.9f}')
+        lines.append(f'calculator_span_seconds_count{{span="{_label(name)}"}} {stats["count"]}')
+    lines.append("# HELP calculator_events_total Cache hits, misses and external requests.")
+    lines.append("# TYPE calculator_events_total counter")
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f'calculator_events_total{{event="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str):
+    # JSON for *.json paths, Prometheus text otherwise.
+    if path.endswith(".json"):
+        payload = json.dumps(snapshot(), indent=1, sort_keys=True)
+    else:
+        payload = prometheus_text()
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(payload)
+    os.replace(tmp, path)
+
+
+def maybe_export(path: str | None):
+    # Rewrites the metrics file at most every PERF_EXPORT_SECONDS.
+    if not path or not _STATE["enabled"]:
+        return
+    now = time.monotonic()
+    with _LOCK:
+        if now - _STATE["exported_at"] < PERF_EXPORT_SECONDS:
+            return
+        _STATE["exported_at"] = now
+    try:
+        write_metrics(path)
+    except OSError:
+        pass
+
+
+def reset_metrics():
+    with _LOCK:
+        _SAMPLES.clear()
+        _TOTALS.clear()
+        _COUNTERS.clear()
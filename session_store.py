@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+# Widget values of recently used calculators, kept under one session-state key
+# so switching back to a calculator restores its inputs. Only the current
+# calculator's values live in widget keys; the others are stashed here, oldest
+# first, and evicted beyond SESSION_CALCULATOR_HISTORY entries or
+# SESSION_STATE_BUDGET_BYTES, so all-day sessions stay bounded.
+SESSION_STORE_KEY = "_calculator_inputs"
+SESSION_CALCULATOR_HISTORY = 8
+SESSION_STATE_BUDGET_BYTES = 64 * 1024
+
+
+def _approx_size(key: str, value) -> int:
+    if isinstance(value, str):
+        size = len(value.encode("utf-8"))
+    elif isinstance(value, (bool, int, float)) or value is None:
+        size = 8
+    else:
+        size = len(repr(value))
+    return len(key) + size
+
+
+def _store(state) -> OrderedDict:
+    store = state.get(SESSION_STORE_KEY)
+    if not isinstance(store, OrderedDict):
+        store = OrderedDict()
+        state[SESSION_STORE_KEY] = store
+    return store
+
+
+def _trim(store: OrderedDict, budget: int, history: int):
+    total = sum(entry["size"] for entry in store.values())
+    while store and (len(store) > history or total > budget):
+        _calc_id, entry = store.popitem(last=False)
+        total -= entry["size"]
+
+
+def stash_calculator_state(
+    state,
+    calc_id: str,
+    keys,
+    budget: int = SESSION_STATE_BUDGET_BYTES,
+    history: int = SESSION_CALCULATOR_HISTORY,
+):
+    # Moves the given widget keys out of session state into the calculator's
+    # entry. An entry larger than the whole budget is not kept.
+    values = {}
+    for key in keys:
+        if key in state:
+            values[key] = state[key]
+            del state[key]
+    store = _store(state)
+    store.pop(calc_id, None)
+    size = sum(_approx_size(key, value) for key, value in values.items())
+    if values and size <= budget:
+        store[calc_id] = {"values": values, "size": size}
+    _trim(store, budget, history)
+
+
+def restore_calculator_state(state, calc_id: str, is_valid=None) -> int:
+    # Puts a stashed calculator's values back into session state before its
+    # widgets are created; values the calculator no longer accepts are
+    # dropped. Returns the number of values restored.
+    entry = _store(state).pop(calc_id, None)
+    if entry is None:
+        return 0
+    restored = 0
+    for key, value in entry["values"].items():
+        if is_valid is None or is_valid(key, value):
+            state[key] = value
+            restored += 1
+    return restored
+
+
+def stored_calculators(state) -> list[str]:
+    return list(_store(state))
+
+
+def stored_size(state) -> int:
+    return sum(entry["size"] for entry in _store(state).values())
@@ -0,0 +1,232 @@
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+# The app is a set of top-level modules; make them importable from tests/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import calculator_engine
+import github_sync
+import perf_metrics
+from github_standin import start_standin_server
+
+
+# A straightforward per-condition evaluator, as the app scored calculators
+# before rules were compiled; the optimised paths must agree with it.
+def _holds(cond, values):
+    actual = values.get(cond.get("input_id"))
+    expected = cond.get("value")
+    op = str(cond.get("op", "equals")).strip().lower()
+    if op == "not_equals":
+        return actual != expected
+    if op in {"lt", "lte", "gt", "gte", "between"}:
+        if not isinstance(actual, (int, float)) or isinstance(actual, bool) or actual != actual:
+            return False
+        if op == "between":
+            valid = isinstance(expected, list) and len(expected) == 2 and expected[0] <= expected[1]
+            return valid and expected[0] <= actual <= expected[1]
+        return {"lt": actual < expected, "lte": actual <= expected, "gt": actual > expected, "gte": actual >= expected}[op]
+    return actual == expected
+
+
+def _reference_rules(tool, values):
+    best_match = None
+    best_count = 0
+    best_ratio = 0.0
+    best_total = 0
+    for rule in tool.get("rules", []):
+        conditions = rule.get("conditions", [])
+        if not conditions:
+            continue
+        default_join = str(rule.get("condition_operator", "AND")).strip().upper()
+        if default_join not in {"AND", "OR"}:
+            default_join = "AND"
+        matched = int(_holds(conditions[0], values))
+        current = bool(matched)
+        groups = []
+        for cond in conditions[1:]:
+            hit = _holds(cond, values)
+            matched += hit
+            join = str(cond.get("join_with_previous", default_join)).strip().upper()
+            if join not in {"AND", "OR"}:
+                join = default_join
+            if join == "AND":
+                current = current and hit
+            else:
+                groups.append(current)
+                current = hit
+        groups.append(current)
+        if not any(groups):
+            continue
+        ratio = matched / len(conditions)
+        if ratio == 1.0 and best_ratio == 1.0:
+            if len(conditions) > best_total:
+                best_match, best_count, best_ratio, best_total = rule, matched, ratio, len(conditions)
+                continue
+        if matched > best_count or (matched == best_count and ratio > best_ratio):
+            best_match, best_count, best_ratio, best_total = rule, matched, ratio, len(conditions)
+    return best_match
+
+
+def _reference_scores(tool, values):
+    plus = minus = 0
+    mode = tool.get("scoring_mode", "signed")
+    for rule in tool.get("scoring_rules", []):
+        if not rule.get("input_id"):
+            continue
+        value = values.get(rule["input_id"])
+        invert = rule.get("invert_favor", False)
+        weight = rule.get("weight", 1) or 1
+        favor = value in rule.get("favor_values", []) or any(_holds({**band, "input_id": "v"}, {"v": value}) for band in rule.get("favor_ranges", []))
+        against = value in rule.get("against_values", []) or any(_holds({**band, "input_id": "v"}, {"v": value}) for band in rule.get("against_ranges", []))
+        score = (-1 if invert else 1) if favor else (1 if invert else -1) if against else 0
+        if score == 1:
+            plus += weight
+        elif score == -1 and mode == "signed":
+            minus += weight
+    return plus, minus, plus - minus if mode == "signed" else plus
+
+
+def _reference_recommendation(tool, values, total):
+    best = None
+    for item in tool.get("scoring_recommendations", []):
+        try:
+            min_score = int(item.get("min_score"))
+        except (TypeError, ValueError):
+            continue
+        conditions = item.get("conditions", [])
+        if total < min_score or not all(_holds(cond, values) for cond in conditions):
+            continue
+        ratio = 1.0
+        if best is None or min_score > best["min_score"] or (min_score == best["min_score"] and ratio > best["ratio"]):
+            best = {"min_score": min_score, "level": item.get("level", "info"), "message": item.get("message", ""), "matched": len(conditions), "ratio": ratio}
+    return best
+
+
+def _reference_evaluate(tool, values):
+    result = {"rule": _reference_rules(tool, values), "plus": None, "minus": None, "total": None, "score_recommendation": None}
+    if tool.get("scoring_rules"):
+        plus, minus, total = _reference_scores(tool, values)
+        result.update(plus=plus, minus=minus, total=total)
+        result["score_recommendation"] = _reference_recommendation(tool, values, total)
+    return result
+
+
+def _random_condition(r, choices, numbers):
+    input_id = r.choice([*choices, *numbers])
+    if input_id in numbers:
+        op = r.choice(["lt", "lte", "gt", "gte", "between", "equals", "not_equals"])
+        if op == "between":
+            low = r.randrange(0, 8)
+            value = [low, low + r.randrange(-1, 4)]
+        else:
+            value = r.randrange(0, 10)
+        return {"input_id": input_id, "op": op, "value": value}
+    cond = {"input_id": input_id, "value": r.choice([*choices[input_id], "Other", ["Yes"]])}
+    if r.random() < 0.4:
+        cond["op"] = r.choice(["not_equals", " NOT_EQUALS ", "equals", "bogus"])
+    if r.random() < 0.5:
+        cond["join_with_previous"] = r.choice(["AND", "or", "OR", " and", "xor"])
+    return cond
+
+
+def _random_tool(seed, choices, numbers=(), max_rules=25, weights=(2, 0, 0.5)):
+    # choices maps select input ids to their options; numbers are number
+    # inputs, compared through range conditions and scoring bands.
+    r = random.Random(seed)
+    numbers = list(numbers)
+    rules = []
+    for k in range(r.randint(1, max_rules)):
+        rule = {"name": f"R{k}", "message": f"M{k}", "conditions": [_random_condition(r, choices, numbers) for _ in range(r.randint(0, 5))]}
+        if r.random() < 0.5:
+            rule["condition_operator"] = r.choice(["AND", "OR", "or", "nand"])
+        rules.append(rule)
+    scoring = []
+    for input_id, options in choices.items():
+        rule = {"input_id": input_id, "favor_values": [r.choice(options)], "against_values": [r.choice(options)]}
+        if r.random() < 0.3:
+            rule["invert_favor"] = True
+        if r.random() < 0.3:
+            rule["weight"] = r.choice(weights)
+        scoring.append(rule)
+    for input_id in numbers:
+        scoring.append(
+            {"input_id": input_id, "favor_ranges": [{"op": "gte", "value": r.randrange(4, 9)}], "against_ranges": [{"op": "between", "value": [0, 2]}]}
+        )
+    recommendations = [
+        {
+            "min_score": r.choice([-2, 0, 1, 2, "x", None]),
+            "message": f"S{k}",
+            "conditions": [_random_condition(r, choices, numbers) for _ in range(r.randint(0, 2))],
+        }
+        for k in range(r.randint(0, 5))
+    ]
+    inputs = [{"id": input_id, "type": "select", "options": list(options)} for input_id, options in choices.items()]
+    inputs += [{"id": input_id, "type": "number"} for input_id in numbers]
+    return {
+        "inputs": inputs,
+        "rules": rules,
+        "scoring_rules": scoring,
+        "scoring_mode": r.choice(["signed", "unsigned"]),
+        "scoring_recommendations": recommendations,
+    }
+
+
+@pytest.fixture
+def reference():
+    return SimpleNamespace(
+        holds=_holds,
+        rules=_reference_rules,
+        scores=_reference_scores,
+        recommendation=_reference_recommendation,
+        evaluate=_reference_evaluate,
+    )
+
+
+@pytest.fixture
+def random_tool():
+    return _random_tool
+
+
+@pytest.fixture
+def calculators_dir(tmp_path):
+    # An empty calculators directory the registry reads instead of the
+    # shipped one for the duration of the test.
+    root = tmp_path / "calculators"
+    root.mkdir()
+    previous = calculator_engine.CALCULATORS_DIR
+    calculator_engine.set_calculators_dir(str(root))
+    yield root
+    calculator_engine.set_calculators_dir(previous)
+
+
+@pytest.fixture
+def metrics():
+    perf_metrics.reset_metrics()
+    perf_metrics.set_enabled(True)
+    yield lambda: perf_metrics.snapshot()["counters"]
+    perf_metrics.set_enabled(False)
+    perf_metrics.reset_metrics()
+
+
+@pytest.fixture
+def standin(tmp_path, monkeypatch):
+    # start(**options) serves tmp_path/"remote" through the GitHub stand-in and
+    # points github_sync at it; returns the server, whose .state counts requests.
+    servers = []
+
+    def start(**options):
+        root = tmp_path / "remote"
+        root.mkdir(exist_ok=True)
+        server, url = start_standin_server(str(root), **options)
+        servers.append(server)
+        monkeypatch.setattr(github_sync, "GITHUB_API_URL", url)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
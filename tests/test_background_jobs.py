@@ -0,0 +1,97 @@
+import threading
+import time
+
+import background_jobs
+from background_jobs import cancel_job, get_job, submit_job
+
+# Jobs are shared per key, stop when cancelled and stop by themselves once
+# their deadline passes.
+
+
+def _wait(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.active() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not job.active()
+
+
+def _blocker(release: threading.Event):
+    def run(job):
+        release.wait(5)
+        return "released"
+
+    return run
+
+
+def test_same_key_is_one_job():
+    release = threading.Event()
+    calls = []
+
+    def run(job):
+        calls.append(job)
+        release.wait(5)
+        return len(calls)
+
+    first = submit_job("test-dedup", run)
+    second = submit_job("test-dedup", run)
+    assert second is first
+    assert get_job("test-dedup") is first
+    release.set()
+    _wait(first)
+    assert (first.status, first.result, len(calls)) == ("done", 1, 1)
+    # A finished job does not hold the key.
+    third = submit_job("test-dedup", run)
+    assert third is not first
+    _wait(third)
+
+
+def test_cancel_stops_a_queued_job():
+    release = threading.Event()
+    blockers = [submit_job(f"test-busy-{k}", _blocker(release)) for k in range(background_jobs.JOB_WORKERS)]
+    ran = []
+    queued = submit_job("test-queued", lambda job: ran.append(job))
+    assert queued.status == "queued"
+    assert cancel_job("test-queued")
+    release.set()
+    _wait(queued)
+    assert queued.status == "cancelled"
+    assert ran == []
+    assert not cancel_job("test-queued")
+    for job in blockers:
+        _wait(job)
+
+
+def test_running_job_stops_when_cancelled():
+    started = threading.Event()
+
+    def run(job):
+        started.set()
+        while not job.cancelled():
+            time.sleep(0.01)
+        return "partial"
+
+    job = submit_job("test-cancel-running", run)
+    assert started.wait(5)
+    assert cancel_job("test-cancel-running")
+    _wait(job)
+    assert (job.status, job.result) == ("cancelled", "partial")
+
+
+def test_overrun_deadline_times_the_job_out():
+    def run(job):
+        while not job.cancelled():
+            time.sleep(0.01)
+
+    job = submit_job("test-deadline", run, timeout=0.05)
+    _wait(job)
+    assert job.status == "timed_out"
+    assert not job.active()
+
+
+def test_exception_marks_the_job_failed():
+    def run(job):
+        raise ValueError("bad calculator")
+
+    job = submit_job("test-failure", run)
+    _wait(job)
+    assert (job.status, job.error) == ("failed", "ValueError: bad calculator")
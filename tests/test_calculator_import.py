@@ -0,0 +1,67 @@
+import base64
+import io
+import json
+import random
+import zipfile
+
+import calculator_import
+from calculator_bench import synthetic_calculator
+from calculator_import import import_repo_files, plan_import, read_import_archive, write_import
+from github_sync import api_url, commit_files, github_request
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+
+
+def _archive(n_calculators):
+    rng = random.Random(21)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for i in range(n_calculators):
+            data = synthetic_calculator(rng, n_rules=5, n_inputs=4)
+            archive.writestr(f"calculators/Cardiac/Imported/tool_{i}.json", json.dumps(data))
+        archive.writestr("calculators/Cardiac/Imported/tool_0_guideline.png", PNG)
+        archive.writestr("__MACOSX/._tool_0.json", b"")
+        archive.writestr("notes.txt", b"skipped")
+    return buffer.getvalue()
+
+
+def test_import_is_pushed_as_one_commit_under_rate_limiting(tmp_path, standin, metrics, monkeypatch):
+    server = standin(rate_limit_every=4, latency=0.002)
+    remote = tmp_path / "remote"
+    (remote / "calculators/Cardiac").mkdir(parents=True)
+    (remote / "calculators/Cardiac/existing.json").write_bytes(b'{"name": "Existing"}')
+    local = tmp_path / "local"
+    monkeypatch.setattr(calculator_import, "schedule_variants", lambda data: None)
+
+    plan = plan_import(read_import_archive(_archive(20)), str(local), ["Cardiac"], {"Cardiac"})
+    assert plan["errors"] == []
+    assert (len(plan["calculators"]), len(plan["images"]), len(plan["skipped"])) == (20, 1, 1)
+    written = write_import(plan)
+    assert len(written) == 21 and (local / "Cardiac/Imported/tool_7.json").is_file()
+
+    # Someone else pushes after the ref was read: the first ref update is not
+    # a fast forward (422) and the commit is rebuilt on the new head.
+    pushed = []
+
+    def progress(done, total, message=None):
+        if done == total - 1 and not pushed:
+            payload = {"message": "concurrent edit", "content": base64.b64encode(b'{"name": "Other"}').decode("ascii")}
+            pushed.append(github_request("PUT", api_url("contents/calculators/Thoracic/other.json"), None, payload))
+
+    repo_files = import_repo_files(plan)
+    result = commit_files(None, repo_files, "Import calculators", workers=4, progress=progress)
+
+    assert result["files"] == 21 and not result["cancelled"]
+    with server.state.lock:
+        head = dict(server.state.head)
+        commit = server.state.commits[head["sha"]]
+    assert head["sha"] == result["commit"]
+    assert commit["parents"] == [pushed[0]["commit"]["sha"]]
+    for repo_path, data in repo_files.items():
+        assert (remote / repo_path).read_bytes() == data
+    assert (remote / "calculators/Thoracic/other.json").is_file()
+    assert (remote / "calculators/Cardiac/existing.json").is_file()
+
+    counters = metrics()
+    assert counters["github.commit_retries"] == 1
+    assert counters["github.retries"] >= 1
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from calculator_schema import parse_calculator, validate_calculator
+
+CALCULATORS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "calculators")
+SHIPPED = sorted(
+    os.path.relpath(os.path.join(root, name), CALCULATORS)
+    for root, _dirs, files in os.walk(CALCULATORS)
+    for name in files
+    if name.endswith(".json")
+)
+
+
+@pytest.mark.parametrize("rel_path", SHIPPED)
+def test_shipped_calculators_validate(rel_path):
+    with open(os.path.join(CALCULATORS, rel_path), "rb") as f:
+        assert parse_calculator(f.read())[1] == []
+
+
+def _number_tool(cond):
+    return {
+        "name": "t",
+        "inputs": [{"id": "size", "label": "Size", "type": "number"}],
+        "rules": [{"name": "r", "message": "m", "conditions": [{"input_id": "size", **cond}]}],
+    }
+
+
+def test_number_conditions_take_numbers_or_ranges():
+    assert validate_calculator(_number_tool({"op": "gt", "value": 50})) == []
+    assert validate_calculator(_number_tool({"op": "between", "value": [10, 20]})) == []
+    errors = validate_calculator(_number_tool({"op": "equals", "value": ">50"}))
+    assert len(errors) == 1 and "expected a number" in errors[0]
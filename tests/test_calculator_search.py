@@ -0,0 +1,55 @@
+import json
+
+import calculator_search
+from calculator_engine import invalidate_calculators
+from calculator_search import search_calculators
+
+# Search keeps its inverted index in step with the catalog; queries match terms
+# exactly, as a prefix, or within one edit.
+
+
+def _add(root, rel_path, name, **extra):
+    path = root.joinpath(*rel_path.split("/"))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"name": name, "inputs": [], "rules": [], **extra}))
+    invalidate_calculators([str(path)])
+    return path
+
+
+def _names(query):
+    return [calc["name"] for calc in search_calculators(query)]
+
+
+def test_exact_prefix_and_fuzzy_matches(calculators_dir):
+    _add(calculators_dir, "Cardiac/Tricuspid/repair.json", "Tricuspid Repair", description="Annulus dilatation")
+    _add(calculators_dir, "Cardiac/Aortic/avr.json", "Aortic Valve Replacement")
+    assert _names("tricuspid") == ["Tricuspid Repair"]
+    assert _names("tricus") == ["Tricuspid Repair"]
+    assert _names("aortc") == ["Aortic Valve Replacement"]
+    assert _names("valev replacement") == ["Aortic Valve Replacement"]
+    # Every token has to match, and short tokens are not matched fuzzily.
+    assert _names("aortic annulus") == []
+    assert _names("abc") == []
+    # Category names are indexed too; the name match ranks first.
+    assert _names("cardiac") == ["Aortic Valve Replacement", "Tricuspid Repair"]
+    assert _names("replacement tricuspid") == []
+
+
+def test_index_follows_added_and_removed_calculators(calculators_dir):
+    _add(calculators_dir, "Cardiac/Aortic/avr.json", "Aortic Valve Replacement")
+    assert _names("mitral") == []
+    mitral = _add(calculators_dir, "Cardiac/Mitral/clip.json", "Mitral Clip")
+    assert _names("mitral") == ["Mitral Clip"]
+    mitral.unlink()
+    invalidate_calculators([str(mitral)])
+    assert _names("mitral") == []
+    assert _names("aortic") == ["Aortic Valve Replacement"]
+
+
+def test_persisted_index_is_reused(calculators_dir):
+    _add(calculators_dir, "Cardiac/Aortic/avr.json", "Aortic Valve Replacement")
+    assert _names("valve") == ["Aortic Valve Replacement"]
+    # A new process starts from the saved postings.
+    calculator_search._STATE["root"] = None
+    assert _names("valve") == ["Aortic Valve Replacement"]
+    assert calculator_search._STATE["doc_terms"] is None
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+
+import pytest
+
+import catalog_watch
+from calculator_engine import _CatalogLock
+
+# The catalog lock lets sessions read side by side while an admin action
+# waits for them and then runs alone; the watcher turns file changes into
+# registry invalidations.
+
+
+def _hold(context, entered: threading.Event, release: threading.Event):
+    def run():
+        with context():
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_readers_share_the_lock():
+    lock = _CatalogLock()
+    entered, release = threading.Event(), threading.Event()
+    holder = _hold(lock.reading, entered, release)
+    assert entered.wait(5)
+    second = threading.Event()
+    _hold(lock.reading, second, release)
+    assert second.wait(5)
+    release.set()
+    holder.join(5)
+
+
+def test_writer_waits_for_readers_and_holds_off_new_ones():
+    lock = _CatalogLock()
+    reader_in, reader_release = threading.Event(), threading.Event()
+    reader = _hold(lock.reading, reader_in, reader_release)
+    assert reader_in.wait(5)
+
+    writer_in, writer_release = threading.Event(), threading.Event()
+    writer = _hold(lock.writing, writer_in, writer_release)
+    assert not writer_in.wait(0.1)
+    # A reader arriving while the writer waits queues behind it.
+    late_in, late_release = threading.Event(), threading.Event()
+    late = _hold(lock.reading, late_in, late_release)
+    assert not late_in.wait(0.1)
+
+    reader_release.set()
+    assert writer_in.wait(5)
+    assert not late_in.wait(0.1)
+    writer_release.set()
+    assert late_in.wait(5)
+    late_release.set()
+    for thread in (reader, writer, late):
+        thread.join(5)
+
+
+def test_reader_cannot_upgrade():
+    lock = _CatalogLock()
+    with lock.reading():
+        with pytest.raises(RuntimeError):
+            with lock.writing():
+                pass
+    # The writing thread may read, reentrantly.
+    with lock.writing():
+        with lock.reading():
+            with lock.writing():
+                pass
+
+
+def _wait_for(calls, predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if any(predicate(paths) for paths in list(calls)):
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_polling_watcher_invalidates_changed_files(calculators_dir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(catalog_watch, "_start_observer", lambda root: None)
+    monkeypatch.setattr(catalog_watch, "invalidate_calculators", lambda paths=None: calls.append(None if paths is None else list(paths)))
+    path = calculators_dir / "Cardiac" / "a.json"
+    path.parent.mkdir()
+    try:
+        assert catalog_watch.start_catalog_watcher(poll_seconds=0.02) == "polling"
+        assert calls == [None]
+
+        def touched(paths):
+            return paths is not None and str(path) in paths
+
+        path.write_text('{"name": "A"}')
+        assert _wait_for(calls, touched)
+        calls.clear()
+        path.write_text('{"name": "A, edited"}')
+        assert _wait_for(calls, touched)
+        calls.clear()
+        # Same size, mtime put back: only the ctime moves.
+        stat = path.stat()
+        time.sleep(0.05)
+        path.write_text('{"name": "B, edited"}')
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert _wait_for(calls, touched)
+        calls.clear()
+        path.unlink()
+        assert _wait_for(calls, touched)
+        # Files other than calculator JSON are not reported.
+        calls.clear()
+        (calculators_dir / "notes.txt").write_text("x")
+        time.sleep(0.1)
+        assert calls == []
+    finally:
+        catalog_watch.stop_catalog_watcher()
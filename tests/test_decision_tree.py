@@ -0,0 +1,134 @@
+import glob
+import json
+import os
+import random
+import re
+
+import pytest
+
+from calculator_engine import build_decision_tree_graph, build_label_maps
+
+# The DOT is built from a cached template and patched per rerun; it must be
+# the graph the app drew before caching, and the collapsed trie must show
+# every rule's path with the same highlights.
+
+CALCULATORS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "calculators")
+SHIPPED = sorted(glob.glob(os.path.join(CALCULATORS_DIR, "**", "*.json"), recursive=True))
+CHOICES = {"a": ["Yes", "No"], "b": ["Yes", "No", "Unknown"]}
+OP_LABELS = {"not_equals": "!=", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+
+
+def reference_graph(tool, id_to_label, holds, values=None):
+    values = values or {}
+    lines = [
+        "digraph DecisionTree {",
+        'rankdir=LR;',
+        'node [shape=box, style="rounded,filled", color="gray35", fillcolor="white"];',
+    ]
+    lines.append('start [label="Start", shape=oval, fillcolor="white"];')
+    for ridx, rule in enumerate(tool.get("rules", [])):
+        conditions = rule.get("conditions", [])
+        rule_node = f"rule_{ridx}"
+        rule_label = str(rule.get("name", "")).strip() or f"Rule {ridx + 1}"
+        rule_match = all(holds(c, values) for c in conditions) if conditions else False
+        rule_attrs = 'fillcolor="white"'
+        if rule_match:
+            rule_attrs = 'fillcolor="lightyellow", color="goldenrod"'
+        lines.append(f'{rule_node} [label="{rule_label}", {rule_attrs}];')
+        lines.append(f"start -> {rule_node};")
+
+        prev_node = rule_node
+        for cidx, cond in enumerate(conditions):
+            cond_node = f"rule_{ridx}_cond_{cidx}"
+            cond_attrs = 'fillcolor="white"'
+            if values and holds(cond, values):
+                cond_attrs = 'fillcolor="palegreen", color="green"'
+            lines.append(f'{cond_node} [label="{condition_label(cond, id_to_label)}", {cond_attrs}];')
+            lines.append(f"{prev_node} -> {cond_node};")
+            prev_node = cond_node
+
+        out_node = f"rule_{ridx}_out"
+        msg = str(rule.get("message", "")).strip() or "Recommendation"
+        msg = msg.replace('"', "'")
+        out_attrs = 'fillcolor="white"'
+        if rule_match:
+            out_attrs = 'fillcolor="lightblue", color="dodgerblue4"'
+        lines.append(f'{out_node} [shape=note, label="{msg}", {out_attrs}];')
+        lines.append(f"{prev_node} -> {out_node};")
+
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def condition_label(cond, id_to_label):
+    input_label = id_to_label.get(cond.get("input_id", ""), cond.get("input_id", ""))
+    op = str(cond.get("op", "equals")).strip().lower()
+    value = cond.get("value", "")
+    if op == "between" and isinstance(value, list) and len(value) == 2:
+        return f"{input_label} between {value[0]} and {value[1]}".replace('"', "'")
+    return f"{input_label} {OP_LABELS.get(op, '=')} {str(value).strip()}".replace('"', "'")
+
+
+def _parse(dot):
+    nodes, parents = {}, {}
+    for line in dot.splitlines():
+        edge = re.fullmatch(r"(\w+) -> (\w+);", line)
+        if edge:
+            parents[edge.group(2)] = edge.group(1)
+            continue
+        node = re.fullmatch(r'(\w+) \[(?:shape=note, )?label="(.*)", (fillcolor="\w+"(?:, color="\w+")?)\];', line)
+        if node:
+            nodes[node.group(1)] = (node.group(2), node.group(3))
+    return nodes, parents
+
+
+def _random_values(r, tool):
+    values = {}
+    for item in tool.get("inputs", []):
+        if item.get("type", "select") == "select":
+            values[item["id"]] = r.choice(item.get("options") or [""])
+        elif item.get("type") == "number":
+            values[item["id"]] = float(r.choice([0, 20, 25, 26, 49, 50, 51, 60, 100]))
+        else:
+            values[item["id"]] = ""
+    return values
+
+
+def _cases(random_tool):
+    for path in SHIPPED:
+        with open(path, "r", encoding="utf-8") as f:
+            yield os.path.relpath(path, CALCULATORS_DIR), json.load(f)
+    for seed in range(20):
+        yield f"random-{seed}", random_tool(seed, CHOICES, numbers=["n"], max_rules=12)
+
+
+def _values(tool, seed):
+    r = random.Random(seed)
+    return [None, {}] + [_random_values(r, tool) for _ in range(8)]
+
+
+def test_graph_matches_the_uncached_builder(random_tool, reference):
+    assert SHIPPED
+    for name, tool in _cases(random_tool):
+        id_to_label = build_label_maps(tool.get("inputs", []))
+        for values in _values(tool, name):
+            expected = reference_graph(tool, id_to_label, reference.holds, values)
+            assert build_decision_tree_graph(tool, id_to_label, values) == expected, name
+
+
+def test_collapsed_graph_keeps_every_path_and_highlight(random_tool, reference):
+    for name, tool in _cases(random_tool):
+        id_to_label = build_label_maps(tool.get("inputs", []))
+        for values in _values(tool, name):
+            plain, _ = _parse(reference_graph(tool, id_to_label, reference.holds, values))
+            nodes, parents = _parse(build_decision_tree_graph(tool, id_to_label, values, collapsed=True))
+            for ridx, rule in enumerate(tool.get("rules", [])):
+                out = f"rule_{ridx}_out"
+                assert nodes[out][1] == plain[out][1], name
+                path = []
+                node = parents[out]
+                while node != "start":
+                    path.append(nodes[node])
+                    node = parents[node]
+                expected = [plain[f"rule_{ridx}_cond_{cidx}"] for cidx in range(len(rule.get("conditions", [])))]
+                assert path[::-1] == expected, name
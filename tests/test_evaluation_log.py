@@ -0,0 +1,91 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+import evaluation_log
+from evaluation_log import flush_evaluation_log, log_evaluation, recent_evaluations, recommendation_distribution, set_evaluation_log
+
+# Logged evaluations reach SQLite through the background writer, and the
+# weekly rollup counts every outcome.
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = str(tmp_path / "evaluations.sqlite")
+    set_evaluation_log(path)
+    yield path
+    set_evaluation_log(None)
+
+
+def _result(rule_message, score_message=None, total=None):
+    rule = {"level": "success", "message": rule_message} if rule_message else None
+    reco = {"level": "info", "message": score_message} if score_message else None
+    return {"rule": rule, "plus": total, "minus": 0 if total is not None else None, "total": total, "score_recommendation": reco}
+
+
+def test_logged_evaluations_are_counted(log_path, metrics):
+    calc = {"id": "Cardiac/a.json", "hash": "h1"}
+    outcomes = [_result("Repair", "Low risk", 2)] * 7 + [_result("Replace")] * 4 + [_result(None)] * 3
+    for k, result in enumerate(outcomes):
+        log_evaluation(calc, {"size": k}, result, 0.001)
+    log_evaluation({"id": "other.json"}, {}, _result("Repair"), 0.001)
+    assert flush_evaluation_log()
+    assert metrics()["eval_log.written"] == len(outcomes) + 1
+
+    recent = recent_evaluations("Cardiac/a.json", limit=5)
+    assert [row["inputs"] for row in recent] == [{"size": k} for k in range(13, 8, -1)]
+    assert recent[0]["rule_message"] is None
+    assert len(recent_evaluations("Cardiac/a.json")) == len(outcomes)
+    older = recent_evaluations("Cardiac/a.json", before=recent[-1]["logged_at"])
+    assert all(row["logged_at"] < recent[-1]["logged_at"] for row in older)
+
+    week = evaluation_log.week_start(evaluation_log._week(recent[0]["logged_at"]))
+    rows = recommendation_distribution("Cardiac/a.json")
+    assert [(row["rule_message"], row["score_message"], row["evaluations"]) for row in rows] == [
+        ("Repair", "Low risk", 7),
+        ("Replace", "", 4),
+        ("", "", 3),
+    ]
+    assert {row["week"] for row in rows} == {week}
+    assert len(recommendation_distribution()) == 4
+    next_week = datetime.date.fromisoformat(week) + datetime.timedelta(days=7)
+    assert recommendation_distribution("Cardiac/a.json", since=next_week) == []
+
+
+def test_disabled_log_writes_nothing(tmp_path):
+    set_evaluation_log(None)
+    log_evaluation({"id": "a.json"}, {}, _result("Repair"), 0.001)
+    assert flush_evaluation_log()
+    assert recent_evaluations("a.json", path=str(tmp_path / "missing.sqlite")) == []
+
+
+def test_stopping_behind_a_full_queue_does_not_block(tmp_path, monkeypatch, metrics):
+    monkeypatch.setattr(evaluation_log, "EVAL_LOG_QUEUE_SIZE", 2)
+    monkeypatch.setattr(evaluation_log, "EVAL_LOG_FLUSH_SECONDS", 0.02)
+    release = threading.Event()
+    write_batch = evaluation_log._write_batch
+
+    def stuck(conn, batch):
+        release.wait(5)
+        write_batch(conn, batch)
+
+    monkeypatch.setattr(evaluation_log, "_write_batch", stuck)
+    set_evaluation_log(str(tmp_path / "evaluations.sqlite"))
+    log_evaluation({"id": "a.json"}, {}, _result("Repair"), 0.001)
+    time.sleep(0.1)
+    for _ in range(5):
+        log_evaluation({"id": "a.json"}, {}, _result("Repair"), 0.001)
+    writer = evaluation_log._STATE["thread"]
+
+    started = time.monotonic()
+    set_evaluation_log(None)
+    assert time.monotonic() - started < 2
+    assert metrics()["eval_log.stop_timeouts"] == 1
+
+    # Once unblocked, the old writer drains its queue and exits.
+    release.set()
+    writer.join(2)
+    assert not writer.is_alive()
+    assert len(recent_evaluations("a.json", path=str(tmp_path / "evaluations.sqlite"))) == 3
@@ -0,0 +1,81 @@
+import base64
+import json
+import time
+
+import pytest
+
+from github_sync import api_url, git_blob_sha, github_request, load_manifest, sync_calculators
+
+
+def _write(root, rel_path, data):
+    path = root / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def _calculator(name):
+    return json.dumps({"name": name, "inputs": [], "rules": []}).encode("utf-8")
+
+
+def _local_files(dest):
+    return {str(path.relative_to(dest)).replace("\\", "/"): path.read_bytes() for path in dest.rglob("*") if path.is_file() and not path.name.startswith(".")}
+
+
+@pytest.mark.parametrize("rate_limit_status", [429, 403])
+def test_sync_survives_rate_limiting(tmp_path, standin, metrics, rate_limit_status):
+    server = standin(rate_limit_every=5, latency=0.002, rate_limit_status=rate_limit_status)
+    remote = tmp_path / "remote"
+    dest = tmp_path / "local"
+    for i in range(12):
+        _write(remote, f"calculators/Cardiac/tool_{i}.json", _calculator(f"Tool {i}"))
+    _write(remote, "calculators/Cardiac/tool_0_guideline.png", b"\x89PNG fake")
+    _write(remote, "calculators/notes.txt", b"not synced")
+    _write(remote, "README.md", b"outside calculators/")
+
+    first = sync_calculators(None, str(dest), workers=4)
+    assert (first["added"], first["updated"], first["removed"], first["failed"]) == (13, 0, 0, 0)
+    expected = {path[len("calculators/") :]: data for path, data in _local_files(remote).items() if path.startswith("calculators/") and not path.endswith(".txt")}
+    assert _local_files(dest) == expected
+
+    _write(remote, "calculators/Cardiac/tool_1.json", _calculator("Tool 1, revised"))
+    _write(remote, "calculators/Thoracic/new_tool.json", _calculator("New"))
+    (remote / "calculators/Cardiac/tool_2.json").unlink()
+    second = sync_calculators(None, str(dest), workers=4)
+    assert (second["added"], second["updated"], second["removed"], second["failed"]) == (1, 1, 1, 0)
+    assert (dest / "Cardiac/tool_1.json").read_bytes() == _calculator("Tool 1, revised")
+    assert not (dest / "Cardiac/tool_2.json").exists()
+    assert load_manifest(str(dest))["files"]["calculators/Thoracic/new_tool.json"]["sha"] == git_blob_sha(_calculator("New"))
+
+    # Unchanged tree: answered by the ETag, nothing downloaded.
+    third = sync_calculators(None, str(dest), workers=4)
+    assert (third["added"], third["updated"], third["removed"], third["unchanged"]) == (0, 0, 0, 13)
+
+    counters = metrics()
+    assert counters["github.retries"] >= server.state.request_count // 5 > 0
+
+
+def test_throttled_puts_keep_the_connection_usable(tmp_path, standin):
+    # Every other request is refused; the refused PUT's body must not be read
+    # as the next request on the same keep-alive connection.
+    server = standin(rate_limit_every=2)
+    sha = None
+    for i in range(6):
+        payload = {"message": f"save {i}", "content": base64.b64encode(_calculator(f"v{i}")).decode("ascii")}
+        if sha:
+            payload["sha"] = sha
+        sha = github_request("PUT", api_url("contents/calculators/tool.json"), None, payload)["content"]["sha"]
+    assert (tmp_path / "remote/calculators/tool.json").read_bytes() == _calculator("v5")
+    assert len(server.state.connections) == 1
+
+
+def test_post_on_a_connection_closed_while_idle_is_resent(standin, metrics):
+    # The stand-in hangs up between the two POSTs; the second one never reached
+    # it, so it goes out again on a fresh connection.
+    server = standin(idle_timeout=0.05)
+    first = github_request("POST", api_url("git/blobs"), None, {"content": "one", "encoding": "utf-8"})
+    time.sleep(0.3)
+    second = github_request("POST", api_url("git/blobs"), None, {"content": "two", "encoding": "utf-8"})
+    assert (first["sha"], second["sha"]) == (git_blob_sha(b"one"), git_blob_sha(b"two"))
+    assert server.state.requests_by_route["git/blobs"] == 2
+    assert len(server.state.connections) == 2
+    assert metrics()["github.reconnects"] == 1
@@ -0,0 +1,71 @@
+import hashlib
+from collections import OrderedDict
+
+import pytest
+
+import image_cache
+from image_cache import get_github_image, read_cached_image, read_local_image, store_image_bytes
+
+# GitHub images are revalidated with their ETag: a 304 keeps the cached bytes
+# and a new ETag replaces them. The in-memory copies stay within a byte budget.
+
+
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache, "IMAGE_CACHE_DIR", str(tmp_path / "images"))
+    monkeypatch.setattr(image_cache, "_MEMORY", OrderedDict())
+    monkeypatch.setattr(image_cache, "_MEMORY_STATE", {"bytes": 0})
+    monkeypatch.setattr(image_cache, "_INDEX", {"loaded": False, "entries": {}})
+    return tmp_path / "images"
+
+
+def test_etag_revalidation(image_dir, standin, metrics, monkeypatch):
+    server = standin()
+    image = image_dir.parent / "remote" / "calculators" / "guide.png"
+    image.parent.mkdir(parents=True)
+    image.write_bytes(b"first image")
+    assert get_github_image("calculators/guide.png", None) == (b"first image", None)
+    assert metrics().get("image_cache.downloaded") == 1
+
+    # Within the revalidation window nothing is requested.
+    requests = server.state.request_count
+    assert get_github_image("calculators/guide.png", None) == (b"first image", None)
+    assert server.state.request_count == requests
+
+    monkeypatch.setattr(image_cache, "IMAGE_REVALIDATE_SECONDS", 0.0)
+    assert get_github_image("calculators/guide.png", None) == (b"first image", None)
+    assert metrics().get("image_cache.revalidated") == 1
+    assert metrics().get("image_cache.downloaded") == 1
+
+    image.write_bytes(b"second image")
+    assert get_github_image("calculators/guide.png", None) == (b"second image", None)
+    assert metrics().get("image_cache.downloaded") == 2
+    digest = hashlib.sha256(b"second image").hexdigest()
+    assert image_cache._load_index()["calculators/guide.png"]["sha256"] == digest
+    assert (image_dir / digest).read_bytes() == b"second image"
+
+    # A failed revalidation serves the cached copy.
+    image.unlink()
+    assert get_github_image("calculators/guide.png", None) == (b"second image", None)
+    assert get_github_image("calculators/missing.png", None) == (None, "GitHub fetch failed: HTTP 404")
+
+
+def test_memory_budget_evicts_least_recently_used(image_dir, monkeypatch):
+    monkeypatch.setattr(image_cache, "IMAGE_MEMORY_BUDGET", 250)
+    blobs = [bytes([k]) * 100 for k in range(3)]
+    digests = [store_image_bytes(blob) for blob in blobs]
+    assert list(image_cache._MEMORY) == digests[1:]
+    assert image_cache._MEMORY_STATE["bytes"] == 200
+
+    # Reading an evicted image brings it back from disk as the newest entry.
+    assert read_cached_image(digests[0]) == blobs[0]
+    assert list(image_cache._MEMORY) == [digests[2], digests[0]]
+    assert read_cached_image(digests[2]) == blobs[2]
+    store_image_bytes(b"x" * 100)
+    assert list(image_cache._MEMORY) == [digests[2], hashlib.sha256(b"x" * 100).hexdigest()]
+
+    # Anything larger than the whole budget is served but never kept.
+    big = image_dir / "big.png"
+    big.write_bytes(b"y" * 300)
+    assert read_local_image(str(big)) == b"y" * 300
+    assert image_cache._MEMORY_STATE["bytes"] == 200
@@ -0,0 +1,45 @@
+import io
+from collections import OrderedDict
+
+import pytest
+
+import image_cache
+import image_variants
+from image_variants import IMAGE_VARIANTS, best_variant, generate_variants
+
+Image = pytest.importorskip("PIL.Image")
+
+# Every variant that is rendered is one the page can serve.
+
+
+@pytest.fixture
+def image_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_variants, "IMAGE_CACHE_DIR", str(tmp_path / "images"))
+    monkeypatch.setattr(image_cache, "_MEMORY", OrderedDict())
+    monkeypatch.setattr(image_cache, "_MEMORY_STATE", {"bytes": 0})
+    return tmp_path / "images"
+
+
+def _png(width, height):
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_screen_variant_is_rendered_and_served(image_dir):
+    data = _png(2000, 500)
+    written = generate_variants(data)
+    assert set(written) == set(IMAGE_VARIANTS) == {"screen"}
+    with Image.open(written["screen"]) as variant:
+        assert (variant.format, variant.size) == ("WEBP", (1280, 320))
+    served = best_variant(data)
+    assert len(served) < len(data)
+    with open(written["screen"], "rb") as f:
+        assert served == f.read()
+
+
+def test_source_is_served_until_its_variant_exists(image_dir, monkeypatch):
+    # Nothing is rendered; the variant is still pending.
+    monkeypatch.setattr(image_variants, "schedule_variants", lambda data: "pending")
+    data = _png(2000, 500)
+    assert best_variant(data) is data
@@ -0,0 +1,88 @@
+import itertools
+
+import pytest
+
+import outcome_tables
+from calculator_engine import evaluate_calculator
+from outcome_tables import (
+    build_outcome_table,
+    evaluate_outcome,
+    get_outcome_table,
+    load_outcome_table,
+    precompile_outcome_table,
+    save_outcome_table,
+)
+
+# Outcome tables precompute evaluate_calculator over every combination of
+# select options; a lookup must return exactly what evaluation would.
+
+CHOICES = {"in0": ["Yes", "No", "Unknown"], "in1": ["Low", "High"], "in2": [1, 2, 3], "in3": ["A", "B", "C", ""]}
+
+
+def _calc(tool, tmp_path, seed):
+    return {"id": f"t{seed}.json", "path": str(tmp_path / f"t{seed}.json"), "hash": f"test-outcomes-{seed}", "data": tool}
+
+
+def _all_values(tool):
+    ids = [item["id"] for item in tool["inputs"]]
+    for combination in itertools.product(*(item["options"] for item in tool["inputs"])):
+        yield dict(zip(ids, combination))
+
+
+def _assert_same(result, expected):
+    assert result["rule"] is expected["rule"]
+    assert (result["plus"], result["minus"], result["total"]) == (expected["plus"], expected["minus"], expected["total"])
+    assert result["score_recommendation"] == expected["score_recommendation"]
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_table_lookups_match_evaluation(seed, tmp_path, random_tool):
+    tool = random_tool(seed, CHOICES, max_rules=15, weights=(2, 3))
+    calc = _calc(tool, tmp_path, seed)
+    table = precompile_outcome_table(calc)
+    assert table is not None
+    for values in _all_values(tool):
+        assert outcome_tables._pack_values(table, values) is not None
+        _assert_same(evaluate_outcome(calc, values), evaluate_calculator(tool, values))
+    # Values outside the table fall back to evaluation.
+    for values in ({"in0": "Maybe", "in1": "Low", "in2": 1, "in3": "A"}, {"in0": "Yes"}, {}):
+        _assert_same(evaluate_outcome(calc, values), evaluate_calculator(tool, values))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_saved_and_pure_python_tables_agree(seed, tmp_path, monkeypatch, random_tool):
+    tool = random_tool(seed, CHOICES, max_rules=15, weights=(2, 3))
+    calc = _calc(tool, tmp_path, f"saved-{seed}")
+    built = precompile_outcome_table(calc)
+    loaded = load_outcome_table(calc)
+    assert [column.tolist() for column in loaded["columns"]] == [column.tolist() for column in built["columns"]]
+
+    def no_numpy(_tool, _space):
+        raise ImportError
+
+    monkeypatch.setattr(outcome_tables, "_evaluate_space_numpy", no_numpy)
+    python_table = build_outcome_table(calc)
+    assert [column.tolist() for column in python_table["columns"]] == [column.tolist() for column in built["columns"]]
+
+
+def test_memo_keeps_equal_values_of_different_types_apart(tmp_path):
+    # 1 == True == 1.0, but only the numbers satisfy a range condition.
+    tool = {
+        "inputs": [{"id": "size", "type": "number"}],
+        "rules": [{"name": "big", "message": "m", "conditions": [{"input_id": "size", "op": "gte", "value": 1}]}],
+    }
+    calc = _calc(tool, tmp_path, "memo-types")
+    for value in (1, True, 1.0, True, 1):
+        _assert_same(evaluate_outcome(calc, {"size": value}), evaluate_calculator(tool, {"size": value}))
+    assert evaluate_outcome(calc, {"size": True})["rule"] is None
+
+
+def test_table_written_after_a_miss_is_picked_up(tmp_path, random_tool):
+    tool = random_tool(3, CHOICES, max_rules=15, weights=(2, 3))
+    calc = _calc(tool, tmp_path, "late")
+    assert get_outcome_table(calc) is None
+    assert get_outcome_table(calc) is None
+    # Another process precompiles the calculator.
+    save_outcome_table(build_outcome_table(calc), calc["path"])
+    table = get_outcome_table(calc)
+    assert table is not None and get_outcome_table(calc) is table
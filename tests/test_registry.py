@@ -0,0 +1,110 @@
+import json
+import os
+import time
+
+from calculator_engine import (
+    invalidate_calculators,
+    load_calculator,
+    load_calculators,
+    set_calculators_dir,
+    sidecar_path,
+    write_calculator_sidecar,
+)
+
+# The registry reuses a calculator until its file's stamp changes. An edit
+# that keeps the mtime, even at the same size, must still be picked up, and a
+# compiled sidecar never stands in for content other than the JSON it was
+# built from.
+
+
+def _write(path, data) -> bytes:
+    raw = json.dumps(data).encode("utf-8")
+    path.write_bytes(raw)
+    return raw
+
+
+def _names():
+    return [calc["data"]["name"] for calc in load_calculators()]
+
+
+def test_edit_keeping_the_mtime_is_reloaded(calculators_dir):
+    path = calculators_dir / "a.json"
+    _write(path, {"name": "First", "rules": []})
+    mtime = path.stat().st_mtime_ns
+    assert _names() == ["First"]
+    _write(path, {"name": "Second version", "rules": []})
+    os.utime(path, ns=(mtime, mtime))
+    invalidate_calculators([str(path)])
+    assert _names() == ["Second version"]
+
+
+def _edit_keeping_mtime_and_size(path, data):
+    stat = path.stat()
+    # The ctime has clock-tick resolution.
+    time.sleep(0.05)
+    raw = _write(path, data)
+    assert len(raw) == stat.st_size
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_same_size_edit_keeping_the_mtime_is_reloaded(calculators_dir):
+    path = calculators_dir / "a.json"
+    _write(path, {"name": "One", "rules": []})
+    assert _names() == ["One"]
+    _edit_keeping_mtime_and_size(path, {"name": "Two", "rules": []})
+    invalidate_calculators([str(path)])
+    assert _names() == ["Two"]
+    # Nor may a fresh process trust the index row saved before an edit.
+    assert (calculators_dir / ".catalog_index").exists()
+    _edit_keeping_mtime_and_size(path, {"name": "Six", "rules": []})
+    set_calculators_dir(str(calculators_dir))
+    assert _names() == ["Six"]
+
+
+def test_unparseable_edit_drops_the_calculator(calculators_dir):
+    path = calculators_dir / "a.json"
+    _write(path, {"name": "First", "rules": []})
+    assert _names() == ["First"]
+    path.write_text("{not json")
+    invalidate_calculators([str(path)])
+    assert _names() == []
+
+
+def test_matching_sidecar_stands_in_for_the_json(calculators_dir):
+    path = calculators_dir / "a.json"
+    raw = _write(path, {"name": "From JSON", "rules": []})
+    # The sidecar describes these exact bytes, so it is trusted as is.
+    write_calculator_sidecar(str(path), {"name": "From sidecar", "rules": []}, raw)
+    set_calculators_dir(str(calculators_dir))
+    assert load_calculator("a")["data"]["name"] == "From sidecar"
+
+
+def test_stale_sidecar_is_ignored(calculators_dir):
+    path = calculators_dir / "a.json"
+    raw = _write(path, {"name": "Old", "rules": []})
+    write_calculator_sidecar(str(path), json.loads(raw), raw)
+    mtime = path.stat().st_mtime_ns
+    _write(path, {"name": "Edited", "rules": []})
+    os.utime(path, ns=(mtime, mtime))
+    set_calculators_dir(str(calculators_dir))
+    assert load_calculator("a")["data"]["name"] == "Edited"
+    assert _names() == ["Edited"]
+
+
+def test_sidecar_of_a_same_size_edit_is_ignored(calculators_dir):
+    path = calculators_dir / "a.json"
+    raw = _write(path, {"name": "Old", "rules": []})
+    write_calculator_sidecar(str(path), json.loads(raw), raw)
+    _edit_keeping_mtime_and_size(path, {"name": "New", "rules": []})
+    set_calculators_dir(str(calculators_dir))
+    assert load_calculator("a")["data"]["name"] == "New"
+
+
+def test_damaged_sidecar_is_ignored(calculators_dir):
+    path = calculators_dir / "a.json"
+    raw = _write(path, {"name": "From JSON", "rules": []})
+    write_calculator_sidecar(str(path), {"name": "From sidecar", "rules": []}, raw)
+    with open(sidecar_path(str(path)), "r+b") as f:
+        f.truncate(20)
+    set_calculators_dir(str(calculators_dir))
+    assert load_calculator("a")["data"]["name"] == "From JSON"
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from calculator_engine import compute_scores, evaluate_calculator, evaluate_rules, evaluate_score_recommendation
+
+# The compiled matcher (bit masks, eq/ne/range indexes) must agree with the
+# straightforward per-condition evaluation it replaced.
+
+CHOICES = {f"in{i}": ["Yes", "No", "Unknown"] for i in range(1, 6)}
+
+
+def _random_values(r, tool):
+    values = {}
+    for item in tool["inputs"]:
+        if item["type"] == "number":
+            values[item["id"]] = r.choice([r.randrange(-1, 11), r.randrange(0, 10) + 0.5, float("nan"), None, "5"])
+        else:
+            values[item["id"]] = r.choice([*item["options"], "", None])
+    return values
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_matches_reference(seed, random_tool, reference):
+    tool = random_tool(seed, CHOICES, numbers=["in0"])
+    r = random.Random(seed * 7919)
+    for _ in range(20):
+        values = _random_values(r, tool)
+        assert evaluate_rules(tool, values) is reference.rules(tool, values)
+        scores = compute_scores(tool, values)
+        assert scores == reference.scores(tool, values)
+        assert evaluate_score_recommendation(tool, values, scores[2]) == reference.recommendation(tool, values, scores[2])
+
+
+def test_tie_breaking(reference):
+    first = {"name": "first", "conditions": [{"input_id": "a", "value": "Yes"}]}
+    second = {"name": "second", "conditions": [{"input_id": "b", "value": "Yes"}]}
+    longer = {"name": "longer", "conditions": [{"input_id": "a", "value": "Yes"}, {"input_id": "b", "value": "Yes"}]}
+    partial = {
+        "name": "partial",
+        "condition_operator": "OR",
+        "conditions": [{"input_id": "a", "value": "Yes"}, {"input_id": "b", "value": "No"}, {"input_id": "c", "value": "No"}],
+    }
+    values = {"a": "Yes", "b": "Yes"}
+    # Equal matches and ratios keep the earliest rule.
+    assert evaluate_rules({"rules": [first, second]}, values) is first
+    # More matched conditions beat an earlier full match.
+    assert evaluate_rules({"rules": [first, longer]}, values) is longer
+    # With as many matched conditions, the higher ratio wins over an earlier
+    # partial OR match.
+    assert evaluate_rules({"rules": [partial, first]}, values) is first
+    assert reference.rules({"rules": [partial, first]}, values) is first
+
+
+def test_mixed_joins_and_not_equals():
+    rule = {
+        "name": "mixed",
+        "conditions": [
+            {"input_id": "a", "value": "Yes"},
+            {"input_id": "b", "op": "not_equals", "value": "No", "join_with_previous": "AND"},
+            {"input_id": "c", "value": "Yes", "join_with_previous": "OR"},
+        ],
+    }
+    tool = {"rules": [rule]}
+    assert evaluate_rules(tool, {"a": "Yes", "b": "Unknown"}) is rule
+    assert evaluate_rules(tool, {"a": "Yes", "b": "No"}) is None
+    assert evaluate_rules(tool, {"a": "No", "b": "No", "c": "Yes"}) is rule
+    assert evaluate_rules(tool, {}) is None
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_evaluate_calculator_combines_parts(seed, random_tool, reference):
+    tool = random_tool(seed, CHOICES, numbers=["in0"])
+    r = random.Random(seed)
+    for _ in range(20):
+        values = _random_values(r, tool)
+        expected = reference.evaluate(tool, values)
+        result = evaluate_calculator(tool, values)
+        assert result["rule"] is expected["rule"]
+        assert result == expected
@@ -0,0 +1,51 @@
+from session_store import restore_calculator_state, stash_calculator_state, stored_calculators, stored_size
+
+# Stashed calculator inputs are evicted least recently used first, by count and
+# by approximate size.
+
+
+def _stash(state, calc_id, text, **limits):
+    state[f"{calc_id}_note"] = text
+    stash_calculator_state(state, calc_id, [f"{calc_id}_note"], **limits)
+
+
+def test_byte_budget_evicts_least_recently_used():
+    state = {}
+    for calc_id in ("a", "b", "c"):
+        _stash(state, calc_id, "x" * 40, budget=150)
+    assert stored_calculators(state) == ["a", "b", "c"]
+    assert stored_size(state) == 3 * (len("a_note") + 40)
+    assert "a_note" not in state
+
+    # Switching back to "a" restores it; stashing it again makes it the newest.
+    assert restore_calculator_state(state, "a") == 1
+    assert state["a_note"] == "x" * 40
+    stash_calculator_state(state, "a", ["a_note"], budget=150)
+    assert stored_calculators(state) == ["b", "c", "a"]
+
+    _stash(state, "d", "x" * 40, budget=150)
+    assert stored_calculators(state) == ["c", "a", "d"]
+    assert stored_size(state) <= 150
+    # A larger entry evicts as many of the oldest as it needs.
+    _stash(state, "e", "x" * 94, budget=150)
+    assert stored_calculators(state) == ["d", "e"]
+
+
+def test_history_limit_and_oversized_entries():
+    state = {}
+    for k in range(5):
+        _stash(state, f"c{k}", "x", history=3)
+    assert stored_calculators(state) == ["c2", "c3", "c4"]
+    # An entry larger than the whole budget is not kept.
+    _stash(state, "big", "x" * 500, budget=100, history=3)
+    assert stored_calculators(state) == ["c2", "c3", "c4"]
+    assert restore_calculator_state(state, "big") == 0
+
+
+def test_restore_drops_values_the_calculator_no_longer_accepts():
+    state = {"a_choice": "Maybe", "a_size": 3.0}
+    stash_calculator_state(state, "a", ["a_choice", "a_size"])
+    restored = restore_calculator_state(state, "a", is_valid=lambda key, value: value != "Maybe")
+    assert restored == 1
+    assert state == {"a_size": 3.0, "_calculator_inputs": state["_calculator_inputs"]}
+    assert stored_calculators(state) == []
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+import image_cache
+import warm_start
+from calculator_engine import load_calculator, load_catalog, pack_calculator, set_calculators_dir
+from image_cache import read_cached_image, store_image_bytes
+
+# A snapshot written by one process seeds the next one's registry and image
+# cache without reading calculators/; a damaged snapshot is ignored.
+
+
+@pytest.fixture
+def boot(calculators_dir, tmp_path, monkeypatch):
+    images = str(tmp_path / "images")
+    monkeypatch.setattr(image_cache, "IMAGE_CACHE_DIR", images)
+    monkeypatch.setattr(warm_start, "IMAGE_CACHE_DIR", images)
+    monkeypatch.setattr(image_cache, "_SNAPSHOT", {"read": None, "names": frozenset()})
+    monkeypatch.setattr(image_cache, "_INDEX", {"loaded": False, "entries": {}})
+    revalidated = []
+    monkeypatch.setattr(warm_start, "_revalidate", lambda header, root: revalidated.append(root))
+
+    def start(path):
+        # A fresh process: empty registry and caches, warm start not yet run.
+        set_calculators_dir(str(calculators_dir))
+        monkeypatch.setattr(warm_start, "_STATE", {"booted": False, "mapping": None, "path": None})
+        monkeypatch.setattr(image_cache, "_MEMORY", image_cache._MEMORY.__class__())
+        monkeypatch.setattr(image_cache, "_MEMORY_STATE", {"bytes": 0})
+        return warm_start.warm_start(str(path))
+
+    start.revalidated = revalidated
+    return start
+
+
+def _write_calculators(root, random_tool):
+    originals = {}
+    for seed in range(6):
+        tool = random_tool(seed, {"a": ["Yes", "No"], "b": ["Low", "High"]}, numbers=["n"])
+        tool["name"] = f"Calculator {seed}"
+        rel_path = f"Cardiac/c{seed}.json" if seed % 2 else f"Thoracic/Benign/c{seed}.json"
+        path = root.joinpath(*rel_path.split("/"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(tool))
+        originals[rel_path] = tool
+    (root / "broken.json").write_text("{")
+    return originals
+
+
+def test_snapshot_round_trip(boot, calculators_dir, tmp_path, random_tool, metrics):
+    originals = _write_calculators(calculators_dir, random_tool)
+    digest = store_image_bytes(b"guideline image")
+    catalog = load_catalog()
+    snapshot = tmp_path / "warm.snapshot"
+    counts = warm_start.write_snapshot(str(snapshot))
+    assert (counts["calculators"], counts["invalid"], counts["images"]) == (6, 1, 1)
+
+    (tmp_path / "images" / digest).unlink()
+    assert boot(snapshot)
+    assert boot.revalidated == [str(calculators_dir)]
+    assert load_catalog() == catalog
+    for rel_path, tool in originals.items():
+        data = load_calculator(rel_path)["data"]
+        assert pack_calculator(data) == pack_calculator(tool)
+    assert metrics()["calculator_snapshot.hit"] == len(originals)
+    assert metrics()["warm_start.seeded"] == 7
+    assert read_cached_image(digest) == b"guideline image"
+    # Later calls in the same process are no-ops.
+    assert warm_start.warm_start(str(snapshot))
+    assert len(boot.revalidated) == 1
+
+
+def test_edited_calculator_is_read_from_disk(boot, calculators_dir, tmp_path, random_tool, metrics):
+    originals = _write_calculators(calculators_dir, random_tool)
+    snapshot = tmp_path / "warm.snapshot"
+    warm_start.write_snapshot(str(snapshot))
+    edited = {**originals["Cardiac/c1.json"], "name": "Edited after the snapshot"}
+    (calculators_dir / "Cardiac" / "c1.json").write_text(json.dumps(edited))
+    assert boot(snapshot)
+    assert load_calculator("Cardiac/c1.json")["data"]["name"] == "Edited after the snapshot"
+    assert load_calculator("Cardiac/c3.json")["data"] == originals["Cardiac/c3.json"]
+    assert metrics()["calculator_snapshot.hit"] == 1
+
+
+@pytest.mark.parametrize("keep", [0, 4, 12, 40, -1])
+def test_truncated_snapshot_is_ignored(boot, calculators_dir, tmp_path, random_tool, keep):
+    # A negative keep cuts that many bytes off the end, inside the blob area.
+    _write_calculators(calculators_dir, random_tool)
+    snapshot = tmp_path / "warm.snapshot"
+    warm_start.write_snapshot(str(snapshot))
+    with open(snapshot, "r+b") as f:
+        f.truncate(keep if keep >= 0 else snapshot.stat().st_size + keep)
+    assert not boot(snapshot)
+    assert boot.revalidated == []
+    assert {calc["name"] for calc in load_catalog()} == {f"Calculator {seed}" for seed in range(6)}
+
+
+def test_missing_or_foreign_snapshot_is_ignored(boot, tmp_path):
+    assert not boot(tmp_path / "missing.snapshot")
+    (tmp_path / "foreign.snapshot").write_bytes(b"not a snapshot at all")
+    assert not boot(tmp_path / "foreign.snapshot")
@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from calculator_engine import evaluate_calculator
+from what_if import what_if
+
+# what_if evaluates each alternative by delta; every outcome must equal a full
+# evaluation of the values with that one input changed.
+
+CHOICES = {"a": ["Yes", "No", "Unknown"], "b": ["Low", "High"], "c": ["Yes", "No", ""]}
+
+
+def _assert_same(outcome, expected):
+    assert outcome["rule"] is expected["rule"]
+    assert {key: outcome[key] for key in expected} == expected
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_alternatives_match_full_evaluation(seed, random_tool):
+    tool = random_tool(seed, CHOICES, numbers=["size"])
+    r = random.Random(seed)
+    for _ in range(5):
+        values = {input_id: r.choice(options) for input_id, options in CHOICES.items()}
+        values["size"] = float(r.randrange(-1, 11))
+        result = what_if(tool, values)
+        base = evaluate_calculator(tool, values)
+        _assert_same(result["base"], base)
+        assert {(item["input_id"], item["value"]) for item in result["alternatives"]} >= {
+            (input_id, option) for input_id, options in CHOICES.items() for option in options if option != values[input_id]
+        }
+        for outcome in result["alternatives"]:
+            expected = evaluate_calculator(tool, {**values, outcome["input_id"]: outcome["value"]})
+            _assert_same(outcome, expected)
+            assert outcome["changed"] == (expected["rule"] is not base["rule"] or expected["score_recommendation"] != base["score_recommendation"])
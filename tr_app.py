@@ -1,14 +1,46 @@
 import base64
-import json
 import os
-from urllib import request, error
+import time
+from urllib import error
 
 import streamlit as st
 
-CALCULATORS_DIR = "calculators"
-GITHUB_REPO = "ayushbalaji-dotcom/homepagev2"
-GITHUB_BRANCH = "main"
-GITHUB_CALCULATORS_DIR = "calculators"
+from background_jobs import get_job, submit_job
+from calculator_import import import_repo_files, plan_import, read_import_archive, write_import
+from calculator_engine import (
+    CALCULATORS_DIR,
+    build_decision_tree_graph,
+    catalog_writing,
+    build_label_maps,
+    discard_calculator_sidecar,
+    invalidate_calculators,
+    list_calculator_files,
+    load_calculator,
+    load_catalog,
+    write_calculator_sidecar,
+)
+from calculator_schema import compile_calculator_file, parse_calculator
+from calculator_search import search_calculators
+from catalog_watch import start_catalog_watcher
+from evaluation_log import evaluation_log_enabled, log_evaluation
+from github_sync import (
+    GITHUB_BRANCH,
+    GITHUB_CALCULATORS_DIR,
+    GITHUB_REPO,
+    api_url,
+    commit_files,
+    git_blob_sha,
+    github_request,
+    sync_calculators,
+    write_file_atomic,
+)
+from image_cache import find_local_image, get_github_image, read_local_image
+from image_variants import best_variant, schedule_variants, schedule_variants_for_file
+from outcome_tables import discard_outcome_table, evaluate_outcome
+from perf_metrics import PERF_METRICS_FILE, finish_rerun, maybe_export, span, start_rerun, timed
+from session_store import restore_calculator_state, stash_calculator_state
+from warm_start import warm_start
+from what_if import what_if
 
 CATEGORIES = {
     "Cardiac": ["Coronary", "Aortic", "Tricuspid", "Mitral", "Pulmonary", "Arrhythmia", "Miscellaneous"],
@@ -23,63 +55,17 @@ LEVELS = {
     "error": st.error,
 }
 
-
-def load_calculators():
-    calculators = []
-    if not os.path.isdir(CALCULATORS_DIR):
-        return calculators
-
-    for root, _dirs, files in os.walk(CALCULATORS_DIR):
-        for filename in sorted(files):
-            if not filename.endswith(".json"):
-                continue
-            path = os.path.join(root, filename)
-            rel_path = os.path.relpath(path, CALCULATORS_DIR)
-            parts = rel_path.split(os.sep)
-            category = parts[0] if len(parts) > 1 else "Uncategorized"
-            subcategory = parts[1] if len(parts) > 2 else ""
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            except (OSError, json.JSONDecodeError):
-                continue
-
-            name = data.get("name") or os.path.splitext(filename)[0]
-            calculators.append(
-                {
-                    "id": rel_path,
-                    "name": name,
-                    "path": path,
-                    "data": data,
-                    "category": category,
-                    "subcategory": subcategory,
-                }
-            )
-
-    return calculators
+# Larger decision trees open in the collapsed (shared-prefix) view by default.
+DECISION_TREE_COLLAPSE_RULES = 50
+# How often a page with a GitHub job in flight refreshes its progress.
+GITHUB_JOB_POLL_SECONDS = 1.0
 
 
 def get_github_token():
     return st.secrets.get("github_token") or os.environ.get("GITHUB_TOKEN")
 
 
-def github_request(method: str, url: str, token: str | None, payload: dict | None = None):
-    headers = {
-        "Accept": "application/vnd.github+json",
-        "User-Agent": "calculator-home",
-    }
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-    data = None
-    if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
-    req = request.Request(url, method=method, headers=headers, data=data)
-    with request.urlopen(req) as resp:
-        return json.loads(resp.read().decode("utf-8"))
-
-
-def save_calculator_to_github(file_bytes: bytes, filename: str, category: str, subcategory: str):
-    token = get_github_token()
+def save_calculator_to_github(job, token, file_bytes: bytes, filename: str, category: str, subcategory: str):
     if not token:
         return False, "Missing GitHub token. Add github_token to Streamlit secrets."
 
@@ -87,8 +73,9 @@ def save_calculator_to_github(file_bytes: bytes, filename: str, category: str, s
         path = f"{GITHUB_CALCULATORS_DIR}/{category}/{subcategory}/{filename}"
     else:
         path = f"{GITHUB_CALCULATORS_DIR}/{category}/{filename}"
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{path}"
+    url = api_url(f"contents/{path}")
 
+    job.report(0, 2, f"Checking {path}")
     existing_sha = None
     try:
         existing = github_request("GET", f"{url}?ref={GITHUB_BRANCH}", token)
@@ -104,7 +91,10 @@ def save_calculator_to_github(file_bytes: bytes, filename: str, category: str, s
     }
     if existing_sha:
         payload["sha"] = existing_sha
+    if job.cancelled():
+        return False, f"GitHub save of {path} was cancelled."
 
+    job.report(1, 2, f"Saving {path}")
     try:
         github_request("PUT", url, token, payload)
         return True, f"Saved to GitHub: {path}"
@@ -112,55 +102,37 @@ def save_calculator_to_github(file_bytes: bytes, filename: str, category: str, s
         return False, f"GitHub save failed: {exc}"
 
 
-def list_github_calculator_paths(token: str | None) -> list[str]:
-    def walk(dir_path: str) -> list[str]:
-        url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{dir_path}?ref={GITHUB_BRANCH}"
-        entries = github_request("GET", url, token)
-        paths: list[str] = []
-        if isinstance(entries, dict):
-            entries = [entries]
-        for entry in entries:
-            if entry.get("type") == "dir":
-                paths.extend(walk(entry.get("path", "")))
-            elif entry.get("type") == "file" and str(entry.get("name", "")).endswith(".json"):
-                paths.append(entry.get("path"))
-        return paths
-
-    return walk(GITHUB_CALCULATORS_DIR)
-
-
-def sync_calculators_from_github() -> tuple[int, str]:
-    token = get_github_token()
-    try:
-        paths = list_github_calculator_paths(token)
-    except Exception as exc:
-        return 0, f"GitHub sync failed: {exc}"
-
-    synced = 0
-    for path in paths:
-        try:
-            url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{path}?ref={GITHUB_BRANCH}"
-            content_obj = github_request("GET", url, token)
-            encoded = str(content_obj.get("content", "")).replace("\n", "")
-            if not encoded:
-                continue
-            data = base64.b64decode(encoded)
-        except Exception:
-            continue
-
-        rel_path = path
-        if rel_path.startswith(f"{GITHUB_CALCULATORS_DIR}/"):
-            rel_path = rel_path[len(f"{GITHUB_CALCULATORS_DIR}/") :]
-        local_path = os.path.join(CALCULATORS_DIR, rel_path)
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        try:
-            with open(local_path, "wb") as f:
-                f.write(data)
-            synced += 1
-        except OSError:
-            continue
-
-    return synced, f"Synced {synced} calculators from GitHub."
+def push_import_to_github(job, token, files: dict):
+    if not token:
+        return False, "Missing GitHub token. Add github_token to Streamlit secrets."
+    result = commit_files(token, files, f"Import {len(files)} calculator files", progress=job.report, cancelled=job.cancelled)
+    if result["cancelled"]:
+        return False, "GitHub push of the import was cancelled."
+    return True, f"Pushed {result['files']} files to GitHub in commit {result['commit'][:7]}."
+
+
+def sync_calculators_from_github(job, token) -> dict:
+    # Runs as a background job. Downloads land by atomic rename; the derived
+    # files are brought in line under the catalog lock so readers see each
+    # calculator change as a whole, including after a cancelled sync.
+    result = sync_calculators(token, CALCULATORS_DIR, progress=job.report, cancelled=job.cancelled)
+    invalid = []
+    with catalog_writing():
+        for path in result["changed_paths"]:
+            if not os.path.exists(path):
+                discard_outcome_table(path)
+                discard_calculator_sidecar(path)
+            elif not path.endswith(".json"):
+                schedule_variants_for_file(path)
+            else:
+                errors = compile_calculator_file(path)
+                if errors:
+                    invalid.append(f"{os.path.relpath(path, CALCULATORS_DIR)}: {errors[0]}")
+        invalidate_calculators(result["changed_paths"])
+    result["invalid"] = invalid
+    if invalid:
+        result["message"] += f" {len(invalid)} failed validation: " + "; ".join(invalid)
+    return result
 
 
 def build_raw_github_url(path: str) -> str:
@@ -168,7 +140,7 @@ def build_raw_github_url(path: str) -> str:
 
 
 def fetch_github_file(path: str, token: str):
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{path}?ref={GITHUB_BRANCH}"
+    url = api_url(f"contents/{path}?ref={GITHUB_BRANCH}")
     try:
         data = github_request("GET", url, token)
     except error.HTTPError as exc:
@@ -182,6 +154,7 @@ def fetch_github_file(path: str, token: str):
         return None, f"GitHub content decode failed: {exc}"
 
 
+@timed("image.resolve")
 def resolve_guideline_image(image_value):
     if not image_value:
         return None, None
@@ -190,15 +163,12 @@ def resolve_guideline_image(image_value):
     if isinstance(image_value, dict):
         raw_url = image_value.get("raw_url") or image_value.get("url")
         path = image_value.get("github_path") or image_value.get("path")
-        mime = image_value.get("mime")
         token = get_github_token()
         if token and path:
-            content, err = fetch_github_file(path, token)
+            content, err = get_github_image(path, token)
             if content:
-                if not mime:
-                    mime = "image/png"
-                data_url = f"data:{mime};base64,{base64.b64encode(content).decode('utf-8')}"
-                return data_url, None
+                schedule_variants(content)
+                return content, None
             if raw_url:
                 return raw_url, err
         if raw_url:
@@ -209,14 +179,7 @@ def resolve_guideline_image(image_value):
 
 
 def find_local_guideline_image(json_path: str) -> str | None:
-    if not json_path:
-        return None
-    stem = os.path.splitext(json_path)[0] + "_guideline"
-    for ext in (".jpg", ".jpeg", ".png", ".gif"):
-        candidate = f"{stem}{ext}"
-        if os.path.isfile(candidate):
-            return candidate
-    return None
+    return find_local_image(json_path)
 
 
 def render_message(level, message):
@@ -224,212 +187,23 @@ def render_message(level, message):
     handler(message)
 
 
-def evaluate_rules(tool, values):
-    def condition_match(cond):
-        input_id = cond.get("input_id")
-        expected = cond.get("value")
-        op = str(cond.get("op", "equals")).strip().lower()
-        actual = values.get(input_id)
-        if op == "not_equals":
-            return actual != expected
-        return actual == expected
-
-    def evaluate_condition_expression(rule):
-        conditions = rule.get("conditions", [])
-        if not conditions:
-            return False, 0, 0.0, 0
-
-        default_join = str(rule.get("condition_operator", "AND")).strip().upper()
-        if default_join not in {"AND", "OR"}:
-            default_join = "AND"
-
-        matched_count = 0
-        first_match = condition_match(conditions[0])
-        if first_match:
-            matched_count += 1
-        current_group = first_match
-        group_results = []
-
-        for cond in conditions[1:]:
-            cond_is_match = condition_match(cond)
-            if cond_is_match:
-                matched_count += 1
-            join = str(cond.get("join_with_previous", default_join)).strip().upper()
-            if join not in {"AND", "OR"}:
-                join = default_join
-            if join == "AND":
-                current_group = current_group and cond_is_match
-            else:
-                group_results.append(current_group)
-                current_group = cond_is_match
-
-        group_results.append(current_group)
-        is_match = any(group_results)
-        ratio = matched_count / len(conditions)
-        return is_match, matched_count, ratio, len(conditions)
-
-    best_match = None
-    best_count = 0
-    best_ratio = 0.0
-    best_total_conditions = 0
-
-    for rule in tool.get("rules", []):
-        is_match, matched, ratio, condition_count = evaluate_condition_expression(rule)
-        if not is_match:
-            continue
-        if ratio == 1.0 and best_ratio == 1.0:
-            if condition_count > best_total_conditions:
-                best_match = rule
-                best_count = matched
-                best_ratio = ratio
-                best_total_conditions = condition_count
-                continue
-        if matched > best_count or (matched == best_count and ratio > best_ratio):
-            best_match = rule
-            best_count = matched
-            best_ratio = ratio
-            best_total_conditions = condition_count
-
-    if best_match:
-        return best_match
-    return None
-
-
-def compute_scores(tool, values):
-    plus = 0
-    minus = 0
-    scoring_mode = tool.get("scoring_mode", "signed")
-    for rule in tool.get("scoring_rules", []):
-        input_id = rule.get("input_id")
-        if not input_id:
-            continue
-        value = values.get(input_id)
-        favor_values = rule.get("favor_values", [])
-        against_values = rule.get("against_values", [])
-        invert = rule.get("invert_favor", False)
-        weight = rule.get("weight", 1) or 1
-
-        score = 0
-        if value in favor_values:
-            score = -1 if invert else 1
-        elif value in against_values:
-            score = 1 if invert else -1
-
-        if score == 1:
-            plus += weight
-        elif score == -1 and scoring_mode == "signed":
-            minus += weight
-
-    total = plus - minus if scoring_mode == "signed" else plus
-    return plus, minus, total
-
-
-def evaluate_score_recommendation(tool, values, total_score):
-    thresholds = tool.get("scoring_recommendations", [])
-    if not thresholds:
-        return None
-    best = None
-    for item in thresholds:
-        try:
-            min_score = int(item.get("min_score"))
-        except (TypeError, ValueError):
-            continue
-        if total_score >= min_score:
-            conditions = item.get("conditions", [])
-            matched = 0
-            for cond in conditions:
-                input_id = cond.get("input_id")
-                expected = cond.get("value")
-                actual = values.get(input_id)
-                op = str(cond.get("op", "equals")).strip().lower()
-                if (op == "not_equals" and actual != expected) or (op != "not_equals" and actual == expected):
-                    matched += 1
-            if conditions and matched != len(conditions):
-                continue
-            ratio = matched / len(conditions) if conditions else 1.0
-            candidate = {
-                "min_score": min_score,
-                "level": item.get("level", "info"),
-                "message": item.get("message", ""),
-                "matched": matched,
-                "ratio": ratio,
-            }
-            if best is None:
-                best = candidate
-            else:
-                if min_score > best.get("min_score", -10**9):
-                    best = candidate
-                elif min_score == best.get("min_score", -10**9) and ratio > best.get("ratio", 0.0):
-                    best = candidate
-    return best
-
-
-def build_label_maps(inputs):
-    id_to_label = {}
+def calculator_widget_validators(calc_id, inputs) -> dict:
+    # Session-state keys of a calculator's widgets, each with a check that a
+    # stashed value is still valid for the widget.
+    validators = {}
     for item in inputs:
-        input_id = str(item.get("id", "")).strip()
-        label = str(item.get("label", "")).strip() or input_id
-        if input_id:
-            id_to_label[input_id] = label
-    return id_to_label
-
-
-def build_decision_tree_graph(tool, id_to_label, values=None):
-    values = values or {}
-
-    def condition_match(cond):
-        input_id = cond.get("input_id")
-        expected = cond.get("value")
-        actual = values.get(input_id)
-        op = str(cond.get("op", "equals")).strip().lower()
-        if op == "not_equals":
-            return actual != expected
-        return actual == expected
-
-    lines = [
-        "digraph DecisionTree {",
-        'rankdir=LR;',
-        'node [shape=box, style="rounded,filled", color="gray35", fillcolor="white"];',
-    ]
-    lines.append('start [label="Start", shape=oval, fillcolor="white"];')
-    for ridx, rule in enumerate(tool.get("rules", [])):
-        conditions = rule.get("conditions", [])
-        rule_node = f"rule_{ridx}"
-        rule_label = str(rule.get("name", "")).strip() or f"Rule {ridx + 1}"
-        rule_match = all(condition_match(c) for c in conditions) if conditions else False
-        rule_attrs = 'fillcolor="white"'
-        if rule_match:
-            rule_attrs = 'fillcolor="lightyellow", color="goldenrod"'
-        lines.append(f'{rule_node} [label="{rule_label}", {rule_attrs}];')
-        lines.append(f"start -> {rule_node};")
-
-        prev_node = rule_node
-        for cidx, cond in enumerate(conditions):
-            cond_node = f"rule_{ridx}_cond_{cidx}"
-            input_label = id_to_label.get(cond.get("input_id", ""), cond.get("input_id", ""))
-            value = str(cond.get("value", "")).strip()
-            op = str(cond.get("op", "equals")).strip().lower()
-            operator_label = "!=" if op == "not_equals" else "="
-            cond_label = f"{input_label} {operator_label} {value}".replace('"', "'")
-            matched = condition_match(cond)
-            cond_attrs = 'fillcolor="white"'
-            if values and matched:
-                cond_attrs = 'fillcolor="palegreen", color="green"'
-            lines.append(f'{cond_node} [label="{cond_label}", {cond_attrs}];')
-            lines.append(f"{prev_node} -> {cond_node};")
-            prev_node = cond_node
-
-        out_node = f"rule_{ridx}_out"
-        msg = str(rule.get("message", "")).strip() or "Recommendation"
-        msg = msg.replace('"', "'")
-        out_attrs = 'fillcolor="white"'
-        if rule_match:
-            out_attrs = 'fillcolor="lightblue", color="dodgerblue4"'
-        lines.append(f'{out_node} [shape=note, label="{msg}", {out_attrs}];')
-        lines.append(f"{prev_node} -> {out_node};")
-
-    lines.append("}")
-    return "\n".join(lines)
+        input_type = item.get("type", "select")
+        key = f"{calc_id}_{item.get('id')}"
+        if input_type == "select":
+            options = item.get("options", []) or [""]
+            validators[key] = lambda value, options=options: value in options
+        elif input_type == "number":
+            validators[key] = lambda value: isinstance(value, (int, float)) and not isinstance(value, bool)
+        else:
+            validators[key] = lambda value: isinstance(value, str)
+    for prefix in ("show_decision_tree_", "collapse_decision_tree_", "show_what_if_", "full_image_"):
+        validators[f"{prefix}{calc_id}"] = lambda value: isinstance(value, bool)
+    return validators
 
 
 def render_inputs(calc_id, inputs):
@@ -453,97 +227,220 @@ def render_inputs(calc_id, inputs):
     return values
 
 
-def main():
-    st.set_page_config(page_title="Calculator Home", layout="wide")
-    st.title("Calculator Home")
-    st.caption("Select a calculator and run it. Upload new JSONs to the repo to add more.")
+@st.fragment
+def render_admin_sidebar():
+    # Upload, sync and delete rerun on their own; actions that change the
+    # catalog invalidate the paths they touched and rerun the whole app. GitHub
+    # saves and syncs run as background jobs and report back through
+    # render_github_jobs.
+    st.subheader("Add Calculator")
+    category = st.selectbox("Category", list(CATEGORIES.keys()))
+    subcategory = ""
+    if CATEGORIES[category]:
+        subcategory = st.selectbox("Subcategory", CATEGORIES[category])
+    upload = st.file_uploader("Upload calculator JSON", type=["json"])
+    guideline_upload = st.file_uploader("Guideline image (optional)", type=["png", "jpg", "jpeg", "gif"])
+    overwrite = st.checkbox("Overwrite if name exists", value=False)
+    save_to_github = st.checkbox("Also save to GitHub", value=False)
+
+    # An upload stays in the widget after the rerun below; it is only stored
+    # (and saved to GitHub) once.
+    if upload is not None and upload.file_id != st.session_state.uploaded_file_id:
+        target_dir = os.path.join(CALCULATORS_DIR, category)
+        if subcategory:
+            target_dir = os.path.join(target_dir, subcategory)
+        os.makedirs(target_dir, exist_ok=True)
+        filename = os.path.basename(upload.name)
+        dest = os.path.join(target_dir, filename)
+        file_bytes = bytes(upload.getbuffer())
+        data, upload_errors = parse_calculator(file_bytes)
+        if os.path.exists(dest) and not overwrite:
+            st.warning(f"{filename} already exists. Check overwrite to replace it.")
+        elif upload_errors:
+            st.error(f"{filename} is not a valid calculator:\n\n" + "\n".join(f"- {e}" for e in upload_errors))
+        else:
+            image_bytes = None
+            with catalog_writing():
+                write_file_atomic(dest, file_bytes)
+                try:
+                    write_calculator_sidecar(dest, data, file_bytes)
+                except OSError:
+                    pass
+                if guideline_upload is not None:
+                    image_ext = os.path.splitext(guideline_upload.name)[1].lower()
+                    image_bytes = bytes(guideline_upload.getbuffer())
+                    write_file_atomic(f"{os.path.splitext(dest)[0]}_guideline{image_ext}", image_bytes)
+                invalidate_calculators([dest])
+            if image_bytes is not None:
+                schedule_variants(image_bytes)
+            st.session_state.uploaded_file_id = upload.file_id
+            st.session_state.github_message = ("success", f"Uploaded {filename}.")
+            if save_to_github:
+                remote_path = "/".join(part for part in (category, subcategory, filename) if part)
+                key = f"save:{remote_path}:{git_blob_sha(file_bytes)}"
+                submit_job(key, save_calculator_to_github, get_github_token(), file_bytes, filename, category, subcategory)
+                st.session_state.github_jobs[key] = f"Saving {filename} to GitHub"
+            st.rerun()
 
-    if "selected_calc_id" not in st.session_state:
-        st.session_state.selected_calc_id = None
-    if "sync_message" not in st.session_state:
-        st.session_state.sync_message = ""
-    if "sync_count" not in st.session_state:
-        st.session_state.sync_count = 0
+    bulk_uploads = st.file_uploader(
+        "Bulk import (zip, or several JSON and guideline images)",
+        type=["zip", "json", "png", "jpg", "jpeg", "gif"],
+        accept_multiple_files=True,
+        key="bulk_import",
+    )
+    if bulk_uploads and st.button(f"Import {len(bulk_uploads)} file{'s' if len(bulk_uploads) != 1 else ''}"):
+        import_uploaded_files(bulk_uploads, category, subcategory, overwrite, save_to_github)
+
+    if st.button("Sync from GitHub"):
+        submit_job("sync", sync_calculators_from_github, get_github_token())
+        st.session_state.github_jobs["sync"] = "Syncing from GitHub"
+    if st.session_state.github_jobs:
+        render_github_jobs()
+    if st.session_state.github_message:
+        render_message(*st.session_state.github_message)
+    if st.session_state.sync_message:
+        st.caption(st.session_state.sync_message)
 
-    with st.sidebar:
-        st.subheader("Add Calculator")
-        category = st.selectbox("Category", list(CATEGORIES.keys()))
-        subcategory = ""
-        if CATEGORIES[category]:
-            subcategory = st.selectbox("Subcategory", CATEGORIES[category])
-        upload = st.file_uploader("Upload calculator JSON", type=["json"])
-        overwrite = st.checkbox("Overwrite if name exists", value=False)
-        save_to_github = st.checkbox("Also save to GitHub", value=False)
-
-        if upload is not None:
-            target_dir = os.path.join(CALCULATORS_DIR, category)
-            if subcategory:
-                target_dir = os.path.join(target_dir, subcategory)
-            os.makedirs(target_dir, exist_ok=True)
-            filename = os.path.basename(upload.name)
-            dest = os.path.join(target_dir, filename)
-            if os.path.exists(dest) and not overwrite:
-                st.warning(f"{filename} already exists. Check overwrite to replace it.")
+    st.divider()
+    st.subheader("Delete Calculator")
+    delete_category = st.selectbox("Delete Category", list(CATEGORIES.keys()), key="delete_category")
+    delete_subcategory = ""
+    if CATEGORIES[delete_category]:
+        delete_subcategory = st.selectbox("Delete Subcategory", CATEGORIES[delete_category], key="delete_subcategory")
+    delete_dir = os.path.join(CALCULATORS_DIR, delete_category)
+    if delete_subcategory:
+        delete_dir = os.path.join(delete_dir, delete_subcategory)
+    existing_files = list_calculator_files(delete_dir)
+
+    if not existing_files:
+        st.caption("No calculators to delete.")
+    else:
+        delete_target = st.selectbox("Select calculator to delete", existing_files)
+        confirm_delete = st.checkbox("I understand this will delete the file")
+        if st.button("Delete selected"):
+            if not confirm_delete:
+                st.warning("Please confirm deletion first.")
             else:
-                file_bytes = upload.getbuffer()
-                with open(dest, "wb") as f:
-                    f.write(file_bytes)
-                st.success(f"Uploaded {filename}.")
-                if save_to_github:
-                    ok, message = save_calculator_to_github(bytes(file_bytes), filename, category, subcategory)
-                    if ok:
-                        st.success(message)
-                    else:
-                        st.warning(message)
-                st.rerun()
-
-        if st.button("Sync from GitHub"):
-            synced, message = sync_calculators_from_github()
-            st.session_state.sync_count = synced
+                try:
+                    delete_path = os.path.join(delete_dir, delete_target)
+                    with catalog_writing():
+                        os.remove(delete_path)
+                        discard_outcome_table(delete_path)
+                        discard_calculator_sidecar(delete_path)
+                        invalidate_calculators([delete_path])
+                    st.success(f"Deleted {delete_target}.")
+                    st.rerun()
+                except OSError as exc:
+                    st.error(f"Failed to delete: {exc}")
+
+
+def import_uploaded_files(uploads, category: str, subcategory: str, overwrite: bool, save_to_github: bool):
+    # One validation pass, one local batch, one registry refresh and at most
+    # one GitHub commit for the whole import; any invalid file stops it all.
+    files = []
+    for upload in uploads:
+        data = bytes(upload.getbuffer())
+        if not upload.name.lower().endswith(".zip"):
+            files.append((os.path.basename(upload.name), data))
+            continue
+        try:
+            files.extend(read_import_archive(data))
+        except ValueError as exc:
+            st.error(f"{upload.name}: {exc}")
+            return
+    target_parts = [part for part in (category, subcategory) if part]
+    plan = plan_import(files, CALCULATORS_DIR, target_parts, CATEGORIES, overwrite)
+    if plan["errors"]:
+        problems = "\n".join(f"- {message}" for message in plan["errors"][:20])
+        st.error(f"Nothing was imported; {len(plan['errors'])} problems found:\n\n{problems}")
+        return
+    if not plan["calculators"] and not plan["images"]:
+        st.warning("No calculators or guideline images to import.")
+        return
+    write_import(plan)
+    message = f"Imported {len(plan['calculators'])} calculators and {len(plan['images'])} guideline images."
+    if plan["skipped"]:
+        message += f" Skipped {len(plan['skipped'])} other files."
+    st.session_state.github_message = ("success", message)
+    if save_to_github:
+        repo_files = import_repo_files(plan)
+        digest = git_blob_sha("\n".join(f"{path} {git_blob_sha(data)}" for path, data in sorted(repo_files.items())).encode("utf-8"))
+        key = f"import:{digest}"
+        submit_job(key, push_import_to_github, get_github_token(), repo_files)
+        st.session_state.github_jobs[key] = f"Pushing {len(repo_files)} files to GitHub"
+    st.rerun()
+
+
+def github_job_outcome(job, label: str) -> tuple:
+    # (level, message) for a finished save or sync job.
+    if job.status == "failed":
+        return "error", f"{label} failed: {job.error}"
+    if isinstance(job.result, dict):
+        level = "success" if job.status == "done" and not job.result["failed"] else "warning"
+        return level, job.result["message"]
+    if isinstance(job.result, tuple):
+        ok, message = job.result
+        return ("success" if ok else "warning"), message
+    if job.status == "timed_out":
+        return "warning", f"{label} timed out."
+    return "info", f"{label} was cancelled."
+
+
+@st.fragment(run_every=GITHUB_JOB_POLL_SECONDS)
+def render_github_jobs():
+    # Polls the session's GitHub jobs while any is in flight; jobs are shared,
+    # so a sync another user started shows the same progress. Once one
+    # finishes, the whole app reruns to pick up the changed catalog and this
+    # fragment is no longer rendered.
+    finished = False
+    for key, label in list(st.session_state.github_jobs.items()):
+        job = get_job(key)
+        if job is None:
+            del st.session_state.github_jobs[key]
+            continue
+        if job.active():
+            detail = f" ({job.done}/{job.total})" if job.total else ""
+            st.progress(job.fraction(), text=f"{label}: {job.message or 'waiting'}{detail}")
+            if job.cancelled():
+                st.caption("Stopping…")
+            elif st.button("Cancel", key=f"cancel_job_{key}"):
+                job.cancel()
+            continue
+        del st.session_state.github_jobs[key]
+        finished = True
+        level, message = github_job_outcome(job, label)
+        if key == "sync":
+            result = job.result if isinstance(job.result, dict) else None
+            if result is not None:
+                st.session_state.sync_count = result["added"] + result["updated"] + result["removed"]
             st.session_state.sync_message = message
-            st.rerun()
-        if st.session_state.sync_message:
-            st.caption(st.session_state.sync_message)
-
-        st.divider()
-        st.subheader("Delete Calculator")
-        delete_category = st.selectbox("Delete Category", list(CATEGORIES.keys()), key="delete_category")
-        delete_subcategory = ""
-        if CATEGORIES[delete_category]:
-            delete_subcategory = st.selectbox("Delete Subcategory", CATEGORIES[delete_category], key="delete_subcategory")
-        delete_dir = os.path.join(CALCULATORS_DIR, delete_category)
-        if delete_subcategory:
-            delete_dir = os.path.join(delete_dir, delete_subcategory)
-        existing_files = [
-            f for f in sorted(os.listdir(delete_dir)) if f.endswith(".json")
-        ] if os.path.isdir(delete_dir) else []
-
-        if not existing_files:
-            st.caption("No calculators to delete.")
+            st.session_state.github_message = None
         else:
-            delete_target = st.selectbox("Select calculator to delete", existing_files)
-            confirm_delete = st.checkbox("I understand this will delete the file")
-            if st.button("Delete selected"):
-                if not confirm_delete:
-                    st.warning("Please confirm deletion first.")
-                else:
-                    try:
-                        os.remove(os.path.join(delete_dir, delete_target))
-                        st.success(f"Deleted {delete_target}.")
-                        st.rerun()
-                    except OSError as exc:
-                        st.error(f"Failed to delete: {exc}")
-
-    calculators = load_calculators()
+            st.session_state.github_message = (level, message)
+    if finished:
+        st.rerun()
+
+
+def select_calculator():
+    # Catalog, search and section filters; a different calculator reruns
+    # the whole app since everything below depends on it.
+    calculators = load_catalog()
     if not calculators:
         st.info("No calculators found. Add JSON files to the calculators/ folder.")
-        return
+        return None
 
-    category_choice = st.selectbox("Section", ["Cardiac", "Thoracic", "Transplant", "Uncategorized"])
-    filtered = [c for c in calculators if c["category"].lower() == category_choice.lower()]
-    if category_choice in CATEGORIES and CATEGORIES[category_choice]:
-        sub_choice = st.selectbox("Subsection", CATEGORIES[category_choice])
-        filtered = [c for c in filtered if c["subcategory"].lower() == sub_choice.lower()]
+    query = st.text_input("Search calculators", key="calculator_search").strip()
+    if query:
+        filtered = search_calculators(query)
+        if not filtered:
+            st.info(f"No calculators match \"{query}\".")
+            return None
+    else:
+        category_choice = st.selectbox("Section", ["Cardiac", "Thoracic", "Transplant", "Uncategorized"])
+        filtered = [c for c in calculators if c["category"].lower() == category_choice.lower()]
+        if category_choice in CATEGORIES and CATEGORIES[category_choice]:
+            sub_choice = st.selectbox("Subsection", CATEGORIES[category_choice])
+            filtered = [c for c in filtered if c["subcategory"].lower() == sub_choice.lower()]
 
     display_labels = []
     label_to_id = {}
@@ -555,28 +452,73 @@ def main():
 
     if not display_labels:
         st.info("No calculators found in this section.")
-        return
+        return None
     selected_label = st.selectbox("Choose a calculator", display_labels)
     selected_id = label_to_id[selected_label]
-    if st.session_state.selected_calc_id and st.session_state.selected_calc_id != selected_id:
-        old_prefix = f"{st.session_state.selected_calc_id}_"
-        for key in list(st.session_state.keys()):
-            if key.startswith(old_prefix):
-                del st.session_state[key]
+    previous_id = st.session_state.selected_calc_id
+    if previous_id and previous_id != selected_id:
+        stash_calculator_state(st.session_state, previous_id, st.session_state.get("selected_calc_keys", ()))
     st.session_state.selected_calc_id = selected_id
-    selected = next(calc for calc in filtered if calc["id"] == selected_id)
-    tool = selected["data"]
+    selected = load_calculator(selected_id)
+    if selected is None:
+        st.error(f"{selected_label} could not be loaded.")
+        return None
+    validators = calculator_widget_validators(selected_id, selected["data"].get("inputs", []))
+    if previous_id != selected_id:
+        restore_calculator_state(
+            st.session_state, selected_id, lambda key, value: key in validators and validators[key](value)
+        )
+    st.session_state.selected_calc_keys = list(validators)
+    return selected
+
+
+def render_what_if(tool, values):
+    # One row per alternative value of each input, the ones that change the
+    # recommendation first.
+    report = what_if(tool, values)
+    id_to_label = build_label_maps(tool.get("inputs", []))
+    base_total = report["base"]["total"]
+    rows = []
+    for alt in sorted(report["alternatives"], key=lambda alt: not alt["changed"]):
+        rule = alt["rule"] or {}
+        row = {
+            "Input": id_to_label.get(str(alt["input_id"]), alt["input_id"]),
+            "If changed to": str(alt["value"]),
+            "Level": rule.get("level", ""),
+            "Recommendation": rule.get("message", ""),
+        }
+        if base_total is not None:
+            row["Score"] = f"{alt['total']} ({alt['total'] - base_total:+})"
+            if tool.get("scoring_recommendations"):
+                row["Score recommendation"] = (alt["score_recommendation"] or {}).get("message", "")
+        row["Changes result"] = alt["changed"]
+        rows.append(row)
+    if not rows:
+        st.caption("No input has an alternative value to try.")
+        return
+    changed = sum(row["Changes result"] for row in rows)
+    st.caption(f"{changed} of {len(rows)} single changes give a different result.")
+    st.dataframe(rows, hide_index=True)
 
-    st.divider()
-    st.subheader(tool.get("name", "Calculator"))
-    if tool.get("description"):
-        st.write(tool["description"])
 
+@st.fragment
+def render_calculator(selected: dict):
+    # Input changes rerun only this fragment: evaluation, results and the
+    # decision tree.
+    tool = selected["data"]
     values = render_inputs(selected["id"], tool.get("inputs", []))
 
     st.divider()
     st.subheader("Results")
-    rule = evaluate_rules(tool, values)
+    started = time.perf_counter()
+    result = evaluate_outcome(selected, values)
+    # Reruns that leave the inputs unchanged (toggling the decision tree, say)
+    # are not logged again.
+    logged = (selected["id"], selected.get("hash"), values)
+    if evaluation_log_enabled() and st.session_state.get("logged_evaluation") != logged:
+        log_evaluation(selected, values, result, time.perf_counter() - started)
+        st.session_state.logged_evaluation = logged
+    rule = result["rule"]
     if rule:
         level = rule.get("level", "info")
         message = rule.get("message", "")
@@ -584,8 +526,8 @@ def main():
             render_message(level, message)
 
     if tool.get("scoring_rules"):
-        plus, minus, total = compute_scores(tool, values)
-        score_reco = evaluate_score_recommendation(tool, values, total)
+        plus, minus, total = result["plus"], result["minus"], result["total"]
+        score_reco = result["score_recommendation"]
         if score_reco:
             render_message(score_reco.get("level", "info"), score_reco.get("message", ""))
             st.write(f"**Score:** {total}")
@@ -596,22 +538,113 @@ def main():
             else:
                 st.write(f"**Score:** {total}")
 
+    if st.checkbox("What would change the result?", key=f"show_what_if_{selected['id']}"):
+        render_what_if(tool, values)
+
     if st.checkbox("Show decision tree", key=f"show_decision_tree_{selected['id']}"):
         id_to_label = build_label_maps(tool.get("inputs", []))
-        st.graphviz_chart(build_decision_tree_graph(tool, id_to_label, values))
+        collapse_key = f"collapse_decision_tree_{selected['id']}"
+        # Defaulted through session state so a restored value does not clash
+        # with a value= argument.
+        if collapse_key not in st.session_state:
+            st.session_state[collapse_key] = len(tool.get("rules", [])) > DECISION_TREE_COLLAPSE_RULES
+        collapsed = st.checkbox("Collapse shared conditions", key=collapse_key)
+        st.graphviz_chart(build_decision_tree_graph(tool, id_to_label, values, collapsed=collapsed))
+
 
+@st.fragment
+def render_guideline_image(selected: dict):
+    tool = selected["data"]
     image_to_show, image_error = resolve_guideline_image(tool.get("guideline_image"))
     if not image_to_show:
-        image_to_show = find_local_guideline_image(selected.get("path", ""))
-        if image_to_show:
+        local_image = find_local_guideline_image(selected.get("path", ""))
+        if local_image:
+            image_to_show = read_local_image(local_image)
             image_error = None
     if image_to_show:
         st.divider()
         st.subheader("Guideline Table Image")
-        st.image(image_to_show, use_container_width=True)
+        if isinstance(image_to_show, bytes):
+            st.image(best_variant(image_to_show), use_container_width=True)
+            if st.checkbox("Show full-resolution image", key=f"full_image_{selected['id']}"):
+                st.image(image_to_show, use_container_width=True)
+        else:
+            st.image(image_to_show, use_container_width=True)
     elif image_error:
         st.caption(image_error)
 
 
+def main():
+    st.set_page_config(page_title="Calculator Home", layout="wide")
+    st.title("Calculator Home")
+    st.caption("Select a calculator and run it. Upload new JSONs to the repo to add more.")
+
+    if "selected_calc_id" not in st.session_state:
+        st.session_state.selected_calc_id = None
+    if "sync_message" not in st.session_state:
+        st.session_state.sync_message = ""
+    if "sync_count" not in st.session_state:
+        st.session_state.sync_count = 0
+    if "github_jobs" not in st.session_state:
+        st.session_state.github_jobs = {}
+    if "github_message" not in st.session_state:
+        st.session_state.github_message = None
+    if "uploaded_file_id" not in st.session_state:
+        st.session_state.uploaded_file_id = None
+    if "selected_calc_keys" not in st.session_state:
+        st.session_state.selected_calc_keys = []
+    warm_start()
+    start_catalog_watcher()
+
+    with st.sidebar:
+        render_admin_sidebar()
+
+    selected = select_calculator()
+    if selected is None:
+        return
+    tool = selected["data"]
+
+    st.divider()
+    st.subheader(tool.get("name", "Calculator"))
+    if tool.get("description"):
+        st.write(tool["description"])
+
+    render_calculator(selected)
+    render_guideline_image(selected)
+
+
+def render_perf_panel(report):
+    with st.sidebar:
+        st.divider()
+        show = st.checkbox("Show performance panel", key="perf_panel")
+        if not show or report is None:
+            return
+        outside = sum(row["self"] for row in report["spans"] if row["name"] == "rerun")
+        st.caption(f"Last full rerun: {report['total'] * 1000:.1f} ms, of which {outside * 1000:.1f} ms in Streamlit and uninstrumented code")
+        st.table(
+            [
+                {"span": row["name"], "calls": row["calls"], "total ms": round(row["total"] * 1000, 2), "self ms": round(row["self"] * 1000, 2)}
+                for row in report["spans"]
+            ]
+        )
+        if report["counters"]:
+            st.table([{"event": name, "count": value} for name, value in sorted(report["counters"].items())])
+
+
+def run():
+    # The profiler panel records the rerun that renders it, so the checkbox
+    # state is read before main() runs.
+    profiling = bool(st.session_state.get("perf_panel"))
+    if profiling:
+        start_rerun()
+    try:
+        with span("rerun"):
+            main()
+    finally:
+        report = finish_rerun() if profiling else None
+        maybe_export(PERF_METRICS_FILE)
+    render_perf_panel(report)
+
+
 if __name__ == "__main__":
-    main()
+    run()
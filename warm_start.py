@@ -0,0 +1,221 @@
+import atexit
+import hashlib
+import json
+import marshal
+import mmap
+import os
+import sys
+import threading
+
+import calculator_engine
+from calculator_engine import (
+    calculator_paths,
+    catalog_reading,
+    file_stamp,
+    invalidate_calculators,
+    load_calculators,
+    load_catalog,
+    pack_calculator,
+    seed_registry,
+    unpack_calculator,
+)
+from github_sync import git_blob_sha, load_manifest, local_calculator_path, manifest_path, save_manifest, write_file_atomic
+from image_cache import IMAGE_CACHE_DIR, set_image_snapshot
+from perf_metrics import count, timed
+
+# A warm-start snapshot lets a new replica serve its first page without
+# walking and parsing calculators/ or refetching guideline images. One file
+# holds the catalog rows, each calculator's parsed data and compiled rules,
+# the GitHub sync manifest and the image cache (fetched guideline images and
+# their variants). It is memory-mapped at boot: the registry is seeded from the
+# catalog rows at once, calculators and images are unpacked from the mapping
+# only when used, and a background pass rescans the tree, so anything that
+# changed since the snapshot is picked up from disk (unchanged files are
+# recognised by content hash even when a checkout gave them new mtimes).
+WARM_START_FILE = os.environ.get("CALCULATOR_SNAPSHOT") or os.path.join(".cache", "warm_start.snapshot")
+SNAPSHOT_ON_EXIT = os.environ.get("CALCULATOR_SNAPSHOT_ON_EXIT", "").lower() in {"1", "true", "yes"}
+
+_MAGIC = b"CALCSNP2"
+_FORMAT = (marshal.version, sys.version_info[:2])
+
+_STATE_LOCK = threading.Lock()
+_STATE = {"booted": False, "mapping": None, "path": None}
+
+
+def _image_files() -> dict:
+    # Image cache files by path relative to IMAGE_CACHE_DIR: cached GitHub
+    # blobs (named by SHA-256) and every variant.
+    files = {}
+    for directory, prefix in ((IMAGE_CACHE_DIR, ""), (os.path.join(IMAGE_CACHE_DIR, "variants"), "variants/")):
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            continue
+        for name in names:
+            path = os.path.join(directory, name)
+            if (prefix or len(name) == 64) and not name.startswith(".") and os.path.isfile(path):
+                files[f"{prefix}{name}"] = path
+    return files
+
+
+def _image_index() -> dict:
+    try:
+        with open(os.path.join(IMAGE_CACHE_DIR, "index.json"), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return index if isinstance(index, dict) else {}
+
+
+@timed("warm_start.write")
+def write_snapshot(path: str = WARM_START_FILE) -> dict:
+    # Captures the current calculators directory and image cache; returns
+    # counts. Calculators are read afresh so every row's stamp and hash
+    # describe the same bytes.
+    root = calculator_engine.CALCULATORS_DIR
+    rows = []
+    blobs = []
+    offset = 0
+
+    def add_blob(payload: bytes) -> tuple[int, int]:
+        nonlocal offset
+        blobs.append(payload)
+        offset += len(payload)
+        return offset - len(payload), len(payload)
+
+    with catalog_reading():
+        records = {record["path"]: record for record in load_calculators()}
+        for calc_path in calculator_paths():
+            try:
+                stat = os.stat(calc_path)
+                with open(calc_path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                continue
+            rel_path = os.path.relpath(calc_path, root).replace(os.sep, "/")
+            record = records.get(calc_path)
+            if record is None:
+                rows.append((rel_path, *file_stamp(stat), digest, None, False, 0, 0))
+            elif record["hash"] == digest:
+                name = record["data"].get("name")
+                blob = add_blob(pack_calculator(record["data"]))
+                rows.append((rel_path, *file_stamp(stat), digest, name if isinstance(name, str) else None, True, *blob))
+    manifest = load_manifest(root) if os.path.exists(manifest_path(root)) else None
+    images = {}
+    for name, image_path in _image_files().items():
+        try:
+            with open(image_path, "rb") as f:
+                images[name] = add_blob(f.read())
+        except OSError:
+            continue
+    header = marshal.dumps(
+        {
+            "format": _FORMAT,
+            "calculators": rows,
+            "manifest": manifest,
+            "image_index": _image_index(),
+            "images": images,
+            "blob_bytes": offset,
+        }
+    )
+    write_file_atomic(path, b"".join([_MAGIC, len(header).to_bytes(4, "little"), header, *blobs]))
+    return {"calculators": sum(row[6] for row in rows), "invalid": sum(not row[6] for row in rows), "images": len(images), "bytes": offset}
+
+
+def _map_snapshot(path: str):
+    # Returns (header, view of the blob area) or None for a missing, damaged
+    # or foreign-format snapshot.
+    try:
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    view = memoryview(mapping)
+    try:
+        if bytes(view[: len(_MAGIC)]) != _MAGIC:
+            raise ValueError("not a snapshot")
+        header_end = len(_MAGIC) + 4 + int.from_bytes(view[len(_MAGIC) : len(_MAGIC) + 4], "little")
+        header = marshal.loads(view[len(_MAGIC) + 4 : header_end])
+        if not isinstance(header, dict) or header.get("format") != _FORMAT:
+            raise ValueError("snapshot from another Python")
+        # A copy cut short in the blob area would serve truncated images.
+        if len(view) - header_end != header.get("blob_bytes"):
+            raise ValueError("truncated snapshot")
+    except (EOFError, ValueError, TypeError):
+        view.release()
+        mapping.close()
+        return None
+    _STATE["mapping"] = mapping
+    return header, view[header_end:]
+
+
+def _restore_manifest(manifest: dict, root: str):
+    # Only entries whose local file still has the recorded blob SHA are kept,
+    # and the tree ETag only when all of them are, so the next sync never
+    # skips a file it should download.
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), dict) or os.path.exists(manifest_path(root)):
+        return
+    files = {}
+    for remote_path, entry in manifest["files"].items():
+        local_path = local_calculator_path(remote_path, root)
+        if local_path is None:
+            continue
+        try:
+            with open(local_path, "rb") as f:
+                sha = git_blob_sha(f.read())
+        except OSError:
+            continue
+        if sha == entry.get("sha"):
+            files[remote_path] = entry
+    etag = manifest.get("tree_etag") if len(files) == len(manifest["files"]) else None
+    try:
+        save_manifest(root, {"tree_etag": etag, "files": files})
+    except OSError:
+        pass
+
+
+def _revalidate(header: dict, root: str):
+    invalidate_calculators()
+    load_catalog()
+    if header.get("manifest") is not None:
+        _restore_manifest(header["manifest"], root)
+    count("warm_start.revalidated")
+
+
+def warm_start(path: str = WARM_START_FILE) -> bool:
+    # Call once per process before the first page; later calls are no-ops.
+    # Returns whether a snapshot was loaded.
+    with _STATE_LOCK:
+        if _STATE["booted"]:
+            return _STATE["path"] is not None
+        _STATE["booted"] = True
+        if SNAPSHOT_ON_EXIT:
+            atexit.register(_write_at_exit, path)
+        mapped = _map_snapshot(path)
+        if mapped is None:
+            return False
+        header, blobs = mapped
+        _STATE["path"] = path
+
+    def loader(start: int, length: int):
+        return lambda: unpack_calculator(blobs[start : start + length])
+
+    root = calculator_engine.CALCULATORS_DIR
+    seeded = seed_registry(
+        (os.path.join(root, *rel_path.split("/")), mtime_ns, size, ctime_ns, digest, name, valid, loader(start, length) if valid else None)
+        for rel_path, mtime_ns, size, ctime_ns, digest, name, valid, start, length in header["calculators"]
+    )
+    images = header.get("images", {})
+    set_image_snapshot(
+        lambda name: bytes(blobs[images[name][0] : images[name][0] + images[name][1]]), images, header.get("image_index", {})
+    )
+    count("warm_start.seeded", seeded)
+    threading.Thread(target=_revalidate, args=(header, root), name="warm-start", daemon=True).start()
+    return True
+
+
+def _write_at_exit(path: str):
+    try:
+        write_snapshot(path)
+    except OSError:
+        pass
@@ -0,0 +1,233 @@
+import threading
+from collections import OrderedDict
+
+from calculator_engine import (
+    RANGE_OPS,
+    compile_rules,
+    condition_op,
+    evaluate_score_recommendation,
+    match_rule_masks,
+    range_bounds,
+    range_points,
+    range_region,
+    range_samples,
+    score_value,
+)
+from perf_metrics import count, timed
+
+# "Which single finding would change the recommendation?" For the current
+# values, every alternative of every input is evaluated by delta: the rule
+# masks are matched once, and each alternative only re-matches the conditions
+# on the input it changes and re-ranks the rules that mention that input
+# against the best rule that does not. Scores work the same way, from the
+# scoring rules of the changed input alone.
+WHAT_IF_CACHE_SIZE = 64
+
+_PLANS_LOCK = threading.Lock()
+_PLANS = OrderedDict()
+
+
+def _mentioned_values(tool) -> tuple[dict, dict]:
+    # Values compared with equals / not_equals, and range bounds, per input.
+    mentioned: dict = {}
+    ranges: dict = {}
+
+    def add(input_id, value, op="equals"):
+        if op in RANGE_OPS:
+            bounds = range_bounds(op, value)
+            if bounds is not None:
+                ranges.setdefault(input_id, []).append(bounds)
+            return
+        try:
+            mentioned.setdefault(input_id, {})[value] = None
+        except TypeError:
+            pass
+
+    for rule in tool.get("rules") or []:
+        for cond in rule.get("conditions") or []:
+            add(cond.get("input_id"), cond.get("value"), condition_op(cond))
+    for rule in tool.get("scoring_rules") or []:
+        for value in [*rule.get("favor_values", []), *rule.get("against_values", [])]:
+            add(rule.get("input_id"), value)
+        for band in [*(rule.get("favor_ranges") or ()), *(rule.get("against_ranges") or ())]:
+            add(rule.get("input_id"), band.get("value"), condition_op(band))
+    for item in tool.get("scoring_recommendations") or []:
+        for cond in item.get("conditions") or []:
+            add(cond.get("input_id"), cond.get("value"), condition_op(cond))
+    return mentioned, ranges
+
+
+def _alternatives(item, mentioned, ranges) -> list:
+    # Selects offer their options; number and text inputs offer the values the
+    # rules compare them against, as the widget would return them, and number
+    # inputs one value from each piece their range thresholds cut out.
+    input_type = item.get("type", "select")
+    if input_type == "select":
+        return list(item.get("options", []) or [""])
+    candidates = mentioned.get(item.get("id"), {})
+    if input_type == "number":
+        numbers = [value for value in candidates if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        numbers += range_samples(range_points(ranges.get(item.get("id"), ())))
+        return sorted(dict.fromkeys(float(value) for value in numbers))
+    return [value for value in candidates if isinstance(value, str)]
+
+
+def _build_plan(tool, compiled) -> dict:
+    input_bits: dict = {}
+    for ridx, rule in enumerate(compiled["rules"]):
+        for cidx, cond in enumerate(rule.get("conditions") or []):
+            bits = input_bits.setdefault(cond.get("input_id"), {})
+            bits[ridx] = bits.get(ridx, 0) | (1 << cidx)
+    scan_by_input: dict = {}
+    for ridx, bit, input_id, expected, is_not_equals in compiled["scan"]:
+        scan_by_input.setdefault(input_id, []).append((ridx, bit, expected, is_not_equals))
+    scoring: dict = {}
+    for rule in tool.get("scoring_rules", []):
+        if rule.get("input_id"):
+            scoring.setdefault(rule["input_id"], []).append(rule)
+    reco_inputs = set()
+    for item in tool.get("scoring_recommendations") or []:
+        reco_inputs.update(cond.get("input_id") for cond in item.get("conditions", []) or [])
+    mentioned, ranges = _mentioned_values(tool)
+    return {
+        "compiled": compiled,
+        "input_bits": input_bits,
+        "scan": scan_by_input,
+        "scoring": scoring,
+        "reco_inputs": reco_inputs,
+        "alternatives": [(item.get("id"), _alternatives(item, mentioned, ranges)) for item in tool.get("inputs", [])],
+    }
+
+
+def _what_if_plan(tool) -> dict:
+    compiled = compile_rules(tool)
+    key = id(tool)
+    with _PLANS_LOCK:
+        cached = _PLANS.get(key)
+        if cached and cached[0] is tool and cached[1] is compiled:
+            _PLANS.move_to_end(key)
+            return cached[2]
+    count("what_if.plan_miss")
+    plan = _build_plan(tool, compiled)
+    with _PLANS_LOCK:
+        _PLANS[key] = (tool, compiled, plan)
+        _PLANS.move_to_end(key)
+        while len(_PLANS) > WHAT_IF_CACHE_SIZE:
+            _PLANS.popitem(last=False)
+    return plan
+
+
+def _rank(compiled, ridx, mask):
+    # evaluate_rules keeps the first rule with the most matched conditions,
+    # then the highest matched ratio; as a sort key that is this tuple.
+    if not any(mask & group == group for group in compiled["groups"][ridx]):
+        return None
+    matched = mask.bit_count()
+    return (matched, matched / compiled["sizes"][ridx], -ridx)
+
+
+def _input_slots(plan, input_id, value) -> dict:
+    # Bits of each rule's conditions on input_id that hold when it has value.
+    compiled = plan["compiled"]
+    slots: dict = {}
+    try:
+        eq_slots = compiled["eq"].get(input_id, {}).get(value, ())
+        ne_excluded = compiled["ne"].get(input_id, {}).get(value, ())
+    except TypeError:
+        eq_slots = ne_excluded = ()
+    for ridx, bit in eq_slots:
+        slots[ridx] = slots.get(ridx, 0) | bit
+    for ridx, bit in compiled["ne_slots"].get(input_id, ()):
+        slots[ridx] = slots.get(ridx, 0) | bit
+    for ridx, bit in ne_excluded:
+        slots[ridx] &= ~bit
+    index = compiled["ranges"].get(input_id)
+    region = range_region(index["points"], value) if index else None
+    if region is not None:
+        for ridx, bit in index["regions"][region]:
+            slots[ridx] = slots.get(ridx, 0) | bit
+    for ridx, bit, expected, is_not_equals in plan["scan"].get(input_id, ()):
+        if (value != expected) if is_not_equals else (value == expected):
+            slots[ridx] = slots.get(ridx, 0) | bit
+    return slots
+
+
+def _score_part(rules, value, signed: bool) -> tuple[int, int]:
+    plus = minus = 0
+    for rule in rules:
+        weight = rule.get("weight", 1) or 1
+        score = score_value(rule, value)
+        if score == 1:
+            plus += weight
+        elif score == -1 and signed:
+            minus += weight
+    return plus, minus
+
+
+@timed("what_if.evaluate")
+def what_if(tool, values) -> dict:
+    # Returns {"base": outcome, "alternatives": [outcome, ...]} where each
+    # alternative outcome also carries "input_id", "value" and "changed", and
+    # every outcome has the keys of evaluate_calculator's result.
+    plan = _what_if_plan(tool)
+    compiled = plan["compiled"]
+    masks = match_rule_masks(compiled, values)
+    ranked = []
+    for ridx, mask in masks.items():
+        rank = _rank(compiled, ridx, mask)
+        if rank is not None:
+            ranked.append((rank, ridx))
+    ranked.sort(reverse=True)
+    base_rule = compiled["rules"][ranked[0][1]] if ranked else None
+
+    has_scores = bool(tool.get("scoring_rules"))
+    signed = tool.get("scoring_mode", "signed") == "signed"
+    parts = {input_id: _score_part(rules, values.get(input_id), signed) for input_id, rules in plan["scoring"].items()}
+    plus = sum(part[0] for part in parts.values())
+    minus = sum(part[1] for part in parts.values())
+    base = {"rule": base_rule, "plus": None, "minus": None, "total": None, "score_recommendation": None}
+    if has_scores:
+        total = plus - minus if signed else plus
+        base.update(plus=plus, minus=minus, total=total)
+        base["score_recommendation"] = evaluate_score_recommendation(tool, values, total)
+
+    alternatives = []
+    for input_id, options in plan["alternatives"]:
+        current = values.get(input_id)
+        affected = plan["input_bits"].get(input_id, {})
+        # The best rule that does not mention this input stays a candidate for
+        # every alternative value.
+        rest = next((item for item in ranked if item[1] not in affected), None)
+        for value in options:
+            if value == current:
+                continue
+            best = rest
+            if affected:
+                slots = _input_slots(plan, input_id, value)
+                for ridx, bits in affected.items():
+                    rank = _rank(compiled, ridx, (masks.get(ridx, 0) & ~bits) | slots.get(ridx, 0))
+                    if rank is not None and (best is None or (rank, ridx) > best):
+                        best = (rank, ridx)
+            outcome = {
+                "input_id": input_id,
+                "value": value,
+                "rule": compiled["rules"][best[1]] if best else None,
+                "plus": None,
+                "minus": None,
+                "total": None,
+                "score_recommendation": None,
+            }
+            if has_scores:
+                old_part = parts.get(input_id, (0, 0))
+                new_part = _score_part(plan["scoring"].get(input_id, ()), value, signed)
+                alt_plus = plus - old_part[0] + new_part[0]
+                alt_minus = minus - old_part[1] + new_part[1]
+                alt_total = alt_plus - alt_minus if signed else alt_plus
+                outcome.update(plus=alt_plus, minus=alt_minus, total=alt_total)
+                if alt_total == base["total"] and input_id not in plan["reco_inputs"]:
+                    outcome["score_recommendation"] = base["score_recommendation"]
+                else:
+                    outcome["score_recommendation"] = evaluate_score_recommendation(tool, {**values, input_id: value}, alt_total)
+            outcome["changed"] = outcome["rule"] is not base_rule or outcome["score_recommendation"] != base["score_recommendation"]
+            alternatives.append(outcome)
+    return {"base": base, "alternatives": alternatives}